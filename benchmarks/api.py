@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Measure create and delete throughput through the challenge API, including JWT authentication.
+
+Runs fully offline by sending requests through Django's test client to the sandbox project with an in-memory
+SQLite database. Each request is signed just before it's sent, and signing time is excluded from the results.
+
+    $ python benchmarks/api.py --challenges 2000 --batch-size 100 --json api.json
+"""
+import argparse
+import json
+import time
+
+import common
+
+
+def run(client, requests, auth_header):
+    """
+    Send every ``(method, url, data, expected_status)`` request and return a list of their latencies.
+    """
+    latencies = []
+    for method, url, data, expected_status in requests:
+        kwargs = {'HTTP_AUTHORIZATION': auth_header()}
+        if data is not None:
+            kwargs['data'] = json.dumps(data)
+            kwargs['content_type'] = 'application/json'
+        start = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == expected_status, (response.status_code, response.content)
+    return latencies
+
+
+def benchmark_single(client, auth_header, challenges):
+    from django.urls import reverse
+    tokens = ['single-{}'.format(i) for i in range(challenges)]
+    create = run(client, [
+        ('post', reverse('acmechallenge-list'), {'challenge': token, 'response': token + '.response'}, 201) for token in tokens
+    ], auth_header)
+    delete = run(client, [
+        ('delete', reverse('acmechallenge-detail', args=(token, )), None, 204) for token in tokens
+    ], auth_header)
+    return [
+        dict(common.summarize(create), operation='create', batch_size=1, challenges=challenges),
+        dict(common.summarize(delete), operation='delete', batch_size=1, challenges=challenges),
+    ]
+
+
+def benchmark_bulk(client, auth_header, challenges, batch_size):
+    from django.urls import reverse
+    url = reverse('acmechallenge-bulk')
+    tokens = ['bulk-{}'.format(i) for i in range(challenges)]
+    batches = [tokens[i:i + batch_size] for i in range(0, len(tokens), batch_size)]
+    create = run(client, [
+        ('post', url, [{'challenge': token, 'response': token + '.response'} for token in batch], 201) for batch in batches
+    ], auth_header)
+    delete = run(client, [
+        ('delete', url, {'challenges': batch}, 204) for batch in batches
+    ], auth_header)
+    # Report throughput in challenges rather than requests, so it's comparable with the single results
+    return [
+        dict(common.summarize(create, operations=challenges), operation='bulk create', batch_size=batch_size, challenges=challenges),
+        dict(common.summarize(delete, operations=challenges), operation='bulk delete', batch_size=batch_size, challenges=challenges),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--challenges', type=int, default=1000, help='Number of challenges to create and delete')
+    parser.add_argument('--batch-size', type=int, default=100, help='Number of challenges per bulk request')
+    parser.add_argument('--rows', type=int, default=10000, help='Number of unrelated AcmeChallenge rows to create first')
+    common.add_output_arguments(parser)
+    args = parser.parse_args()
+
+    common.setup_django()
+    from asymmetric_jwt_auth import create_auth_header
+    from django.test import Client
+
+    common.create_challenges(args.rows)
+    private_key = common.create_api_user()
+    client = Client()
+
+    def auth_header():
+        return create_auth_header(username='certbot', key=private_key)
+
+    results = benchmark_single(client, auth_header, args.challenges)
+    results += benchmark_bulk(client, auth_header, args.challenges, args.batch_size)
+
+    if args.json != '-':
+        common.print_table(results, [
+            ('operation', 'operation', '<12'),
+            ('batch_size', 'batch size', 'd'),
+            ('operations_per_second', 'challenges/s', '.0f'),
+            ('p50_latency_us', 'p50 req (us)', '.0f'),
+            ('p99_latency_us', 'p99 req (us)', '.0f'),
+        ])
+    params = {'challenges': args.challenges, 'batch_size': args.batch_size, 'rows': args.rows}
+    common.write_results(args.json, 'api', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Every benchmark runs fully offline against the sandbox project, prints a table of results, and can write them
+as JSON with ``--json PATH`` so that runs from different versions can be compared with ``compare.py``.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'sandbox'))
+
+#: Version of the JSON document written by :func:`write_results`
+SCHEMA_VERSION = 1
+
+
+def setup_django(database=':memory:', **overrides):
+    """
+    Configure the sandbox project with the given SQLite database and run its migrations.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = database
+    # Concurrent benchmarks share a file database, so wait for locks rather than failing
+    settings.DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = 30
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['*']
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0, interactive=False)
+
+
+def create_challenges(rows, start=0, batch_size=5000):
+    """
+    Create ``rows`` AcmeChallenge rows, numbered from ``start``, and return their tokens.
+    """
+    from certbot_django.server.models import AcmeChallenge
+    tokens = []
+    for offset in range(start, start + rows, batch_size):
+        end = min(offset + batch_size, start + rows)
+        challenges = [AcmeChallenge(challenge='token-{}'.format(i), response='token-{}.response'.format(i))
+                      for i in range(offset, end)]
+        AcmeChallenge.objects.bulk_create(challenges, batch_size=500)
+        tokens.extend(c.challenge for c in challenges)
+    return tokens
+
+
+def create_api_user(username='certbot'):
+    """
+    Create a staff user allowed to add and delete challenges, and return the private key for its JWT
+    public key.
+    """
+    from asymmetric_jwt_auth import generate_key_pair
+    from asymmetric_jwt_auth.models import PublicKey
+    from django.contrib.auth.models import User, Permission
+
+    user = User.objects.create_user(username=username, is_staff=True)
+    for codename in ('add_acmechallenge', 'change_acmechallenge', 'delete_acmechallenge'):
+        user.user_permissions.add(Permission.objects.get(codename=codename))
+    private_key, public_key = generate_key_pair()
+    PublicKey.objects.create(key=public_key, comment='Benchmark Key', user=user)
+    return private_key
+
+
+def parse_counts(value):
+    """
+    Parse a comma separated list of positive integers, such as ``1,10,100``.
+    """
+    return [int(count) for count in value.split(',') if count.strip()]
+
+
+def summarize(latencies, elapsed=None, operations=None):
+    """
+    Summarize a list of per-operation latencies (in seconds). ``elapsed`` defaults to the sum of the
+    latencies and ``operations`` to the number of latencies.
+    """
+    latencies = sorted(latencies)
+    elapsed = sum(latencies) if elapsed is None else elapsed
+    operations = len(latencies) if operations is None else operations
+
+    def percentile(pct):
+        if not latencies:
+            return 0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))] * 1000000
+
+    return {
+        'operations': operations,
+        'seconds': elapsed,
+        'operations_per_second': operations / elapsed if elapsed else 0,
+        'mean_latency_us': elapsed / operations * 1000000 if operations else 0,
+        'p50_latency_us': percentile(50),
+        'p95_latency_us': percentile(95),
+        'p99_latency_us': percentile(99),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    """
+    Call ``fn`` and return a tuple of ``(seconds, result)``.
+    """
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def add_output_arguments(parser):
+    parser.add_argument('--json', metavar='PATH',
+                        help='Write results as JSON to PATH (use - for stdout)')
+
+
+def _get_version():
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution('certbot-django').version
+    except Exception:
+        return None
+
+
+def _get_git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_environment():
+    """
+    Describe the environment the benchmark ran in, so that results are only compared like for like.
+    """
+    import django
+    return {
+        'certbot_django': _get_version(),
+        'git_revision': _get_git_revision(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def print_table(results, columns):
+    """
+    Print results as a table. ``columns`` is a list of ``(key, heading, format)`` tuples.
+    """
+    widths = [max(len(heading), 12) for key, heading, fmt in columns]
+    print(' '.join(heading.rjust(width) for (key, heading, fmt), width in zip(columns, widths)))
+    for result in results:
+        print(' '.join(format(result[key], fmt).rjust(width) for (key, heading, fmt), width in zip(columns, widths)))
+
+
+def write_results(path, benchmark, params, results):
+    """
+    Write results as a JSON document to ``path``, or stdout if ``path`` is ``-``. Does nothing if ``path``
+    is empty.
+    """
+    if not path:
+        return
+    document = {
+        'schema': SCHEMA_VERSION,
+        'benchmark': benchmark,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': get_environment(),
+        'params': params,
+        'results': results,
+    }
+    if path == '-':
+        json.dump(document, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+        return
+    with open(path, 'w') as output:
+        json.dump(document, output, indent=2, sort_keys=True)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Compare two JSON result files written by the benchmarks in this directory, such as runs from two versions.
+
+Results are matched on every field which isn't a measurement, and the change in throughput is printed for
+each. Exits with status 1 if any result's throughput dropped by more than ``--threshold`` percent.
+
+    $ python benchmarks/compare.py before.json after.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+#: Fields written by ``common.summarize``, which are compared rather than matched on
+MEASUREMENTS = ('operations', 'seconds', 'operations_per_second', 'mean_latency_us',
+                'p50_latency_us', 'p95_latency_us', 'p99_latency_us', 'allocated_bytes')
+
+
+def load(path):
+    with open(path, 'r') as result_file:
+        return json.load(result_file)
+
+
+def result_key(result):
+    return tuple(sorted((name, str(value)) for name, value in result.items() if name not in MEASUREMENTS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('before', help='Baseline results')
+    parser.add_argument('after', help='Results to compare against the baseline')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='Percentage drop in throughput to treat as a regression (default: 10)')
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    if before['benchmark'] != after['benchmark']:
+        parser.error('Cannot compare {} results with {} results'.format(before['benchmark'], after['benchmark']))
+
+    baseline = {result_key(result): result for result in before['results']}
+    regressions = 0
+    for result in after['results']:
+        key = result_key(result)
+        label = ' '.join('{}={}'.format(name, value) for name, value in key)
+        if key not in baseline:
+            print('{:<70} {:>12}'.format(label, 'new'))
+            continue
+        old, new = baseline[key]['operations_per_second'], result['operations_per_second']
+        change = (new - old) / old * 100 if old else 0
+        regressed = change < -args.threshold
+        regressions += regressed
+        print('{:<70} {:>12.0f} {:>12.0f} {:>+8.1f}%{}'.format(label, old, new, change, '  REGRESSION' if regressed else ''))
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Time ``Authenticator.perform`` and ``Authenticator.cleanup`` for batches of challenges.
+
+Runs fully offline against a local stand-in: the sandbox project served by a threaded WSGI server on
+127.0.0.1. Users and keys live in a temporary SQLite database, but challenges are kept in ``MemoryStore``
+because SQLite can't handle concurrent writes from many workers. Every challenge's domain is mapped to that
+server with ``--api-url``, and every domain shares one key group, so the measurements reflect request
+handling rather than key generation.
+
+    $ python benchmarks/coordinator.py --achalls 1,10,100,500 --engine threads,async --json coordinator.json
+"""
+import argparse
+import logging
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import wsgiref.simple_server
+
+import common
+
+MODES = ('bulk', 'single')
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, wsgiref.simple_server.WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(wsgiref.simple_server.WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    from django.core.wsgi import get_wsgi_application
+    server = wsgiref.simple_server.make_server('127.0.0.1', 0, get_wsgi_application(),
+                                              server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def make_achalls(count):
+    from acme import challenges, messages
+    from certbot import achallenges
+    from certbot.tests import acme_util
+    achalls = []
+    for i in range(count):
+        token = os.urandom(32)
+        challb = acme_util.chall_to_challb(challenges.HTTP01(token=token), messages.STATUS_PENDING)
+        achalls.append(achallenges.KeyAuthorizationAnnotatedChallenge(
+            challb=challb, domain='bench-{}.example.com'.format(i), account_key=acme_util.JWK))
+    return achalls
+
+
+def make_authenticator(key_dir, api_url, engine, workers, mode):
+    from certbot_django.coordinator.authenticator import Authenticator
+    from certbot_django.coordinator.cleanup import get_parser
+    # Parse the plugin's own options, so the defaults match certbot's and new options don't need adding here
+    config = get_parser().parse_args([
+        '--username=certbot', '--key-directory={}'.format(key_dir), '--public-ip-logging-ok',
+        '--workers={}'.format(workers), '--engine={}'.format(engine),
+        '--key-group=bench=*.example.com', '--api-url=*.example.com={}'.format(api_url)])
+    config.http01_port = 0
+    config.noninteractive_mode = True
+    auth = Authenticator(config, name='django')
+    if mode == 'single':
+        # Skip the bulk endpoint, as if the server predated it
+        auth._bulk_unsupported.add(api_url)
+    return auth
+
+
+def run(key_dir, api_url, count, engine, workers, mode, repeat):
+    perform, cleanup = [], []
+    for i in range(repeat):
+        achalls = make_achalls(count)
+        auth = make_authenticator(key_dir, api_url, engine, workers, mode)
+        perform.append(common.timed(auth.perform, achalls)[0])
+        cleanup.append(common.timed(auth.cleanup, achalls)[0])
+    params = dict(achalls=count, engine=engine, workers=workers, mode=mode)
+    return [
+        dict(common.summarize(perform, operations=count * repeat), operation='perform', **params),
+        dict(common.summarize(cleanup, operations=count * repeat), operation='cleanup', **params),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--achalls', type=common.parse_counts, default=[1, 10, 100, 500],
+                        help='Comma separated numbers of challenges per run (default: 1,10,100,500)')
+    parser.add_argument('--engine', default='threads',
+                        help='Comma separated engines to benchmark: threads, async (default: threads)')
+    parser.add_argument('--mode', default='bulk,single',
+                        help='Comma separated ways to send challenges: bulk, single (default: bulk,single)')
+    parser.add_argument('--workers', type=int, default=10, help='Worker threads for the threads engine (default: 10)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times to run each combination (default: 3)')
+    common.add_output_arguments(parser)
+    args = parser.parse_args()
+
+    engines = [engine.strip() for engine in args.engine.split(',')]
+    modes = [mode.strip() for mode in args.mode.split(',')]
+    if set(modes) - set(MODES):
+        parser.error('--mode must be a list of: {}'.format(', '.join(MODES)))
+
+    logging.disable(logging.INFO)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        common.setup_django(database=os.path.join(temp_dir, 'db.sqlite3'),
+                            CERTBOT_DJANGO_STORE='certbot_django.server.stores.MemoryStore')
+        private_key = common.create_api_user()
+        key_dir = os.path.join(temp_dir, 'keys')
+        os.mkdir(key_dir)
+        with open(os.path.join(key_dir, 'certbot_django_id_rsa_group_bench'), 'w') as keyfile:
+            keyfile.write(private_key)
+
+        server = start_server()
+        api_url = 'http://127.0.0.1:{}/.well-known/challenges/'.format(server.server_address[1])
+        results = []
+        for engine in engines:
+            for mode in modes:
+                for count in args.achalls:
+                    results += run(key_dir, api_url, count, engine, args.workers, mode, args.repeat)
+        server.shutdown()
+    finally:
+        shutil.rmtree(temp_dir)
+
+    if args.json != '-':
+        common.print_table(results, [
+            ('engine', 'engine', '<8'),
+            ('mode', 'mode', '<8'),
+            ('operation', 'operation', '<8'),
+            ('achalls', 'achalls', 'd'),
+            ('mean_latency_us', 'us/achall', '.0f'),
+            ('p50_latency_us', 'p50 run (us)', '.0f'),
+        ])
+    params = {'achalls': args.achalls, 'engines': engines, 'modes': modes, 'workers': args.workers, 'repeat': args.repeat}
+    common.write_results(args.json, 'coordinator', params, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Time how long certbot takes to import the Django authenticator plugin.
+
+certbot imports every installed plugin whenever it runs, even when it doesn't use them. Each run imports the
+plugin with ``python -X importtime`` in a fresh interpreter, after the modules which certbot has already
+imported by then, and reads the plugin's cumulative import time. Requires Python 3.7 or later.
+
+    $ python benchmarks/imports.py --runs 10 --budget 50000 --json imports.json
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+import common
+
+MODULE = 'certbot_django.coordinator.authenticator'
+
+# Modules which certbot loads before it imports its plugins
+CERTBOT_MODULES = (
+    'certbot.interfaces',
+    'certbot.errors',
+    'certbot.plugins.common',
+    'certbot.display.util',
+    'zope.component',
+    'zope.interface',
+)
+
+
+def import_time(module):
+    """
+    Import ``module`` in a fresh interpreter and return its cumulative import time in seconds.
+    """
+    code = '\n'.join(['import {}'.format(name) for name in CERTBOT_MODULES + ('sys', )] + [
+        'sys.stderr.write("-- start --\\n")',
+        'sys.stderr.flush()',
+        'import {}'.format(module),
+    ])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    for line in output.split('-- start --\n', 1)[1].splitlines():
+        if line.startswith('import time:') and line.count('|') == 2:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if name.strip() == module:
+                return int(cumulative) / 1000000
+    raise RuntimeError('{} was not imported'.format(module))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='Number of times to import the plugin (default: 10)')
+    parser.add_argument('--budget', type=int, metavar='MICROSECONDS',
+                        help='Exit with status 1 if the fastest import takes longer than this')
+    common.add_output_arguments(parser)
+    args = parser.parse_args()
+    if sys.version_info < (3, 7):
+        parser.error('-X importtime requires Python 3.7 or later')
+
+    times = [import_time(MODULE) for i in range(args.runs)]
+    result = dict(common.summarize(times), module=MODULE)
+    if args.json != '-':
+        common.print_table([result], [
+            ('module', 'module', '<40'),
+            ('mean_latency_us', 'mean (us)', '.0f'),
+            ('p50_latency_us', 'p50 (us)', '.0f'),
+            ('p99_latency_us', 'p99 (us)', '.0f'),
+        ])
+    common.write_results(args.json, 'imports', {'runs': args.runs}, [result])
+    # The fastest run is checked, to allow for noisy machines
+    fastest = min(times) * 1000000
+    if args.budget is not None and fastest > args.budget:
+        print('Importing {} took {:.0f}us, over the budget of {}us'.format(MODULE, fastest, args.budget), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
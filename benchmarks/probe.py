@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Measure the per-probe cost of looking up a validation response in each challenge store, comparing the
+precomputed bodies returned by ``ChallengeStore.get_body`` against rendering the body from the response on
+every probe.
+
+Runs fully offline against an in-memory SQLite database and a local memory cache. Reports the mean latency
+and the peak memory allocated per probe, as measured by ``tracemalloc``.
+
+    $ python benchmarks/probe.py --rows 10000 --probes 20000 --json probe.json
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+import common
+
+
+def render(store, token):
+    # How the validation views built the body before stores returned it precomputed
+    return '{}\n'.format(store.get_response(token)).encode('utf-8')
+
+
+def precomputed(store, token):
+    return store.get_body(token)
+
+
+def run(fn, store, tokens):
+    latencies = []
+    start = time.perf_counter()
+    for token in tokens:
+        probe_start = time.perf_counter()
+        body = fn(store, token)
+        latencies.append(time.perf_counter() - probe_start)
+        assert body, token
+    return common.summarize(latencies, elapsed=time.perf_counter() - start)
+
+
+def measure_allocations(fn, store, tokens):
+    """
+    Return the mean peak number of bytes allocated while answering one probe.
+    """
+    total = 0
+    tracemalloc.start()
+    try:
+        for token in tokens:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn(store, token)
+            total += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return total / len(tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000, help='Number of challenges in each store (default: 10000)')
+    parser.add_argument('--probes', type=int, default=20000, help='Number of probes to time for each store')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed used to pick tokens')
+    common.add_output_arguments(parser)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    common.setup_django(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': args.rows * 2},
+    }})
+    from django.test.utils import override_settings
+    from certbot_django.server.stores import DatabaseStore, MemoryStore
+
+    tokens = common.create_challenges(args.rows)
+    memory_store = MemoryStore()
+    memory_store.create([(token, '{}.response'.format(token)) for token in tokens])
+    targets = [
+        ('database', DatabaseStore(), {}),
+        ('database+cache', DatabaseStore(), {'CERTBOT_DJANGO_CACHE': 'default'}),
+        ('memory', memory_store, {}),
+    ]
+
+    probes = [random.choice(tokens) for i in range(args.probes)]
+    results = []
+    for name, store, settings in targets:
+        with override_settings(**settings):
+            for method, fn in (('render', render), ('precomputed', precomputed)):
+                # Warm up the cache, if there is one, so that every timed probe is a hit
+                run(fn, store, tokens)
+                result = run(fn, store, probes)
+                result.update(store=name, method=method, rows=args.rows,
+                              allocated_bytes=measure_allocations(fn, store, probes[:1000]))
+                results.append(result)
+
+    if args.json != '-':
+        common.print_table(results, [
+            ('store', 'store', '<16'),
+            ('method', 'method', '<12'),
+            ('operations_per_second', 'probes/s', '.0f'),
+            ('mean_latency_us', 'mean (us)', '.2f'),
+            ('p99_latency_us', 'p99 (us)', '.2f'),
+            ('allocated_bytes', 'bytes/probe', '.0f'),
+        ])
+    common.write_results(args.json, 'probe', {'rows': args.rows, 'probes': args.probes, 'seed': args.seed}, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Compare the throughput of ACME validation requests served by the regular Django route against the
+standalone WSGI responder in ``certbot_django.server.responder``.
+
+Runs fully offline by calling the WSGI applications directly with an in-memory SQLite database. Pass several
+table sizes to see how lookups scale as the table grows.
+
+    $ python benchmarks/responder.py --rows 10000,100000,1000000 --requests 20000 --json responder.json
+"""
+import argparse
+import random
+import time
+import wsgiref.util
+
+import common
+
+
+def make_environ(token):
+    environ = {
+        'PATH_INFO': '/.well-known/acme-challenge/{}'.format(token),
+        'REQUEST_METHOD': 'GET',
+    }
+    wsgiref.util.setup_testing_defaults(environ)
+    return environ
+
+
+def run(application, tokens, requests):
+    def start_response(status, headers):
+        assert status.startswith('200'), status
+
+    environs = [make_environ(random.choice(tokens)) for i in range(requests)]
+    latencies = []
+    start = time.perf_counter()
+    for environ in environs:
+        request_start = time.perf_counter()
+        response = application(environ, start_response)
+        b''.join(response)
+        if hasattr(response, 'close'):
+            response.close()
+        latencies.append(time.perf_counter() - request_start)
+    return common.summarize(latencies, elapsed=time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=common.parse_counts, default=[10000],
+                        help='Comma separated numbers of AcmeChallenge rows to benchmark against (default: 10000)')
+    parser.add_argument('--requests', type=int, default=5000, help='Number of validation requests to send')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed used to pick tokens')
+    common.add_output_arguments(parser)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    common.setup_django()
+    from django.core.wsgi import get_wsgi_application
+    from certbot_django.server.responder import ChallengeResponderWSGI
+
+    django_app = get_wsgi_application()
+    targets = [
+        ('django route', django_app),
+        ('wsgi responder', ChallengeResponderWSGI(django_app)),
+    ]
+
+    tokens = []
+    results = []
+    for rows in sorted(args.rows):
+        # Grow the table between sizes rather than rebuilding it
+        tokens.extend(common.create_challenges(rows - len(tokens), start=len(tokens)))
+        for name, application in targets:
+            result = run(application, tokens, args.requests)
+            result.update(target=name, rows=rows)
+            results.append(result)
+
+    if args.json != '-':
+        common.print_table(results, [
+            ('target', 'target', '<16'),
+            ('rows', 'rows', 'd'),
+            ('operations_per_second', 'requests/s', '.0f'),
+            ('mean_latency_us', 'mean (us)', '.1f'),
+            ('p99_latency_us', 'p99 (us)', '.1f'),
+        ])
+    common.write_results(args.json, 'responder', {'rows': args.rows, 'requests': args.requests, 'seed': args.seed}, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -56,7 +56,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': 'db.sqlite3'
-    }
+    },
+    # Stands in for a read replica in the tests of certbot_django.server.routers
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'replica.sqlite3'
+    },
 }
 
 
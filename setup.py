@@ -14,7 +14,7 @@ packages = find_packages('src')
 install_requires = [
     'asymmetric_jwt_auth>=0.4.1',
     'Django>=1.11',
-    'djangorestframework>=3.4.7',
+    'djangorestframework>=3.8.0',
     'requests>=2.13.0'
 ]
 
@@ -24,7 +24,11 @@ extras_require = {
         'certbot>=0.9.3',
         'zope.interface',
     ],
+    'async': [
+        'aiohttp>=3.3.0',
+    ],
     'development': [
+        'aioresponses>=0.6.0',
         'flake8>=3.2.1',
         'requests-mock>=1.3.0',
         'sphinx>=1.5.2',
@@ -36,6 +40,9 @@ entry_points = {
     'certbot.plugins': [
         'auth = certbot_django.coordinator.authenticator:Authenticator',
     ],
+    'console_scripts': [
+        'certbot-django-cleanup = certbot_django.coordinator.cleanup:main',
+    ],
 }
 
 
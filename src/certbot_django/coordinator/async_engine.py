@@ -0,0 +1,139 @@
+"""
+asyncio based engine for sending challenges to Django servers.
+
+Rather than fanning requests out over a pool of threads, this engine sends every request from a single event
+loop using aiohttp. The total number of simultaneous requests is capped by ``--concurrency`` and the number of
+connections to each server by ``--pool-size``. Select it with ``--engine=async``.
+
+What to send and how to interpret the responses is shared with the threaded engine: this engine only drives
+the authenticator's request generators, sending each request with aiohttp.
+"""
+from certbot import errors
+from .authenticator import (
+    _raise_failures,
+    ConnectionFailed,
+    RequestError,
+    Response,
+    Sleep,
+)
+import aiohttp
+import asyncio
+import time
+
+
+def _describe_batch(batch):
+    return ', '.join(achall.domain for achall in batch)
+
+
+def _describe_achall(achall):
+    return achall.domain
+
+
+class AsyncEngine(object):
+    def __init__(self, authenticator):
+        self.auth = authenticator
+
+
+    def perform(self, achalls, batches, singles):
+        """
+        Send the batches and lone achalls returned by ``Authenticator._group_achalls``, then verify that every
+        achall is being served if ``--verify-propagation`` is set.
+        """
+        self._run(self._perform(achalls, batches, singles))
+
+
+    def cleanup(self, batches, singles):
+        self._run(self._cleanup(batches, singles))
+
+
+    def _run(self, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+
+    def _create_session(self):
+        connect_timeout, read_timeout = self.auth._get_timeout()
+        connector = aiohttp.TCPConnector(limit=self.auth._get_concurrency(), limit_per_host=self.auth._get_pool_size())
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+    async def _perform(self, achalls, batches, singles):
+        if not achalls:
+            return
+        async with self._create_session() as session:
+            handled = await self._gather(session, self.auth._add_challenges_to_server, batches, _describe_batch)
+            for batch, was_handled in zip(batches, handled):
+                if not was_handled:
+                    singles.extend(batch)
+            await self._gather(session, self.auth._perform_achall, singles, _describe_achall)
+            if self.auth.conf('verify-propagation'):
+                deadline = time.time() + self.auth._get_propagation_timeout()
+                await self._gather(session, lambda achall: self.auth._verify_achall(achall, deadline), achalls,
+                                   _describe_achall)
+
+
+    async def _cleanup(self, batches, singles):
+        if not batches and not singles:
+            return
+        async with self._create_session() as session:
+            handled = await self._gather(session, self.auth._remove_challenges_from_server, batches, _describe_batch)
+            for batch, was_handled in zip(batches, handled):
+                if not was_handled:
+                    singles.extend(batch)
+            await self._gather(session, self.auth._cleanup_achall, singles, _describe_achall)
+
+
+    async def _gather(self, session, fn, items, describe):
+        """
+        Drive the request generator returned by ``fn`` concurrently for every item and return the results in
+        order. PluginErrors are collected and raised together once every call has finished.
+        """
+        results = await asyncio.gather(*[self._drive(session, fn(item)) for item in items], return_exceptions=True)
+        failures = []
+        for item, result in zip(items, results):
+            if isinstance(result, errors.PluginError):
+                failures.append('{}: {}'.format(describe(item), result))
+            elif isinstance(result, BaseException):
+                raise result
+        _raise_failures(failures)
+        return results
+
+
+    async def _drive(self, session, steps):
+        """
+        Async version of ``Authenticator._drive``. Backing off only suspends this request, so every other
+        request keeps going.
+        """
+        try:
+            step = next(steps)
+            while True:
+                if isinstance(step, Sleep):
+                    await asyncio.sleep(step.seconds)
+                    step = next(steps)
+                    continue
+                try:
+                    resp = await self._request(session, step)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    step = steps.throw(ConnectionFailed(str(e) or 'timed out'))
+                except aiohttp.ClientError as e:
+                    step = steps.throw(RequestError(e))
+                else:
+                    step = steps.send(resp)
+        except StopIteration as e:
+            return e.value
+
+
+    async def _request(self, session, request):
+        headers = await self._get_headers(request.domains[0]) if request.domains else {}
+        async with session.request(request.method, request.url, headers=headers, **request.kwargs) as resp:
+            return Response(resp.status, resp.headers, await resp.text(errors='replace'))
+
+
+    async def _get_headers(self, domain):
+        # Loading keys and signing headers is blocking, so keep it off of the event loop
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.auth._get_headers, domain)
@@ -1,17 +1,78 @@
-from acme import challenges
-from asymmetric_jwt_auth import create_auth_header, generate_key_pair
+"""
+Certbot authenticator which publishes HTTP-01 challenges through a Django application's challenge API.
+
+certbot imports every installed plugin on startup, even for commands which never authenticate, so this module
+only imports what it needs to define the plugin. ``requests``, ``acme``, ``asymmetric_jwt_auth`` (and with it
+PyJWT), ``cryptography``, and ``concurrent.futures`` are imported when they're first used.
+"""
 from certbot import interfaces, errors
 from certbot.plugins import common
 from certbot.display import util as display_util
-import requests
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlsplit
+from . import journal, retry, timing
+import fnmatch
 import os.path
 import os
+import re
+import socket
+import threading
+import time
 import zope.component
 import zope.interface
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Status codes which indicate that a server predates the bulk challenge endpoint
+BULK_UNSUPPORTED_STATUSES = (404, 405)
+
+# Status codes which indicate that a server predates creating challenges with PUT. Older servers only allow
+# PUT for challenges which already exist, and only for users with the change permission, which certbot users
+# aren't given.
+UPSERT_UNSUPPORTED_STATUSES = (403, 404, 405)
+
+KEY_GROUP_NAME_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Seconds to reuse a signed Authorization header for. Servers accept headers signed up to
+# asymmetric_jwt_auth.token.TIMESTAMP_TOLERANCE (20) seconds ago, so stay well inside that to allow for clock
+# drift and slow requests.
+HEADER_MAX_AGE = 10
+
+# Seconds to wait between propagation checks. Doubles after each failed check, up to the maximum.
+PROPAGATION_INITIAL_DELAY = 0.5
+PROPAGATION_MAX_DELAY = 5
+
+ENGINE_THREADS = 'threads'
+ENGINE_ASYNC = 'async'
+ENGINES = (ENGINE_THREADS, ENGINE_ASYNC)
+
+# How to tell which challenges are sent to the same server in one bulk request
+GROUP_BY_ADDRESS = 'address'
+GROUP_BY_URL = 'url'
+GROUP_BY = (GROUP_BY_ADDRESS, GROUP_BY_URL)
+
+OPERATION_PERFORM = 'perform'
+OPERATION_CLEANUP = 'cleanup'
+
+# Steps yielded by the request generators, such as ``Authenticator._add_challenges_to_server``. The generators
+# hold everything about talking to the challenge API except the transport, which each engine supplies: it
+# sends every Request and sends the Response back in (or throws in a RequestError), and waits out every Sleep.
+# Requests without domains are sent unsigned.
+Request = namedtuple('Request', ('method', 'url', 'domains', 'kwargs'))
+Response = namedtuple('Response', ('status', 'headers', 'text'))
+Sleep = namedtuple('Sleep', ('seconds', ))
+
+
+def create_auth_header(*args, **kwargs):
+    from asymmetric_jwt_auth import create_auth_header
+    return create_auth_header(*args, **kwargs)
+
+
+def generate_key_pair(*args, **kwargs):
+    from asymmetric_jwt_auth import generate_key_pair
+    return generate_key_pair(*args, **kwargs)
+
 
 def _test_key_dir_read_write(key_dir):
     test_file_path = os.path.join(key_dir, 'certbot-test-file.txt')
@@ -49,6 +110,116 @@ def _validate_username(username):
     return username
 
 
+def _is_removed(status):
+    # A challenge which doesn't exist any more has been removed, as far as the journal is concerned
+    return status < 400 or status == 404
+
+
+def _get_validation_url(achall):
+    return 'http://{}/.well-known/acme-challenge/{}'.format(achall.domain, achall.chall.encode('token'))
+
+
+def _raise_for_status(resp, url):
+    if resp.status >= 400:
+        raise RequestError('HTTP {} for url: {}'.format(resp.status, url))
+
+
+def _raise_failures(failures):
+    """
+    Raise a single PluginError describing every message in ``failures``, if there are any.
+    """
+    if len(failures) == 1:
+        raise errors.PluginError(failures[0])
+    if failures:
+        raise errors.PluginError('Encountered errors for {} domains:\n{}'.format(len(failures), '\n'.join(failures)))
+
+
+def _parse_key_group(value):
+    """
+    Parse a key group definition in the form ``NAME=PATTERN[,PATTERN...]`` into a tuple of
+    ``(name, [patterns])``. Patterns are shell-style wildcards, such as ``*.example.com``.
+    """
+    name, sep, patterns = value.partition('=')
+    name = name.strip()
+    patterns = [pattern.strip().lower() for pattern in patterns.split(',') if pattern.strip()]
+    if not sep or not KEY_GROUP_NAME_RE.match(name) or not patterns:
+        raise errors.PluginError(
+            'Invalid key group "{}". Key groups must look like NAME=DOMAIN[,DOMAIN...], where NAME contains '
+            'only letters, numbers, dashes, and underscores.'.format(value))
+    return name, patterns
+
+
+def _read_key_groups_file(path):
+    path = os.path.expanduser(path)
+    try:
+        with open(path, 'r') as groups_file:
+            lines = groups_file.readlines()
+    except (IOError, OSError):
+        raise errors.PluginError('Could not read key groups file %s' % path)
+    return [_parse_key_group(line) for line in lines if line.strip() and not line.strip().startswith('#')]
+
+
+def _parse_api_url(value):
+    """
+    Parse an API URL mapping in the form ``PATTERN[,PATTERN...]=URL`` into a tuple of ``([patterns], url)``.
+    Patterns are shell-style wildcards, such as ``*.example.com``. ``{domain}`` in the URL is replaced with
+    the domain being validated.
+    """
+    patterns, sep, url = value.partition('=')
+    patterns = [pattern.strip().lower() for pattern in patterns.split(',') if pattern.strip()]
+    url = url.strip()
+    parts = urlsplit(url.replace('{domain}', 'example.com'))
+    if not sep or not patterns or parts.scheme not in ('http', 'https') or not parts.netloc:
+        raise errors.PluginError(
+            'Invalid API URL "{}". API URLs must look like DOMAIN[,DOMAIN...]=URL, where URL is an http:// or '
+            'https:// URL.'.format(value))
+    if not url.endswith('/'):
+        url += '/'
+    return patterns, url
+
+
+def _read_api_urls_file(path):
+    path = os.path.expanduser(path)
+    try:
+        with open(path, 'r') as urls_file:
+            lines = urls_file.readlines()
+    except (IOError, OSError):
+        raise errors.PluginError('Could not read API URLs file %s' % path)
+    return [_parse_api_url(line) for line in lines if line.strip() and not line.strip().startswith('#')]
+
+
+def _validate_positive_int(value, name):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise errors.PluginError("{} must be an integer".format(name))
+    if value < 1:
+        raise errors.PluginError("{} must be at least 1".format(name))
+    return value
+
+
+def _validate_timeout(value, name):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise errors.PluginError("{} must be a number".format(name))
+    if value <= 0:
+        raise errors.PluginError("{} must be greater than 0".format(name))
+    return value
+
+
+class RequestError(Exception):
+    """
+    A request which failed, raised in place of the HTTP library's own exceptions.
+    """
+
+
+class ConnectionFailed(RequestError):
+    """
+    A request which couldn't connect or timed out, and may be retried.
+    """
+
+
 @zope.interface.implementer(interfaces.IAuthenticator)
 @zope.interface.provider(interfaces.IPluginFactory)
 class Authenticator(common.Plugin):
@@ -66,14 +237,88 @@ class Authenticator(common.Plugin):
     )
 
 
+    def __init__(self, *args, **kwargs):
+        super(Authenticator, self).__init__(*args, **kwargs)
+        self._key_lock = threading.Lock()
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self._bulk_unsupported = set()
+        self._upsert_unsupported = set()
+        self._key_dir = None
+        self._key_groups = None
+        self._api_urls = None
+        self._private_keys = {}
+        self._headers = {}
+        self._headers_lock = threading.Lock()
+        self._timings = timing.Timings()
+        self._retry_policy = None
+        self._journal = None
+
+
     @classmethod
     def add_parser_arguments(cls, add):
         add('username',
             help='Username for authenticating with Django server.')
         add('key-directory',
             help='Directory to store generated public / private keys or to read previously generated keys from.')
+        add('key-group', action='append', metavar='NAME=DOMAIN[,DOMAIN...]',
+            help='Share one key between several domains, for example every domain served by one Django deployment. '
+                 'Domains may use shell-style wildcards, such as *.example.com. Can be given more than once.')
+        add('key-groups-file',
+            help='File containing key group definitions, one NAME=DOMAIN[,DOMAIN...] per line.')
+        add('api-url', action='append', metavar='DOMAIN[,DOMAIN...]=URL',
+            help='Send challenges for these domains to the given API URL instead of '
+                 'http://DOMAIN/.well-known/challenges/, for example an internal or HTTPS address of the Django '
+                 'server. Domains may use shell-style wildcards, and {domain} in the URL is replaced by the '
+                 'domain. Can be given more than once; the first match wins.')
+        add('api-urls-file',
+            help='File containing API URL mappings, one DOMAIN[,DOMAIN...]=URL per line.')
+        add('group-by', choices=GROUP_BY, default=GROUP_BY_URL,
+            help='How to find challenges which can be sent to the same server in one bulk request: "url" only '
+                 'groups domains with the same API URL, "address" also groups domains whose API URLs differ only '
+                 'by host name when the host names resolve to the same IP addresses. Only use "address" if each '
+                 'IP address serves a single Django deployment (default: url)')
         add('public-ip-logging-ok', action='store_true',
             help='Automatically allows public IP logging (default: Ask)')
+        add('workers', type=int, default=1,
+            help='Number of challenges to add to / remove from Django servers concurrently (default: 1)')
+        add('pool-size', type=int, default=10,
+            help='Maximum number of keep-alive connections to hold open to each Django server (default: 10)')
+        add('connect-timeout', type=float, default=10,
+            help='Seconds to wait while connecting to a Django server (default: 10)')
+        add('read-timeout', type=float, default=30,
+            help='Seconds to wait for a Django server to respond (default: 30)')
+        add('engine', choices=ENGINES, default=ENGINE_THREADS,
+            help='How to send requests to Django servers: "threads" uses a pool of --workers threads, "async" '
+                 'sends every request from one asyncio event loop and requires aiohttp (default: threads)')
+        add('concurrency', type=int, default=50,
+            help='Maximum number of requests the async engine, or propagation checks, send at once, across all '
+                 'servers (default: 50)')
+        add('verify-propagation', action='store_true',
+            help='Before asking the ACME server to validate, check that every domain is serving its challenge')
+        add('propagation-timeout', type=float, default=60,
+            help='Seconds to wait for challenges to be served before giving up (default: 60)')
+        add('propagation-consecutive', type=int, default=1,
+            help='Number of checks in a row which must see the challenge, so that every server behind a load '
+                 'balancer is likely to have it (default: 1)')
+        add('timings-file',
+            help='After perform and cleanup, write how long each phase took to this file, for example for '
+                 "node exporter's textfile collector")
+        add('timings-format', choices=timing.FORMATS,
+            help='Format of --timings-file (default: prometheus for files ending in .prom, otherwise json)')
+        add('retry-attempts', type=int, default=retry.DEFAULT_ATTEMPTS,
+            help='Maximum number of times to try each request which adds challenges (default: {})'.format(retry.DEFAULT_ATTEMPTS))
+        add('cleanup-retry-attempts', type=int, default=retry.DEFAULT_ATTEMPTS,
+            help='Maximum number of times to try each request which removes challenges (default: {})'.format(retry.DEFAULT_ATTEMPTS))
+        add('retry-backoff', type=float, default=retry.DEFAULT_BACKOFF,
+            help='Seconds to wait, at most, before the first retry. Doubles after each retry, and the actual wait is '
+                 'randomized (default: {})'.format(retry.DEFAULT_BACKOFF))
+        add('retry-statuses', default=','.join(str(status) for status in retry.DEFAULT_STATUSES),
+            help='Comma separated HTTP status codes to retry, in addition to connection errors and timeouts '
+                 '(default: {})'.format(','.join(str(status) for status in retry.DEFAULT_STATUSES)))
+        add('retry-deadline', type=float, default=retry.DEFAULT_DEADLINE,
+            help='Seconds after perform or cleanup starts to stop retrying failed requests (default: {})'.format(
+                retry.DEFAULT_DEADLINE))
 
 
     def prepare(self):
@@ -91,23 +336,213 @@ class Authenticator(common.Plugin):
         """
         Only HTTP challenges are supported currently.
         """
+        from acme import challenges
         return [challenges.HTTP01]
 
 
     def perform(self, achalls):
         self._verify_ip_logging_ok()
-        responses = []
-        for achall in achalls:
-            self._perform_achall(achall)
-            responses.append(achall.response(achall.account_key))
-        return responses
+        try:
+            with self._timings.run(OPERATION_PERFORM, len(achalls)):
+                self._retry_policy = self._get_retry_policy(OPERATION_PERFORM)
+                # Resolve every server first, so that a bad key group or API URL doesn't leave challenges
+                # in the journal which were never sent
+                batches, singles = self._group_achalls(achalls)
+                if achalls:
+                    self._drain_journal()
+                    self._journal_add(achalls)
+                    # Restart the deadline, so that a slow drain doesn't use it up
+                    self._retry_policy = self._get_retry_policy(OPERATION_PERFORM)
+                if self._get_engine() == ENGINE_ASYNC:
+                    self._get_async_engine().perform(achalls, batches, singles)
+                else:
+                    self._run_batched(batches, singles, self._add_challenges_to_server, self._perform_achall)
+                    if achalls and self.conf('verify-propagation'):
+                        self._verify_propagation(achalls)
+        finally:
+            self._report_timings(OPERATION_PERFORM)
+        return [achall.response(achall.account_key) for achall in achalls]
 
 
     def cleanup(self, achalls):
+        try:
+            with self._timings.run(OPERATION_CLEANUP, len(achalls)):
+                self._retry_policy = self._get_retry_policy(OPERATION_CLEANUP)
+                batches, singles = self._group_achalls(achalls)
+                if self._get_engine() == ENGINE_ASYNC:
+                    self._get_async_engine().cleanup(batches, singles)
+                else:
+                    self._run_batched(batches, singles, self._remove_challenges_from_server, self._cleanup_achall)
+        finally:
+            self._compact_journal()
+            self._close_sessions()
+            self._report_timings(OPERATION_CLEANUP)
+
+
+    def _report_timings(self, operation):
+        """
+        Log a summary of how long each phase took and, if ``--timings-file`` is set, export every span recorded
+        so far. Failing to write the file is only a warning, since it shouldn't stop certificates from renewing.
+        """
+        if self._timings.spans:
+            logger.info("Timings after %s:\n%s" % (operation, self._timings.format_table()))
+        path = self.conf('timings-file')
+        if not path:
+            return
+        try:
+            self._timings.write(os.path.expanduser(path), self.conf('timings-format'))
+        except (IOError, OSError) as e:
+            logger.warning("Could not write timings to %s: %s" % (path, e))
+
+
+    def _record_server_timing(self, headers, domains):
+        seconds = timing.parse_server_timing(headers.get('Server-Timing'))
+        if seconds is not None:
+            self._timings.record(timing.PHASE_SERVER, domains, seconds)
+
+
+    def _get_async_engine(self):
+        try:
+            from .async_engine import AsyncEngine
+        except ImportError:
+            raise errors.PluginError('The async engine requires aiohttp. Install it with: pip install certbot-django[async]')
+        return AsyncEngine(self)
+
+
+    def _run_batched(self, batches, singles, batch_fn, achall_fn):
+        """
+        Send each batch returned by ``_group_achalls`` to its server's bulk endpoint in a single request. Lone
+        achalls, and batches whose server doesn't support bulk requests, fall back to one request per achall.
+        """
+        handled = self._map(lambda batch: self._drive(batch_fn(batch)), batches,
+                            lambda batch: ', '.join(achall.domain for achall in batch))
+        for batch, was_handled in zip(batches, handled):
+            if not was_handled:
+                singles.extend(batch)
+
+        self._map(lambda achall: self._drive(achall_fn(achall)), singles, lambda achall: achall.domain)
+
+
+    def _group_achalls(self, achalls):
+        """
+        Split achalls into a list of batches (lists of more than one achall targeting the same server) and a
+        list of lone achalls. Also resolves any settings which might need to prompt the user, so that it's
+        safe to fan the requests out afterwards.
+        """
+        if not achalls:
+            return [], []
+
+        self._get_key_dir()
+        self._get_username()
+        self._get_key_groups()
+        self._get_api_urls()
+
+        servers = self._get_servers(achalls)
+        groups = OrderedDict()
         for achall in achalls:
-            domain = achall.domain
-            challenge = achall.chall.encode('token')
-            self._remove_challenge_from_server(domain, challenge)
+            groups.setdefault(servers[achall.domain], []).append(achall)
+
+        batches = [group for group in groups.values() if len(group) > 1]
+        singles = [group[0] for group in groups.values() if len(group) == 1]
+        return batches, singles
+
+
+    def _get_servers(self, achalls):
+        """
+        Return a dictionary which maps each achall's domain to a key identifying the server its challenges are
+        sent to. Host names are resolved in parallel.
+        """
+        domains = list(OrderedDict.fromkeys(achall.domain for achall in achalls))
+        if self._get_group_by() == GROUP_BY_URL:
+            servers = [self._get_api_url(domain) for domain in domains]
+        else:
+            servers = self._map(self._resolve_server, domains, lambda domain: domain, workers=self._get_concurrency())
+        return dict(zip(domains, servers))
+
+
+    def _resolve_server(self, domain):
+        """
+        Return a key for the server at the given domain's API URL: its scheme, port, path, and the addresses
+        its host name resolves to. Names on one certificate which are served by the same Django deployment,
+        such as example.com and www.example.com, share a key, so their challenges are sent in one bulk
+        request. Host names which can't be resolved are only grouped with the same URL.
+        """
+        url = self._get_api_url(domain)
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        try:
+            infos = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+        except (socket.error, UnicodeError):
+            return url
+        return (parts.scheme, port, parts.path, tuple(sorted(set(info[4][0] for info in infos))))
+
+
+    def _map(self, fn, items, describe, workers=None):
+        """
+        Call ``fn`` for each item, running up to ``workers`` calls at once (defaulting to the ``workers``
+        option). Results are returned in the same order as ``items``. If any call raises a PluginError, every
+        call is still allowed to finish and then a single PluginError describing all of the failed items is
+        raised.
+        """
+        if not items:
+            return []
+
+        from concurrent import futures
+        workers = min(workers or self._get_workers(), len(items))
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = [(item, executor.submit(fn, item)) for item in items]
+
+        results = []
+        failures = []
+        for item, future in pending:
+            try:
+                results.append(future.result())
+            except errors.PluginError as e:
+                failures.append('{}: {}'.format(describe(item), e))
+
+        _raise_failures(failures)
+        return results
+
+
+    def _verify_propagation(self, achalls):
+        """
+        Poll every domain's public challenge URL in parallel until it serves the expected response, so that
+        the ACME server doesn't validate against a server which can't see the challenge yet.
+        """
+        deadline = time.time() + self._get_propagation_timeout()
+        self._map(lambda achall: self._drive(self._verify_achall(achall, deadline)), achalls,
+                  lambda achall: achall.domain, workers=self._get_concurrency())
+
+
+    def _verify_achall(self, achall, deadline):
+        with self._timings.span(timing.PHASE_PROPAGATION, achall.domain):
+            yield from self._wait_for_achall(achall, deadline)
+
+
+    def _wait_for_achall(self, achall, deadline):
+        url = _get_validation_url(achall)
+        expected = achall.validation(achall.account_key)
+        required = self._get_propagation_consecutive()
+        successes = 0
+        delay = PROPAGATION_INITIAL_DELAY
+        while True:
+            try:
+                resp = yield Request('GET', url, None, {})
+                served = resp.status == 200 and resp.text.strip() == expected
+            except RequestError:
+                served = False
+
+            successes = successes + 1 if served else 0
+            if successes >= required:
+                logger.info("Verified ACMEChallenge is being served: %s" % url)
+                return
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise errors.PluginError('Challenge was not served at {} before the propagation timeout'.format(url))
+            if not served:
+                yield Sleep(min(delay, remaining))
+                delay = min(delay * 2, PROPAGATION_MAX_DELAY)
 
 
     def _verify_ip_logging_ok(self):
@@ -129,47 +564,406 @@ class Authenticator(common.Plugin):
         domain = achall.domain
         challenge = achall.chall.encode('token')
         response = achall.validation(achall.account_key)
-        self._add_challenge_to_server(domain, challenge, response)
+        yield from self._add_challenge_to_server(domain, challenge, response)
+
+
+    def _cleanup_achall(self, achall):
+        domain = achall.domain
+        challenge = achall.chall.encode('token')
+        yield from self._remove_challenge_from_server(domain, challenge)
+
+
+    def _add_challenges_to_server(self, achalls):
+        """
+        Add every achall in the batch to the server with one request. Returns False if the server doesn't
+        support bulk requests, so that the caller can fall back to adding the challenges one at a time.
+        """
+        url = self._get_api_url(achalls[0].domain)
+        if url in self._bulk_unsupported:
+            return False
+        data = [{
+            'challenge': achall.chall.encode('token'),
+            'response': achall.validation(achall.account_key),
+            'domain': achall.domain,
+        } for achall in achalls]
+        try:
+            logger.info("Attempting to add %s ACMEChallenges to server: %s" % (len(data), url))
+            domains = [achall.domain for achall in achalls]
+            with self._timings.span(timing.PHASE_POST, domains):
+                resp = yield from self._upsert(url, url + 'bulk/', url + 'bulk/', domains, data)
+            self._record_server_timing(resp.headers, domains)
+            if self._is_bulk_unsupported(url, resp):
+                return False
+            _raise_for_status(resp, url)
+            logger.info("Successfully added %s ACMEChallenges to server: %s" % (len(data), url))
+        except RequestError as e:
+            raise errors.PluginError('Encountered error when adding challenges to Django server: {}'.format(e))
+        return True
+
+
+    def _remove_challenges_from_server(self, achalls):
+        """
+        Remove every achall in the batch from the server with one request. Returns False if the server
+        doesn't support bulk requests, so that the caller can fall back to removing the challenges one at
+        a time.
+        """
+        url = self._get_api_url(achalls[0].domain)
+        if url in self._bulk_unsupported:
+            return False
+        data = {
+            'challenges': [achall.chall.encode('token') for achall in achalls],
+        }
+        try:
+            logger.info("Attempting to remove %s ACMEChallenges from server: %s" % (len(achalls), url))
+            domains = [achall.domain for achall in achalls]
+            with self._timings.span(timing.PHASE_DELETE, domains):
+                resp = yield from self._send('DELETE', url + 'bulk/', domains, json=data)
+            self._record_server_timing(resp.headers, domains)
+            if self._is_bulk_unsupported(url, resp):
+                return False
+            if _is_removed(resp.status):
+                self._journal_remove([(self._get_api_url(achall.domain), achall.chall.encode('token')) for achall in achalls])
+            logger.info("Successfully removed %s ACMEChallenges from server: %s" % (len(achalls), url))
+        except RequestError:
+            logger.warning("Encountered error while removing ACMEChallenges from server: %s" % url)
+        return True
 
 
     def _add_challenge_to_server(self, domain, challenge, response):
-        url = 'http://{}/.well-known/challenges/'.format(domain)
-        headers = self._get_headers(domain)
+        url = self._get_api_url(domain)
         data = {
             'challenge': challenge,
             'response': response,
+            'domain': domain,
         }
         try:
             logger.info("Attempting to add ACMEChallenge to server: %s" % challenge)
-            resp = requests.post(url, headers=headers, data=data)
-            resp.raise_for_status()
+            with self._timings.span(timing.PHASE_POST, domain):
+                resp = yield from self._upsert(url, '{}{}/'.format(url, challenge), url, [domain], data, form=True)
+            self._record_server_timing(resp.headers, domain)
+            _raise_for_status(resp, url)
             logger.info("Successfully added ACMEChallenge to server: %s" % challenge)
-        except requests.RequestException as e:
+        except RequestError as e:
             raise errors.PluginError('Encountered error when adding challenge to Django server: {}'.format(e))
 
 
     def _remove_challenge_from_server(self, domain, challenge):
-        url = 'http://{}/.well-known/challenges/{}/'.format(domain, challenge)
-        headers = self._get_headers(domain)
+        api_url = self._get_api_url(domain)
+        url = '{}{}/'.format(api_url, challenge)
         try:
             logger.info("Attempting to remove ACMEChallenge from server: %s" % challenge)
-            requests.delete(url, headers=headers)
+            with self._timings.span(timing.PHASE_DELETE, domain):
+                resp = yield from self._send('DELETE', url, [domain])
+            self._record_server_timing(resp.headers, domain)
+            if _is_removed(resp.status):
+                self._journal_remove([(api_url, challenge)])
             logger.info("Successfully removed ACMEChallenge from server: %s" % challenge)
-        except requests.RequestException:
+        except RequestError:
             logger.warning("Encountered error while removing ACMEChallenge from server: %s" % challenge)
 
 
+    def _get_journal(self):
+        if self._journal is None:
+            self._journal = journal.Journal(os.path.join(self._get_key_dir(), journal.JOURNAL_FILENAME))
+        return self._journal
+
+
+    def _journal_add(self, achalls):
+        """
+        Record achalls in the journal before they're sent, so that they can be removed later even if this run
+        never reaches ``cleanup``. Failing to write the journal is only a warning.
+        """
+        entries = [(self._get_api_url(achall.domain), achall.domain, achall.chall.encode('token')) for achall in achalls]
+        try:
+            self._get_journal().add(entries)
+        except (IOError, OSError) as e:
+            logger.warning("Could not write to ACMEChallenge journal: %s" % e)
+
+
+    def _journal_remove(self, entries):
+        try:
+            self._get_journal().remove(entries)
+        except (IOError, OSError) as e:
+            logger.warning("Could not write to ACMEChallenge journal: %s" % e)
+
+
+    def _compact_journal(self):
+        if self._journal is None:
+            return
+        try:
+            self._journal.compact()
+        except (IOError, OSError) as e:
+            logger.warning("Could not compact ACMEChallenge journal: %s" % e)
+
+
+    def _drain_journal(self):
+        """
+        Remove challenges which an earlier run published but never removed, for example because it crashed
+        before ``cleanup``. Challenges are removed in bulk, one request per server, with servers handled in
+        parallel, and retried like any other cleanup. Returns the number of challenges which are still pending
+        afterwards.
+        """
+        try:
+            entries = self._get_journal().pending()
+        except (IOError, OSError) as e:
+            logger.warning("Could not read ACMEChallenge journal: %s" % e)
+            return 0
+        if entries:
+            logger.info("Removing %s ACMEChallenges left behind by an earlier run" % len(entries))
+            groups = OrderedDict()
+            for entry in entries:
+                groups.setdefault(entry.url, []).append(entry)
+            previous, self._retry_policy = self._retry_policy, self._get_retry_policy(OPERATION_CLEANUP)
+            try:
+                self._map(lambda group: self._drive(self._remove_journal_entries(group)), list(groups.values()),
+                          lambda group: group[0].url, workers=self._get_concurrency())
+            except errors.PluginError as e:
+                logger.warning("Could not remove every ACMEChallenge left behind by an earlier run: %s" % e)
+            finally:
+                self._retry_policy = previous
+        self._compact_journal()
+        try:
+            return len(self._get_journal().pending())
+        except (IOError, OSError):
+            return len(entries)
+
+
+    def _remove_journal_entries(self, entries):
+        """
+        Remove journal entries which all belong to the same server, falling back to one request per challenge
+        if the server doesn't support bulk requests. Errors are logged and leave the entries in the journal.
+        """
+        url = entries[0].url
+        domains = [entry.domain for entry in entries]
+        try:
+            if len(entries) > 1 and url not in self._bulk_unsupported:
+                resp = yield from self._send('DELETE', url + 'bulk/', domains, json={
+                    'challenges': [entry.challenge for entry in entries],
+                })
+                if not self._is_bulk_unsupported(url, resp):
+                    if _is_removed(resp.status):
+                        self._journal_remove([(url, entry.challenge) for entry in entries])
+                    return
+            for entry in entries:
+                resp = yield from self._send('DELETE', '{}{}/'.format(url, entry.challenge), [entry.domain])
+                if _is_removed(resp.status):
+                    self._journal_remove([(url, entry.challenge)])
+        except RequestError:
+            logger.warning("Encountered error while removing ACMEChallenges left behind on server: %s" % url)
+
+
+    def _upsert(self, api_url, put_url, post_url, domains, data, form=False):
+        """
+        Create or replace challenges with a PUT to ``put_url``, so that retries and leftovers from a failed
+        cleanup don't conflict with existing challenges. Servers which predate upserts get a POST to
+        ``post_url`` instead, and are remembered so that later requests skip straight to POST.
+        """
+        if api_url not in self._upsert_unsupported:
+            resp = yield from self._send('PUT', put_url, domains, json=data)
+            if resp.status not in UPSERT_UNSUPPORTED_STATUSES:
+                return resp
+            logger.info("Server does not support upserting ACMEChallenges: %s" % api_url)
+            self._upsert_unsupported.add(api_url)
+        if form:
+            return (yield from self._send('POST', post_url, domains, data=data))
+        return (yield from self._send('POST', post_url, domains, json=data))
+
+
+    def _is_bulk_unsupported(self, url, resp):
+        """
+        Return True if the response shows that the server doesn't support bulk requests, and remember the
+        server so that later batches skip straight to one request per challenge.
+        """
+        if resp.status not in BULK_UNSUPPORTED_STATUSES:
+            return False
+        logger.info("Server does not support bulk ACMEChallenge requests: %s" % url)
+        self._bulk_unsupported.add(url)
+        return True
+
+
+    def _send(self, method, url, domains, **kwargs):
+        """
+        Send a request, signed with the key for the first of ``domains``, retrying connection errors, timeouts,
+        and retryable status codes as the current retry policy allows. Returns the last response, or raises
+        the last error. Waiting between attempts only holds up the calling worker (or, with the async engine,
+        the calling task), so requests to other servers carry on meanwhile.
+        """
+        policy = self._get_retry_policy()
+        attempt = 1
+        while True:
+            resp, error = None, None
+            try:
+                resp = yield Request(method, url, domains, kwargs)
+            except ConnectionFailed as e:
+                error = e
+            if resp is not None and not policy.is_retryable(resp.status):
+                return resp
+
+            delay = policy.get_delay(attempt, resp.headers.get('Retry-After') if resp is not None else None)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return resp
+            logger.info("Retrying %s %s in %.2f seconds after: %s" % (
+                method, url, delay, error or 'HTTP {}'.format(resp.status)))
+            self._timings.record(timing.PHASE_RETRY, domains, delay)
+            yield Sleep(delay)
+            attempt += 1
+
+
+    def _drive(self, steps):
+        """
+        Run one of the request generators to completion, sending its requests with requests, and return its
+        result.
+        """
+        import requests
+        try:
+            step = next(steps)
+            while True:
+                if isinstance(step, Sleep):
+                    time.sleep(step.seconds)
+                    step = next(steps)
+                    continue
+                try:
+                    resp = self._request(step)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    step = steps.throw(ConnectionFailed(e))
+                except requests.RequestException as e:
+                    step = steps.throw(RequestError(e))
+                else:
+                    step = steps.send(resp)
+        except StopIteration as e:
+            return e.value
+
+
+    def _request(self, request):
+        headers = self._get_headers(request.domains[0]) if request.domains else {}
+        session = self._get_session(request.url)
+        resp = session.request(request.method, request.url, headers=headers, timeout=self._get_timeout(), **request.kwargs)
+        return Response(resp.status_code, resp.headers, resp.text)
+
+
+    def _get_api_url(self, domain):
+        """
+        Return the base URL of the challenge API for the given domain: the URL of the first ``--api-url``
+        mapping which matches it, or ``http://DOMAIN/.well-known/challenges/``.
+        """
+        lower = domain.lower()
+        for patterns, url in self._get_api_urls():
+            if any(fnmatch.fnmatchcase(lower, pattern) for pattern in patterns):
+                return url.replace('{domain}', domain)
+        return 'http://{}/.well-known/challenges/'.format(domain)
+
+
+    def _get_api_urls(self):
+        if self._api_urls is None:
+            api_urls = [_parse_api_url(value) for value in (self.conf('api-url') or [])]
+            urls_file = self.conf('api-urls-file')
+            if urls_file:
+                api_urls.extend(_read_api_urls_file(urls_file))
+            self._api_urls = api_urls
+        return self._api_urls
+
+
+    def _get_session(self, url):
+        """
+        Return the keep-alive session used to talk to the server at the given URL. Sessions are shared by
+        every challenge which targets the same scheme, host, and port, so perform and cleanup reuse
+        already-open connections rather than opening a new one per challenge.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc.lower())
+        with self._sessions_lock:
+            session = self._sessions.get(key)
+            if session is None:
+                import requests.adapters
+                pool_size = self._get_pool_size()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[key] = session
+        return session
+
+
+    def _close_sessions(self):
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for session in sessions:
+            session.close()
+
+
     def _get_headers(self, domain):
+        """
+        Return the Authorization headers for requests to the given domain. Signed headers are reused for
+        HEADER_MAX_AGE seconds, so that a batch of requests to servers sharing a key costs a single signature.
+        """
+        key_file = self._get_private_key_file(domain)
+        now = time.time()
+        with self._headers_lock:
+            cached = self._headers.get(key_file)
+            if cached and cached[0] > now:
+                return cached[1]
+
         private_key = self._get_private_key(domain)
-        headers = {
-            'Authorization': create_auth_header(username=self._get_username(), key=private_key)
-        }
+        with self._timings.span(timing.PHASE_SIGN, domain):
+            headers = {
+                'Authorization': create_auth_header(username=self._get_username(), key=private_key)
+            }
+        with self._headers_lock:
+            self._headers[key_file] = (now + HEADER_MAX_AGE, headers)
         return headers
 
 
     def _get_private_key(self, domain):
-        filename = 'certbot_django_id_rsa_{}'.format(domain).replace('.', '')
-        private_key_file = os.path.join(self._get_key_dir(), filename)
+        """
+        Return the parsed private key for the given domain, loading (or generating) it on first use.
+        """
+        # Generating a key prompts the user, so only let one worker thread read or create a key at a time.
+        with self._key_lock:
+            key_file = self._get_private_key_file(domain)
+            if key_file not in self._private_keys:
+                from cryptography.hazmat.backends import default_backend
+                from cryptography.hazmat.primitives import serialization
+                with self._timings.span(timing.PHASE_KEY_LOAD, domain):
+                    pem = self._load_or_create_private_key(domain, key_file)
+                    self._private_keys[key_file] = serialization.load_pem_private_key(
+                        pem.encode('utf-8'), password=None, backend=default_backend())
+            return self._private_keys[key_file]
+
+
+    def _get_private_key_file(self, domain):
+        group = self._get_key_group(domain)
+        if group:
+            filename = 'certbot_django_id_rsa_group_{}'.format(group)
+        else:
+            filename = 'certbot_django_id_rsa_{}'.format(domain).replace('.', '')
+        return os.path.join(self._get_key_dir(), filename)
+
+
+    def _get_key_group(self, domain):
+        """
+        Return the name of the first key group which matches the given domain, or None.
+        """
+        domain = domain.lower()
+        for name, patterns in self._get_key_groups():
+            if any(fnmatch.fnmatchcase(domain, pattern) for pattern in patterns):
+                return name
+        return None
+
+
+    def _get_key_groups(self):
+        if self._key_groups is None:
+            groups = [_parse_key_group(value) for value in (self.conf('key-group') or [])]
+            groups_file = self.conf('key-groups-file')
+            if groups_file:
+                groups.extend(_read_key_groups_file(groups_file))
+            self._key_groups = groups
+        return self._key_groups
+
+
+    def _load_or_create_private_key(self, domain, private_key_file):
         private_key = None
 
         try:
@@ -211,7 +1005,72 @@ class Authenticator(common.Plugin):
 
 
     def _get_key_dir(self):
-        return self._get_config('key-directory', 'key storage directory', _validate_key_dir)
+        # Validating the directory writes a test file, so only do it once per run
+        if self._key_dir is None:
+            self._key_dir = self._get_config('key-directory', 'key storage directory', _validate_key_dir)
+        return self._key_dir
+
+
+    def _get_workers(self):
+        return _validate_positive_int(self.conf('workers') or 1, 'Worker count')
+
+
+    def _get_engine(self):
+        engine = self.conf('engine') or ENGINE_THREADS
+        if engine not in ENGINES:
+            raise errors.PluginError('Engine must be one of: {}'.format(', '.join(ENGINES)))
+        return engine
+
+
+    def _get_group_by(self):
+        group_by = self.conf('group-by') or GROUP_BY_URL
+        if group_by not in GROUP_BY:
+            raise errors.PluginError('Group by must be one of: {}'.format(', '.join(GROUP_BY)))
+        return group_by
+
+
+    def _get_concurrency(self):
+        return _validate_positive_int(self.conf('concurrency') or 50, 'Concurrency')
+
+
+    def _get_propagation_timeout(self):
+        return _validate_timeout(self.conf('propagation-timeout') or 60, 'Propagation timeout')
+
+
+    def _get_propagation_consecutive(self):
+        return _validate_positive_int(self.conf('propagation-consecutive') or 1, 'Propagation consecutive checks')
+
+
+    def _get_retry_policy(self, operation=None):
+        """
+        Return the retry policy for the current operation. Passing an operation starts a new policy, whose
+        deadline counts from now.
+        """
+        if operation is None and self._retry_policy is not None:
+            return self._retry_policy
+        option = 'cleanup-retry-attempts' if operation == OPERATION_CLEANUP else 'retry-attempts'
+        try:
+            statuses = retry.parse_statuses(self.conf('retry-statuses') or retry.DEFAULT_STATUSES)
+        except ValueError:
+            raise errors.PluginError('Retry statuses must be a comma separated list of HTTP status codes')
+        backoff = _validate_timeout(self.conf('retry-backoff') or retry.DEFAULT_BACKOFF, 'Retry backoff')
+        deadline = _validate_timeout(self.conf('retry-deadline') or retry.DEFAULT_DEADLINE, 'Retry deadline')
+        return retry.RetryPolicy(
+            attempts=_validate_positive_int(self.conf(option) or retry.DEFAULT_ATTEMPTS, 'Retry attempts'),
+            backoff=backoff,
+            statuses=statuses,
+            deadline=time.time() + deadline)
+
+
+    def _get_pool_size(self):
+        return _validate_positive_int(self.conf('pool-size') or 10, 'Pool size')
+
+
+    def _get_timeout(self):
+        return (
+            _validate_timeout(self.conf('connect-timeout') or 10, 'Connect timeout'),
+            _validate_timeout(self.conf('read-timeout') or 30, 'Read timeout'),
+        )
 
 
     def _get_config(self, option, name, validation_fn):
@@ -0,0 +1,54 @@
+"""
+Remove challenges which certbot runs published to Django servers but never removed.
+
+The Django authenticator journals every challenge it publishes (see :mod:`certbot_django.coordinator.journal`)
+and removes leftovers at the start of its next run. This command does the same without running certbot, for
+example from a cron job after a crashed renewal. It accepts the same options as the authenticator, without
+the ``--certbot-django:auth-`` prefix.
+
+    $ certbot-django-cleanup --key-directory ~/.ssh/certbot/ --username certbot
+"""
+import argparse
+import logging
+import sys
+
+
+def get_parser():
+    from .authenticator import Authenticator
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+
+    def add(name, **kwargs):
+        parser.add_argument('--{}'.format(name), dest='django_{}'.format(name.replace('-', '_')), **kwargs)
+
+    Authenticator.add_parser_arguments(add)
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log every request')
+    return parser
+
+
+def main(argv=None):
+    from certbot import errors
+    from .authenticator import Authenticator
+
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if not args.django_key_directory or not args.django_username:
+        parser.error('--key-directory and --username are required')
+    args.noninteractive_mode = True
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(message)s')
+
+    auth = Authenticator(args, name='django')
+    try:
+        remaining = auth._drain_journal()
+    except errors.PluginError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        auth._close_sessions()
+    if remaining:
+        print('{} ACME challenges could not be removed. They will be retried on the next run.'.format(remaining), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Write-ahead journal of challenges published by the Django authenticator.
+
+Before any challenge is sent to a Django server, it's appended to a journal file in the key directory, and once
+it has been removed it's marked as such. If certbot crashes or is killed between ``perform`` and ``cleanup``, or
+a DELETE fails, the challenges left behind are still in the journal. The next run removes them before
+publishing new ones, as does the ``certbot-django-cleanup`` command.
+
+Each line of the journal is a compact JSON list: ``["+", api_url, domain, token, pid, timestamp]`` for a
+published challenge and ``["-", api_url, token]`` for a removed one. A line cut short by a crash is ignored.
+
+Servers expire challenges after ``CERTBOT_DJANGO_CHALLENGE_TTL`` seconds (a day by default), so entries older
+than :data:`MAX_AGE` are dropped rather than retried forever, for example once a server has been
+decommissioned. Entries written before timestamps were recorded are stamped when the journal is compacted.
+"""
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+JOURNAL_FILENAME = 'certbot_django_journal'
+
+#: Seconds after which a pending entry is dropped. Matches the server's default challenge TTL.
+MAX_AGE = 60 * 60 * 24
+
+ADDED = '+'
+REMOVED = '-'
+
+Entry = namedtuple('Entry', ('url', 'domain', 'challenge', 'pid', 'added'))
+
+
+def _is_running(pid):
+    """
+    Return True if ``pid`` belongs to another process which is still running, such as a concurrent certbot run
+    whose challenges mustn't be removed yet.
+    """
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except (OSError, TypeError, ValueError):
+        return False
+    return True
+
+
+class Journal(object):
+    def __init__(self, path, max_age=MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+
+    @contextmanager
+    def _open(self):
+        """
+        Open the journal for reading and appending while holding an exclusive lock on it, so that several
+        certbot processes sharing a key directory don't interleave writes or lose them during compaction.
+        """
+        with self._lock:
+            while True:
+                journal = open(self.path, 'a+')
+                if fcntl is not None:
+                    fcntl.flock(journal, fcntl.LOCK_EX)
+                try:
+                    current = os.path.samestat(os.fstat(journal.fileno()), os.stat(self.path))
+                except OSError:
+                    current = False
+                if current:
+                    break
+                # Another process compacted the journal while we waited for the lock, so reopen the new file
+                journal.close()
+            try:
+                yield journal
+            finally:
+                journal.close()
+
+
+    def _append(self, records):
+        if not records:
+            return
+        lines = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+        with self._open() as journal:
+            journal.write(lines)
+            journal.flush()
+            os.fsync(journal.fileno())
+
+
+    def add(self, entries):
+        """
+        Record ``(url, domain, challenge)`` tuples as published by this process.
+        """
+        pid, now = os.getpid(), int(time.time())
+        self._append([[ADDED, url, domain, challenge, pid, now] for url, domain, challenge in entries])
+
+
+    def remove(self, entries):
+        """
+        Record ``(url, challenge)`` tuples as removed.
+        """
+        self._append([[REMOVED, url, challenge] for url, challenge in entries])
+
+
+    def _read(self, journal):
+        journal.seek(0)
+        pending = OrderedDict()
+        for line in journal:
+            try:
+                record = json.loads(line)
+                if record[0] == ADDED:
+                    added = record[5] if len(record) > 5 else None
+                    pending[(record[1], record[3])] = Entry(
+                        url=record[1], domain=record[2], challenge=record[3], pid=record[4], added=added)
+                elif record[0] == REMOVED:
+                    pending.pop((record[1], record[2]), None)
+            except (ValueError, IndexError, TypeError, KeyError):
+                continue
+        cutoff = time.time() - self.max_age
+        return [entry for entry in pending.values() if entry.added is None or entry.added > cutoff]
+
+
+    def pending(self, include_running=False):
+        """
+        Return the entries which were published but never removed. Entries published by other processes which
+        are still running are left out, unless ``include_running`` is True.
+        """
+        if not os.path.exists(self.path):
+            return []
+        with self._open() as journal:
+            entries = self._read(journal)
+        if include_running:
+            return entries
+        return [entry for entry in entries if not _is_running(entry.pid)]
+
+
+    def compact(self):
+        """
+        Rewrite the journal so that it only contains pending entries, or delete it if there are none. The file
+        is replaced atomically, so a crash part way through never loses entries.
+        """
+        if not os.path.exists(self.path):
+            return
+        with self._open() as journal:
+            entries = self._read(journal)
+            if not entries:
+                os.unlink(self.path)
+                return
+            temp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+            now = int(time.time())
+            with open(temp_path, 'w') as temp:
+                for entry in entries:
+                    added = now if entry.added is None else entry.added
+                    temp.write(json.dumps([ADDED, entry.url, entry.domain, entry.challenge, entry.pid, added], separators=(',', ':')) + '\n')
+                temp.flush()
+                os.fsync(temp.fileno())
+            os.replace(temp_path, self.path)
@@ -0,0 +1,71 @@
+"""
+Retry policies for requests from the Django authenticator to Django servers.
+
+Requests which fail to connect, time out, or get a retryable status code (by default 429, 502, 503, and 504,
+as returned by load balancers during a deploy) are retried with exponential backoff and full jitter. Retries
+stop once a request has been attempted ``attempts`` times, or when waiting any longer would pass the
+operation's deadline. Each request retries independently, so one slow server doesn't hold up the others.
+"""
+import random
+import time
+
+
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_DEADLINE = 120
+DEFAULT_STATUSES = (429, 502, 503, 504)
+
+#: Longest time to wait between two attempts, in seconds, including any ``Retry-After`` requested by a server
+MAX_DELAY = 10
+
+
+def parse_statuses(value):
+    """
+    Parse a comma separated list of HTTP status codes, such as ``"502,503"``, into a tuple of ints.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(int(status) for status in value)
+    return tuple(int(status) for status in value.split(',') if status.strip())
+
+
+def _parse_retry_after(value):
+    # Only the delay-seconds form is supported. HTTP dates are ignored in favour of the normal backoff.
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy(object):
+    """
+    Decide whether, and how long to wait before, retrying a failed request.
+    """
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, backoff=DEFAULT_BACKOFF, statuses=DEFAULT_STATUSES,
+                 deadline=None, max_delay=MAX_DELAY):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.statuses = frozenset(statuses)
+        self.deadline = deadline
+        self.max_delay = max_delay
+
+
+    def is_retryable(self, status):
+        return status in self.statuses
+
+
+    def get_delay(self, attempt, retry_after=None):
+        """
+        Return the seconds to wait after the given (1-based) failed attempt before trying again, or None if the
+        request shouldn't be retried. The delay is picked at random from zero up to ``backoff`` doubled after
+        each attempt, so that many requests failing at once don't all retry at once. A ``Retry-After`` header
+        from the server is used instead when there is one.
+        """
+        if attempt >= self.attempts:
+            return None
+        delay = _parse_retry_after(retry_after)
+        if delay is None:
+            delay = random.uniform(0, self.backoff * 2 ** (attempt - 1))
+        delay = min(delay, self.max_delay)
+        if self.deadline is not None and time.time() + delay > self.deadline:
+            return None
+        return delay
@@ -0,0 +1,199 @@
+from asymmetric_jwt_auth import generate_key_pair
+from certbot import errors
+from .test_authenticator import _fake_getaddrinfo, _make_achall, _make_config
+import tempfile
+import re
+import unittest
+import mock
+import shutil
+import os.path
+
+try:
+    from aioresponses import aioresponses
+    from yarl import URL
+    import aiohttp
+except ImportError:
+    aioresponses = None
+
+
+@unittest.skipIf(aioresponses is None, 'aiohttp and aioresponses are not installed')
+class AsyncEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.config = _make_config(
+            django_username='certbot', django_key_directory=self.temp_dir,
+            django_public_ip_logging_ok=True, django_engine='async')
+
+        self.addresses = {}
+        patcher = mock.patch('socket.getaddrinfo', side_effect=_fake_getaddrinfo(self.addresses))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        from certbot_django.coordinator.authenticator import Authenticator
+        self.auth = Authenticator(self.config, name='django')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+
+    def _write_key(self, domain):
+        priv, pub = generate_key_pair()
+        keypath = os.path.join(self.temp_dir, 'certbot_django_id_rsa_{}'.format(domain).replace('.', ''))
+        with open(keypath, 'w') as keyfile:
+            keyfile.write(priv)
+
+
+    def _calls(self, m):
+        return sorted((method, str(url)) for (method, url), calls in m.requests.items() for call in calls)
+
+
+    def test_perform_and_cleanup(self):
+        domains = ['a.example.com', 'b.example.com', 'c.example.com']
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+        for domain in domains:
+            self._write_key(domain)
+
+        with aioresponses() as m:
+            for domain, achall in zip(domains, achalls):
+                m.put('http://{}/.well-known/challenges/{}/'.format(domain, achall.chall.encode('token')), status=200, payload={})
+                m.delete('http://{}/.well-known/challenges/{}/'.format(domain, achall.chall.encode('token')), status=204)
+            actual = self.auth.perform(achalls)
+            self.assertEqual(actual, [achall.response(achall.account_key) for achall in achalls])
+            self.auth.cleanup(achalls)
+            self.assertEqual([method for method, url in self._calls(m)], ['DELETE'] * 3 + ['PUT'] * 3)
+
+
+    def test_perform_bulk(self):
+        self.config.django_group_by = 'address'
+        self._write_key('example.com')
+        domains = ['example.com', 'www.example.com']
+        self.addresses.update({domain: '203.0.113.5' for domain in domains})
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+
+        with aioresponses() as m:
+            m.put('http://example.com/.well-known/challenges/bulk/', status=200, payload=[])
+            m.delete('http://example.com/.well-known/challenges/bulk/', status=204)
+            self.auth.perform(achalls)
+            self.auth.cleanup(achalls)
+            self.assertEqual(self._calls(m), [
+                ('DELETE', 'http://example.com/.well-known/challenges/bulk/'),
+                ('PUT', 'http://example.com/.well-known/challenges/bulk/'),
+            ])
+
+
+    def test_timings(self):
+        self._write_key('example.com')
+        achalls = [_make_achall('example.com', token) for token in (b'a' * 32, b'b' * 32)]
+
+        with aioresponses() as m:
+            m.put('http://example.com/.well-known/challenges/bulk/', status=200, payload=[],
+                  headers={'Server-Timing': 'app;dur=4'})
+            m.delete('http://example.com/.well-known/challenges/bulk/', status=204)
+            self.auth.perform(achalls)
+            self.auth.cleanup(achalls)
+
+        summaries = self.auth._timings.summarize()
+        self.assertEqual([(s['operation'], s['phase'], s['count']) for s in summaries], [
+            ('perform', 'key_load', 1),
+            ('perform', 'sign', 1),
+            ('perform', 'post', 1),
+            ('perform', 'server', 1),
+            ('cleanup', 'delete', 1),
+        ])
+        self.assertEqual(summaries[2]['slowest'], ['example.com', 'example.com'])
+        self.assertEqual(summaries[3]['total_seconds'], 0.004)
+
+
+    def test_perform_bulk_unsupported(self):
+        self._write_key('example.com')
+        achalls = [_make_achall('example.com', token) for token in (b'a' * 32, b'b' * 32)]
+
+        with aioresponses() as m:
+            m.put('http://example.com/.well-known/challenges/bulk/', status=405)
+            m.post('http://example.com/.well-known/challenges/bulk/', status=405)
+            m.post('http://example.com/.well-known/challenges/', status=201, payload={}, repeat=True)
+            self.auth.perform(achalls)
+            self.assertEqual([method for method, url in self._calls(m)], ['POST'] * 3 + ['PUT'])
+            self.assertTrue('http://example.com/.well-known/challenges/' in self.auth._bulk_unsupported)
+            self.assertTrue('http://example.com/.well-known/challenges/' in self.auth._upsert_unsupported)
+
+
+    def test_perform_upsert_unsupported(self):
+        self._write_key('example.com')
+        achall = _make_achall('example.com', b'a' * 32)
+
+        with aioresponses() as m:
+            m.put('http://example.com/.well-known/challenges/{}/'.format(achall.chall.encode('token')), status=404)
+            m.post('http://example.com/.well-known/challenges/', status=201, payload={})
+            self.auth.perform([achall])
+            self.assertEqual([method for method, url in self._calls(m)], ['POST', 'PUT'])
+
+
+    def test_perform_errors(self):
+        domains = ['a.example.com', 'b.example.com', 'c.example.com']
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+        for domain in domains:
+            self._write_key(domain)
+
+        with aioresponses() as m:
+            for domain, status in zip(domains, (500, 200, 403)):
+                m.put(re.compile(r'^http://{}/\.well-known/challenges/'.format(re.escape(domain))), status=status, payload={})
+            with self.assertRaises(errors.PluginError) as cm:
+                self.auth.perform(achalls)
+
+        message = str(cm.exception)
+        self.assertTrue('Encountered errors for 2 domains' in message)
+        self.assertTrue('a.example.com' in message)
+        self.assertFalse('b.example.com' in message)
+        self.assertTrue('c.example.com' in message)
+
+
+    def test_perform_retries(self):
+        self._write_key('example.com')
+        achalls = [_make_achall('example.com', token) for token in (b'a' * 32, b'b' * 32)]
+        url = 'http://example.com/.well-known/challenges/bulk/'
+
+        with aioresponses() as m, mock.patch('asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            m.put(url, exception=aiohttp.ServerDisconnectedError())
+            m.put(url, status=503)
+            m.put(url, status=200, payload=[])
+            self.auth.perform(achalls)
+            self.assertEqual(len(m.requests[('PUT', URL(url))]), 3)
+            self.assertEqual(sleep.call_count, 2)
+
+
+    def test_perform_retries_exhausted(self):
+        self.config.django_retry_attempts = 2
+        self._write_key('example.com')
+        achall = _make_achall('example.com', b'a' * 32)
+        url = 'http://example.com/.well-known/challenges/{}/'.format(achall.chall.encode('token'))
+
+        with aioresponses() as m, mock.patch('asyncio.sleep', new=mock.AsyncMock()):
+            m.put(url, status=502, repeat=True)
+            with self.assertRaises(errors.PluginError):
+                self.auth.perform([achall])
+            self.assertEqual(len(m.requests[('PUT', URL(url))]), 2)
+
+
+    def test_cleanup_errors_ignored(self):
+        self._write_key('example.com')
+        achall = _make_achall('example.com', b'a' * 32)
+        with aioresponses() as m:
+            m.delete('http://example.com/.well-known/challenges/{}/'.format(achall.chall.encode('token')), exception=aiohttp.ClientConnectionError())
+            self.auth.cleanup([achall])
+
+
+    def test_verify_propagation(self):
+        self.config.django_verify_propagation = True
+        self._write_key('example.com')
+        achall = _make_achall('example.com', b'a' * 32)
+        url = 'http://example.com/.well-known/acme-challenge/{}'.format(achall.chall.encode('token'))
+
+        with aioresponses() as m, mock.patch('asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            m.put('http://example.com/.well-known/challenges/{}/'.format(achall.chall.encode('token')), status=200, payload={})
+            m.get(url, status=404)
+            m.get(url, status=200, body=achall.validation(achall.account_key) + '\n')
+            self.auth.perform([achall])
+            self.assertEqual(len(m.requests[('GET', URL(url))]), 2)
+            self.assertEqual(sleep.call_count, 1)
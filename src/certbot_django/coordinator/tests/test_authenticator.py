@@ -1,28 +1,70 @@
-from acme import challenges
+from acme import challenges, messages
 from asymmetric_jwt_auth import generate_key_pair
-from certbot import errors
+from certbot import achallenges, errors
 from certbot.tests import acme_util
 from certbot.tests import util as test_util
 import tempfile
 import unittest
 import six
 import mock
+import requests
 import requests_mock
 import shutil
 import os.path
 import re
+import socket
+import time
+
+
+def _make_achall(domain, token):
+    challb = acme_util.chall_to_challb(challenges.HTTP01(token=token), messages.STATUS_PENDING)
+    return achallenges.KeyAuthorizationAnnotatedChallenge(challb=challb, domain=domain, account_key=acme_util.JWK)
+
+
+def _detail_url(domain):
+    return re.compile(r'^http://{}/\.well-known/challenges/(?!bulk/)[A-Za-z0-9_-]+/$'.format(re.escape(domain)))
+
+
+def _fake_getaddrinfo(addresses):
+    """
+    Return a replacement for socket.getaddrinfo which resolves the host names in ``addresses``, and no others.
+    """
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host not in addresses:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (addresses[host], port))]
+    return getaddrinfo
+
+
+def _make_config(**kwargs):
+    options = dict(
+        http01_port=0, django_username=None, django_key_directory=None,
+        django_public_ip_logging_ok=False, django_workers=1, django_pool_size=10,
+        django_connect_timeout=10, django_read_timeout=30, django_engine='threads',
+        django_concurrency=50, django_key_group=None, django_key_groups_file=None,
+        django_api_url=None, django_api_urls_file=None, django_group_by='url',
+        django_verify_propagation=False, django_propagation_timeout=60, django_propagation_consecutive=1,
+        django_timings_file=None, django_timings_format=None,
+        django_retry_attempts=3, django_cleanup_retry_attempts=3, django_retry_backoff=0.5,
+        django_retry_statuses='429,502,503,504', django_retry_deadline=120, noninteractive_mode=False)
+    options.update(kwargs)
+    return mock.MagicMock(**options)
 
 
 class AuthenticatorTest(unittest.TestCase):
     def setUp(self):
         self.http_achall = acme_util.HTTP01_A
         self.achalls = [self.http_achall]
-        self.config = mock.MagicMock(
-            http01_port=0, django_username=None, django_key_directory=None,
-            django_public_ip_logging_ok=False, noninteractive_mode=False)
+        self.config = _make_config()
 
         self.temp_dir = tempfile.mkdtemp()
 
+        # Host names which resolve to an address, so that tests never wait on DNS
+        self.addresses = {}
+        patcher = mock.patch('socket.getaddrinfo', side_effect=_fake_getaddrinfo(self.addresses))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
         from certbot_django.coordinator.authenticator import Authenticator
         self.auth = Authenticator(self.config, name='django')
 
@@ -65,7 +107,7 @@ class AuthenticatorTest(unittest.TestCase):
         self.config.django_key_directory = self.temp_dir
 
         with requests_mock.mock() as m:
-            m.post('http://example.com/.well-known/challenges/', json={}, status_code=201)
+            m.put(_detail_url('example.com'), json={}, status_code=200)
             actual = self.auth.perform(self.achalls)
             expected = [achall.response(achall.account_key) for achall in self.achalls]
             self.assertEqual(actual, expected)
@@ -89,7 +131,7 @@ class AuthenticatorTest(unittest.TestCase):
             keyfile.write(priv)
 
         with requests_mock.mock() as m:
-            m.post('http://example.com/.well-known/challenges/', json={}, status_code=201)
+            m.put(_detail_url('example.com'), json={}, status_code=200)
             actual = self.auth.perform(self.achalls)
             expected = [achall.response(achall.account_key) for achall in self.achalls]
             self.assertEqual(actual, expected)
@@ -112,8 +154,11 @@ class AuthenticatorTest(unittest.TestCase):
             keyfile.write(priv)
 
         with requests_mock.mock() as m:
+            m.put(_detail_url('example.com'), json={}, status_code=403)
             m.post('http://example.com/.well-known/challenges/', json={}, status_code=403)
             self.assertRaises(errors.PluginError, self.auth.perform, self.achalls)
+            # Servers which predate upserts refuse PUT from users without the change permission, so it's retried as a POST
+            self.assertEqual([r.method for r in m.request_history], ['PUT', 'POST'])
 
 
     def test_cleanup(self):
@@ -127,8 +172,557 @@ class AuthenticatorTest(unittest.TestCase):
             keyfile.write(priv)
 
         with requests_mock.mock() as m:
-            m.post('http://example.com/.well-known/challenges/', json={}, status_code=201)
+            m.put(_detail_url('example.com'), json={}, status_code=200)
+            m.delete(re.compile('example.com/.well-known/challenges/[A-Za-z0-9]+/$'), json={}, status_code=204)
+            self.auth.perform(self.achalls)
+            self.auth.cleanup(self.achalls)
+            self.assertEqual(m.call_count, 2)
+
+
+    def test_sessions_reused(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_connect_timeout = 5
+        self.config.django_read_timeout = 15
+        self._write_key('example.com')
+
+        with requests_mock.mock() as m:
+            m.put(_detail_url('example.com'), json={}, status_code=200)
             m.delete(re.compile('example.com/.well-known/challenges/[A-Za-z0-9]+/$'), json={}, status_code=204)
             self.auth.perform(self.achalls)
+            session = self.auth._get_session('http://EXAMPLE.com/.well-known/challenges/')
+            self.assertEqual(len(self.auth._sessions), 1)
+            self.auth.cleanup(self.achalls)
+            self.assertEqual(len(self.auth._sessions), 0)
+            self.assertEqual([r.timeout for r in m.request_history], [(5.0, 15.0), (5.0, 15.0)])
+        self.assertTrue(session.adapters['http://'] is session.adapters['https://'])
+
+
+    def _write_key(self, domain):
+        priv, pub = generate_key_pair()
+        keypath = os.path.join(self.temp_dir, 'certbot_django_id_rsa_{}'.format(domain).replace('.', ''))
+        with open(keypath, 'w') as keyfile:
+            keyfile.write(priv)
+
+
+    def test_perform_concurrent(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_workers = 4
+
+        domains = ['a.example.com', 'b.example.com', 'c.example.com', 'd.example.com', 'e.example.com']
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+        for domain in domains:
+            self._write_key(domain)
+
+        with requests_mock.mock() as m:
+            for domain in domains:
+                m.put(_detail_url(domain), json={}, status_code=200)
+                m.delete(re.compile('{}/.well-known/challenges/[A-Za-z0-9_-]+/$'.format(domain)), json={}, status_code=204)
+            actual = self.auth.perform(achalls)
+            expected = [achall.response(achall.account_key) for achall in achalls]
+            self.assertEqual(actual, expected)
+            self.assertEqual(m.call_count, 5)
+            self.auth.cleanup(achalls)
+            self.assertEqual(m.call_count, 10)
+
+
+    def test_perform_concurrent_errors(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_workers = 3
+
+        domains = ['a.example.com', 'b.example.com', 'c.example.com']
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+        for domain in domains:
+            self._write_key(domain)
+
+        with requests_mock.mock() as m:
+            m.put(_detail_url('a.example.com'), json={}, status_code=500)
+            m.put(_detail_url('b.example.com'), json={}, status_code=200)
+            m.put(_detail_url('c.example.com'), json={}, status_code=403)
+            m.post('http://c.example.com/.well-known/challenges/', json={}, status_code=403)
+            with self.assertRaises(errors.PluginError) as cm:
+                self.auth.perform(achalls)
+            self.assertEqual(m.call_count, 4)
+
+        message = str(cm.exception)
+        self.assertTrue('Encountered errors for 2 domains' in message)
+        self.assertTrue('a.example.com' in message)
+        self.assertFalse('b.example.com' in message)
+        self.assertTrue('c.example.com' in message)
+
+
+    def test_perform_retries(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self._write_key('example.com')
+
+        with requests_mock.mock() as m, mock.patch('time.sleep') as sleep:
+            m.put(_detail_url('example.com'), [
+                {'exc': requests.ConnectionError('Connection reset by peer')},
+                {'status_code': 503, 'headers': {'Retry-After': '2'}},
+                {'status_code': 200, 'json': {}},
+            ])
+            self.auth.perform(self.achalls)
+            self.assertEqual(m.call_count, 3)
+            self.assertEqual(sleep.call_count, 2)
+            self.assertEqual(sleep.call_args_list[1][0][0], 2)
+
+        retries = [s for s in self.auth._timings.summarize() if s['phase'] == 'retry']
+        self.assertEqual(retries[0]['count'], 2)
+
+
+    def test_perform_retries_exhausted(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_retry_attempts = 2
+        self._write_key('example.com')
+
+        with requests_mock.mock() as m, mock.patch('time.sleep'):
+            m.put(_detail_url('example.com'), status_code=502)
+            with self.assertRaises(errors.PluginError) as cm:
+                self.auth.perform(self.achalls)
+            self.assertEqual(m.call_count, 2)
+        self.assertTrue('502' in str(cm.exception))
+
+        # Errors which aren't transient aren't retried. The challenge left behind by the failed run is removed first.
+        with requests_mock.mock() as m:
+            m.put(_detail_url('example.com'), status_code=500)
+            m.delete(_detail_url('example.com'), status_code=204)
+            self.assertRaises(errors.PluginError, self.auth.perform, self.achalls)
+            self.assertEqual([r.method for r in m.request_history], ['DELETE', 'PUT'])
+
+
+    def test_cleanup_retries(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_cleanup_retry_attempts = 4
+        self._write_key('example.com')
+
+        with requests_mock.mock() as m, mock.patch('time.sleep') as sleep:
+            m.delete(re.compile('example.com/.well-known/challenges/[A-Za-z0-9_-]+/$'),
+                     exc=requests.exceptions.ConnectTimeout)
             self.auth.cleanup(self.achalls)
+            self.assertEqual(m.call_count, 4)
+            self.assertEqual(sleep.call_count, 3)
+
+
+    def test_retry_deadline(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_retry_attempts = 10
+        self.config.django_retry_deadline = 1
+        self._write_key('example.com')
+
+        with requests_mock.mock() as m, mock.patch('time.sleep') as sleep:
+            m.put(_detail_url('example.com'), status_code=503, headers={'Retry-After': '5'})
+            self.assertRaises(errors.PluginError, self.auth.perform, self.achalls)
+            self.assertEqual(m.call_count, 1)
+            self.assertEqual(sleep.call_count, 0)
+
+
+    def test_bad_retry_statuses(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_retry_statuses = '503,oops'
+        self.assertRaises(errors.PluginError, self.auth.perform, self.achalls)
+
+
+    def test_bad_workers(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_workers = -1
+        self.assertRaises(errors.PluginError, self.auth.perform, self.achalls)
+
+
+    def test_perform_bulk(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_group_by = 'address'
+        self._write_key('example.com')
+
+        # The names on one certificate, all served by the same deployment
+        domains = ['example.com', 'www.example.com', 'shop.example.com']
+        self.addresses.update({domain: '203.0.113.5' for domain in domains})
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+        with requests_mock.mock() as m:
+            m.put('http://example.com/.well-known/challenges/bulk/', json=[], status_code=200)
+            m.delete('http://example.com/.well-known/challenges/bulk/', status_code=204)
+            actual = self.auth.perform(achalls)
+            self.assertEqual(actual, [achall.response(achall.account_key) for achall in achalls])
+            self.assertEqual(m.call_count, 1)
+            self.assertEqual([item['challenge'] for item in m.request_history[0].json()], [
+                achall.chall.encode('token') for achall in achalls])
+            self.assertEqual([item['domain'] for item in m.request_history[0].json()], domains)
+
+            self.auth.cleanup(achalls)
             self.assertEqual(m.call_count, 2)
+            self.assertEqual(m.request_history[1].json(), {
+                'challenges': [achall.chall.encode('token') for achall in achalls]})
+
+        # Each challenge is journaled under its own domain's URL, and was removed
+        from certbot_django.coordinator import journal
+        self.assertEqual(journal.Journal(os.path.join(self.temp_dir, journal.JOURNAL_FILENAME)).pending(include_running=True), [])
+
+
+    def test_group_by(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.addresses.update({
+            'example.com': '203.0.113.5',
+            'www.example.com': '203.0.113.5',
+            'example.net': '198.51.100.7',
+        })
+        domains = ['example.com', 'www.example.com', 'example.net']
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+        for domain in domains:
+            self._write_key(domain)
+
+        # By default, only identical URLs are grouped
+        with requests_mock.mock() as m:
+            for domain in domains:
+                m.put(_detail_url(domain), json={}, status_code=200)
+                m.delete(_detail_url(domain), status_code=204)
+            self.auth.perform(achalls)
+            self.assertEqual(m.call_count, 3)
+            self.auth.cleanup(achalls)
+
+        self.config.django_group_by = 'address'
+        with requests_mock.mock() as m:
+            m.put('http://example.com/.well-known/challenges/bulk/', json=[], status_code=200)
+            m.put(_detail_url('example.net'), json={}, status_code=200)
+            self.auth.perform(achalls)
+            self.assertEqual(sorted(r.url for r in m.request_history), [
+                'http://example.com/.well-known/challenges/bulk/',
+                'http://example.net/.well-known/challenges/{}/'.format(achalls[2].chall.encode('token')),
+            ])
+            m.delete('http://example.com/.well-known/challenges/bulk/', status_code=204)
+            m.delete(_detail_url('example.net'), status_code=204)
+            self.auth.cleanup(achalls)
+
+
+    def test_perform_bulk_unsupported(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self._write_key('example.com')
+
+        achalls = [_make_achall('example.com', token) for token in (b'a' * 32, b'b' * 32)]
+        with requests_mock.mock() as m:
+            m.put('http://example.com/.well-known/challenges/bulk/', status_code=405)
+            m.post('http://example.com/.well-known/challenges/bulk/', status_code=405)
+            m.post('http://example.com/.well-known/challenges/', json={}, status_code=201)
+            m.delete(re.compile('example.com/.well-known/challenges/[A-Za-z0-9_-]+/$'), json={}, status_code=204)
+            self.auth.perform(achalls)
+            self.assertEqual([r.method for r in m.request_history], ['PUT', 'POST', 'POST', 'POST'])
+
+            # The server is remembered as not supporting bulk requests, so cleanup goes straight to single deletes
+            self.auth.cleanup(achalls)
+            self.assertEqual(m.call_count, 6)
+            self.assertFalse(any(r.url.endswith('/bulk/') for r in m.request_history[4:]))
+
+
+    def test_perform_upsert_unsupported(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self._write_key('example.com')
+
+        achalls = [_make_achall('example.com', token) for token in (b'a' * 32, b'b' * 32)]
+        with requests_mock.mock() as m:
+            # Servers which predate upserts only allow PUT for existing challenges
+            m.put(_detail_url('example.com'), status_code=404)
+            m.post('http://example.com/.well-known/challenges/', json={}, status_code=201)
+            self.auth._bulk_unsupported.add('http://example.com/.well-known/challenges/')
+            self.auth.perform(achalls)
+            self.assertEqual([r.method for r in m.request_history], ['PUT', 'POST', 'POST'])
+            self.assertEqual(m.request_history[1].text, 'challenge={}&response={}&domain=example.com'.format(
+                achalls[0].chall.encode('token'), achalls[0].validation(achalls[0].account_key)))
+
+
+    def test_keys_and_headers_cached(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self._write_key('example.com')
+
+        from certbot_django.coordinator import authenticator
+        achalls = [_make_achall('example.com', token) for token in (b'a' * 32, b'b' * 32, b'c' * 32)]
+        with requests_mock.mock() as m, \
+                mock.patch.object(authenticator, 'create_auth_header', wraps=authenticator.create_auth_header) as sign, \
+                mock.patch.object(authenticator, '_test_key_dir_read_write') as probe:
+            m.put('http://example.com/.well-known/challenges/bulk/', status_code=404)
+            m.post('http://example.com/.well-known/challenges/bulk/', status_code=404)
+            m.post('http://example.com/.well-known/challenges/', json={}, status_code=201)
+            m.delete(re.compile('example.com/.well-known/challenges/[A-Za-z0-9_-]+/$'), json={}, status_code=204)
+            self.auth.perform(achalls)
+            self.auth.cleanup(achalls)
+            self.assertEqual(m.call_count, 8)
+            self.assertEqual(sign.call_count, 1)
+            self.assertEqual(probe.call_count, 1)
+
+            # Once the signed header has expired, a new one is signed with the already loaded key
+            with mock.patch.object(authenticator.time, 'time', return_value=time.time() + authenticator.HEADER_MAX_AGE + 1):
+                self.auth.cleanup(achalls)
+            self.assertEqual(sign.call_count, 2)
+            self.assertEqual(len(self.auth._private_keys), 1)
+
+
+    @test_util.patch_get_utility()
+    def test_key_groups(self, mock_get_utility):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_key_group = ['shop=*.shop.example.com,shop.example.com']
+
+        groups_file = os.path.join(self.temp_dir, 'groups.txt')
+        with open(groups_file, 'w') as f:
+            f.write('# Blog servers\nblog=blog.example.com, www.blog.example.com\n')
+        self.config.django_key_groups_file = groups_file
+
+        domains = ['shop.example.com', 'a.shop.example.com', 'blog.example.com', 'www.blog.example.com', 'example.org']
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+        with requests_mock.mock() as m:
+            for domain in domains:
+                m.put(_detail_url(domain), json={}, status_code=200)
+            self.auth.perform(achalls)
+
+        self.assertEqual(sorted(name for name in os.listdir(self.temp_dir) if name.startswith('certbot_django_id_rsa')), [
+            'certbot_django_id_rsa_exampleorg',
+            'certbot_django_id_rsa_group_blog',
+            'certbot_django_id_rsa_group_shop',
+        ])
+        self.assertEqual(mock_get_utility().notification.call_count, 3)
+
+
+    def test_api_urls(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_key_group = ['shop=*.example.com,*.example.org']
+        self._write_key('group_shop')
+        self.config.django_api_url = ['*.example.com,*.example.org=https://10.0.0.5:8443/.well-known/challenges']
+
+        urls_file = os.path.join(self.temp_dir, 'urls.txt')
+        with open(urls_file, 'w') as f:
+            f.write('# Everything else goes over HTTPS\n*=https://{domain}/.well-known/challenges/\n')
+        self.config.django_api_urls_file = urls_file
+
+        self.assertEqual(self.auth._get_api_url('a.example.com'), 'https://10.0.0.5:8443/.well-known/challenges/')
+        self.assertEqual(self.auth._get_api_url('example.net'), 'https://example.net/.well-known/challenges/')
+
+        # Domains which map to the same server are sent together in one bulk request
+        domains = ['a.example.com', 'b.example.org']
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+        with requests_mock.mock() as m:
+            m.put('https://10.0.0.5:8443/.well-known/challenges/bulk/', json=[], status_code=200)
+            self.auth.perform(achalls)
+            self.assertEqual(m.call_count, 1)
+            self.assertEqual([item['domain'] for item in m.request_history[0].json()], domains)
+
+
+    def test_bad_api_url(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        for value in ('example.com', '=https://example.com/', 'example.com=ftp://example.com/', 'example.com=/challenges/'):
+            self.config.django_api_url = [value]
+            self.auth._api_urls = None
+            self.assertRaises(errors.PluginError, self.auth.perform, self.achalls)
+
+
+    def test_journal(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self._write_key('example.com')
+
+        from certbot_django.coordinator import journal
+        path = os.path.join(self.temp_dir, journal.JOURNAL_FILENAME)
+        achalls = [_make_achall('example.com', token) for token in (b'a' * 32, b'b' * 32)]
+        with requests_mock.mock() as m:
+            m.put('http://example.com/.well-known/challenges/bulk/', json=[], status_code=200)
+            m.delete('http://example.com/.well-known/challenges/bulk/', status_code=503)
+            self.auth.perform(achalls)
+            self.assertEqual(len(journal.Journal(path).pending()), 2)
+
+            # A failed cleanup leaves the challenges in the journal
+            with mock.patch('time.sleep'):
+                self.auth.cleanup(achalls)
+            self.assertEqual(len(journal.Journal(path).pending()), 2)
+
+        # The next run removes them before publishing its own challenge
+        from certbot_django.coordinator.authenticator import Authenticator
+        auth = Authenticator(self.config, name='django')
+        achall = _make_achall('example.com', b'c' * 32)
+        with requests_mock.mock() as m:
+            m.delete('http://example.com/.well-known/challenges/bulk/', status_code=204)
+            m.put(_detail_url('example.com'), json={}, status_code=200)
+            m.delete(_detail_url('example.com'), status_code=404)
+            auth.perform([achall])
+            self.assertEqual([r.method for r in m.request_history], ['DELETE', 'PUT'])
+            self.assertEqual(m.request_history[0].json(), {
+                'challenges': [a.chall.encode('token') for a in achalls]})
+            self.assertEqual([e.challenge for e in journal.Journal(path).pending()], [achall.chall.encode('token')])
+
+            # Challenges which are already gone count as removed
+            auth.cleanup([achall])
+        self.assertFalse(os.path.exists(path))
+
+
+    def test_drain_journal(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_retry_attempts = 1
+        for domain in ('example.com', 'a.example.com', 'b.example.com'):
+            self._write_key(domain)
+
+        from certbot_django.coordinator import journal
+        path = os.path.join(self.temp_dir, journal.JOURNAL_FILENAME)
+        journal.Journal(path).add([
+            ('http://a.example.com/.well-known/challenges/', 'a.example.com', 'token1'),
+            ('http://b.example.com/.well-known/challenges/', 'b.example.com', 'token2'),
+        ])
+        achall = _make_achall('example.com', b'c' * 32)
+        with requests_mock.mock() as m, mock.patch('time.sleep'), \
+                mock.patch.object(self.auth, '_map', wraps=self.auth._map) as _map:
+            # Leftovers are retried as a cleanup would be, not with the perform policy's single attempt
+            m.delete('http://a.example.com/.well-known/challenges/token1/', [{'status_code': 503}, {'status_code': 204}])
+            m.delete('http://b.example.com/.well-known/challenges/token2/', status_code=204)
+            m.put(_detail_url('example.com'), json={}, status_code=200)
+            self.auth.perform([achall])
+            self.assertEqual([e.challenge for e in journal.Journal(path).pending()], [achall.chall.encode('token')])
+            # Every server is drained at once, whatever the number of workers
+            self.assertEqual(_map.call_args_list[0][1], {'workers': 50})
+
+
+    def test_cleanup_command(self):
+        self._write_key('example.com')
+        from certbot_django.coordinator import cleanup, journal
+        journal.Journal(os.path.join(self.temp_dir, journal.JOURNAL_FILENAME)).add([
+            ('http://a.example.com/.well-known/challenges/', 'example.com', 'token1'),
+            ('http://a.example.com/.well-known/challenges/', 'example.com', 'token2'),
+            ('http://b.example.com/.well-known/challenges/', 'example.com', 'token3'),
+        ])
+        argv = ['--key-directory', self.temp_dir, '--username', 'certbot']
+        with requests_mock.mock() as m, mock.patch('time.sleep'):
+            m.delete('http://a.example.com/.well-known/challenges/bulk/', status_code=204)
+            m.delete('http://b.example.com/.well-known/challenges/token3/', status_code=502)
+            self.assertEqual(cleanup.main(argv), 1)
+            m.delete('http://b.example.com/.well-known/challenges/token3/', status_code=204)
+            self.assertEqual(cleanup.main(argv), 0)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, journal.JOURNAL_FILENAME)))
+
+
+    def test_bad_key_group(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        for value in ('shop', 'shop=', 'sh op=shop.example.com'):
+            self.config.django_key_group = [value]
+            self.auth._key_groups = None
+            self.assertRaises(errors.PluginError, self.auth.perform, self.achalls)
+
+
+    def test_bad_config_not_journaled(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_key_group = ['shop=']
+        self.assertRaises(errors.PluginError, self.auth.perform, self.achalls)
+
+        from certbot_django.coordinator import journal
+        path = os.path.join(self.temp_dir, journal.JOURNAL_FILENAME)
+        self.assertEqual(journal.Journal(path).pending(include_running=True), [])
+
+
+    def test_verify_propagation(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_verify_propagation = True
+        self.config.django_propagation_consecutive = 2
+        self._write_key('example.com')
+
+        validation = self.http_achall.validation(self.http_achall.account_key)
+        url = 'http://example.com/.well-known/acme-challenge/{}'.format(self.http_achall.chall.encode('token'))
+        with requests_mock.mock() as m, mock.patch('time.sleep') as sleep:
+            m.put(_detail_url('example.com'), json={}, status_code=200)
+            m.get(url, [
+                {'status_code': 404},
+                {'text': 'wrong'},
+                {'text': validation + '\n'},
+                {'status_code': 404},
+                {'text': validation + '\n'},
+                {'text': validation + '\n'},
+            ])
+            self.auth.perform(self.achalls)
+            self.assertEqual(m.call_count, 7)
+            self.assertEqual([call[0][0] for call in sleep.call_args_list], [0.5, 1.0, 2.0])
+
+
+    def test_verify_propagation_timeout(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_verify_propagation = True
+        self.config.django_propagation_timeout = 0.01
+        self._write_key('example.com')
+
+        url = 'http://example.com/.well-known/acme-challenge/{}'.format(self.http_achall.chall.encode('token'))
+        with requests_mock.mock() as m:
+            m.put(_detail_url('example.com'), json={}, status_code=200)
+            m.get(url, status_code=404)
+            with self.assertRaises(errors.PluginError) as cm:
+                self.auth.perform(self.achalls)
+        self.assertTrue('before the propagation timeout' in str(cm.exception))
+
+
+    def test_timings_file(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_username = 'certbot'
+        self.config.django_key_directory = self.temp_dir
+        self.config.django_timings_file = os.path.join(self.temp_dir, 'certbot_django.prom')
+        self._write_key('example.com')
+
+        with requests_mock.mock() as m:
+            m.put(_detail_url('example.com'), json={}, status_code=200,
+                  headers={'Server-Timing': 'app;dur=12.5'})
+            m.delete(re.compile(r'^http://example.com/.well-known/challenges/'), status_code=204)
+            self.auth.perform(self.achalls)
+            self.auth.cleanup(self.achalls)
+
+        phases = [(s['operation'], s['phase']) for s in self.auth._timings.summarize()]
+        self.assertEqual(phases, [
+            ('perform', 'key_load'),
+            ('perform', 'sign'),
+            ('perform', 'post'),
+            ('perform', 'server'),
+            ('cleanup', 'delete'),
+        ])
+        server = self.auth._timings.summarize()[3]
+        self.assertEqual(server['total_seconds'], 0.0125)
+        self.assertEqual(server['slowest'], ['example.com'])
+
+        with open(self.config.django_timings_file, 'r') as timings_file:
+            content = timings_file.read()
+        self.assertTrue('certbot_django_phase_seconds_count{operation="perform",phase="post"} 1.0' in content)
+        self.assertTrue('certbot_django_run_success{operation="cleanup"} 1.0' in content)
+
+
+    def test_timings_file_unwritable(self):
+        self.config.django_public_ip_logging_ok = True
+        self.config.django_timings_file = '/this/dir/doest/exist/timings.json'
+        self.auth.perform([])
+        self.auth.cleanup([])
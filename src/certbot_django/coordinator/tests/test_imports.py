@@ -0,0 +1,54 @@
+from asymmetric_jwt_auth import token
+from certbot_django.coordinator import authenticator
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+
+# Modules which certbot loads before it imports its plugins
+CERTBOT_MODULES = (
+    'certbot.interfaces',
+    'certbot.errors',
+    'certbot.plugins.common',
+    'certbot.display.util',
+    'zope.component',
+    'zope.interface',
+)
+
+# Modules the authenticator only needs once it authenticates, and mustn't import while certbot loads it
+DEFERRED_MODULES = (
+    'aiohttp',
+    'asymmetric_jwt_auth',
+    'concurrent.futures',
+    'jwt',
+)
+
+
+def _imported_modules(module):
+    """
+    Import ``module`` in a fresh interpreter, after the modules certbot has already imported, and return the
+    set of names of the modules it imported.
+    """
+    code = '\n'.join(['import {}'.format(name) for name in CERTBOT_MODULES + ('json', 'sys')] + [
+        'before = set(sys.modules)',
+        'import {}'.format(module),
+        'json.dump(sorted(set(sys.modules) - before), sys.stdout)',
+    ])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    return set(json.loads(subprocess.check_output([sys.executable, '-c', code], env=env, universal_newlines=True)))
+
+
+
+class ImportTest(unittest.TestCase):
+    def test_header_max_age(self):
+        self.assertEqual(authenticator.HEADER_MAX_AGE, token.TIMESTAMP_TOLERANCE / 2)
+
+
+    def test_authenticator_import(self):
+        module = 'certbot_django.coordinator.authenticator'
+        imported = _imported_modules(module)
+        self.assertIn(module, imported)
+        for name in DEFERRED_MODULES:
+            self.assertEqual([m for m in imported if m == name or m.startswith(name + '.')], [])
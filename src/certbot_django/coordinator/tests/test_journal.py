@@ -0,0 +1,81 @@
+from certbot_django.coordinator import journal
+import mock
+import os.path
+import shutil
+import tempfile
+import time
+import unittest
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, journal.JOURNAL_FILENAME)
+        self.journal = journal.Journal(self.path)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+
+    def test_add_and_remove(self):
+        self.assertEqual(self.journal.pending(), [])
+        self.journal.add([('http://a/', 'a', 'token1'), ('http://a/', 'a', 'token2'), ('http://b/', 'b', 'token1')])
+        self.journal.remove([('http://a/', 'token1'), ('http://c/', 'missing')])
+        self.assertEqual([(e.url, e.domain, e.challenge, e.pid) for e in self.journal.pending()], [
+            ('http://a/', 'a', 'token2', os.getpid()),
+            ('http://b/', 'b', 'token1', os.getpid()),
+        ])
+
+
+    def test_truncated_line(self):
+        self.journal.add([('http://a/', 'a', 'token1')])
+        with open(self.path, 'a') as f:
+            f.write('["-","http://a/","tok')
+        self.assertEqual([e.challenge for e in self.journal.pending()], ['token1'])
+
+
+    def test_running_processes_skipped(self):
+        self.journal.add([('http://a/', 'a', 'token1')])
+        with mock.patch('os.getpid', return_value=1):
+            self.journal.add([('http://a/', 'a', 'token2')])
+        with mock.patch('os.kill'):
+            self.assertEqual([e.challenge for e in self.journal.pending()], ['token1'])
+        with mock.patch('os.kill', side_effect=ProcessLookupError):
+            self.assertEqual([e.challenge for e in self.journal.pending()], ['token1', 'token2'])
+        self.assertEqual(len(self.journal.pending(include_running=True)), 2)
+
+
+    def test_compact(self):
+        self.journal.add([('http://a/', 'a', 'token1'), ('http://a/', 'a', 'token2')])
+        self.journal.remove([('http://a/', 'token1')])
+        self.journal.compact()
+        with open(self.path, 'r') as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.assertEqual([e.challenge for e in self.journal.pending()], ['token2'])
+
+        self.journal.remove([('http://a/', 'token2')])
+        self.journal.compact()
+        self.assertFalse(os.path.exists(self.path))
+        self.journal.compact()
+
+
+    def test_max_age(self):
+        self.journal.add([('http://a/', 'a', 'token1')])
+        with mock.patch('time.time', return_value=time.time() + journal.MAX_AGE - 60):
+            self.assertEqual([e.challenge for e in self.journal.pending()], ['token1'])
+        # The server has expired the challenge by now, so it isn't retried
+        with mock.patch('time.time', return_value=time.time() + journal.MAX_AGE + 60):
+            self.assertEqual(self.journal.pending(), [])
+            self.journal.compact()
+        self.assertFalse(os.path.exists(self.path))
+
+
+    def test_entries_without_timestamps(self):
+        with open(self.path, 'w') as f:
+            f.write('["+","http://a/","a","token1",{}]\n'.format(os.getpid()))
+        self.assertEqual([e.added for e in self.journal.pending()], [None])
+        # Compacting stamps them, so they age out too
+        self.journal.compact()
+        with mock.patch('time.time', return_value=time.time() + journal.MAX_AGE + 60):
+            self.assertEqual(self.journal.pending(), [])
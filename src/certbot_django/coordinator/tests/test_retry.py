@@ -0,0 +1,37 @@
+from certbot_django.coordinator import retry
+import mock
+import time
+import unittest
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_parse_statuses(self):
+        self.assertEqual(retry.parse_statuses('502, 503,'), (502, 503))
+        self.assertEqual(retry.parse_statuses([429]), (429, ))
+        self.assertRaises(ValueError, retry.parse_statuses, '50x')
+
+
+    def test_is_retryable(self):
+        policy = retry.RetryPolicy(statuses=(503, ))
+        self.assertTrue(policy.is_retryable(503))
+        self.assertFalse(policy.is_retryable(500))
+
+
+    def test_backoff_with_jitter(self):
+        policy = retry.RetryPolicy(attempts=5, backoff=1, max_delay=3)
+        with mock.patch('random.uniform', side_effect=lambda low, high: high) as uniform:
+            self.assertEqual([policy.get_delay(attempt) for attempt in range(1, 6)], [1, 2, 3, 3, None])
+        self.assertEqual([call[0] for call in uniform.call_args_list], [(0, 1), (0, 2), (0, 4), (0, 8)])
+
+
+    def test_retry_after(self):
+        policy = retry.RetryPolicy(attempts=3, max_delay=5)
+        self.assertEqual(policy.get_delay(1, '2'), 2)
+        self.assertEqual(policy.get_delay(1, '60'), 5)
+        self.assertTrue(policy.get_delay(1, 'Wed, 21 Oct 2015 07:28:00 GMT') <= retry.DEFAULT_BACKOFF)
+
+
+    def test_deadline(self):
+        policy = retry.RetryPolicy(attempts=10, backoff=1, deadline=time.time() + 1.5)
+        self.assertEqual(policy.get_delay(1, '1'), 1)
+        self.assertIsNone(policy.get_delay(1, '2'))
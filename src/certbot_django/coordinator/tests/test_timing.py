@@ -0,0 +1,78 @@
+from certbot_django.coordinator import timing
+import json
+import os.path
+import shutil
+import tempfile
+import unittest
+
+
+class TimingsTest(unittest.TestCase):
+    def setUp(self):
+        self.timings = timing.Timings()
+        with self.timings.run('perform', 3):
+            self.timings.record(timing.PHASE_POST, ['a.example.com', 'b.example.com'], 0.5)
+            self.timings.record(timing.PHASE_POST, 'c.example.com', 1.5, ok=False)
+            self.timings.record(timing.PHASE_SERVER, 'c.example.com', 0.25)
+
+
+    def test_summarize(self):
+        post, server = self.timings.summarize()
+        self.assertEqual(post['operation'], 'perform')
+        self.assertEqual(post['phase'], 'post')
+        self.assertEqual(post['count'], 2)
+        self.assertEqual(post['failures'], 1)
+        self.assertEqual(post['total_seconds'], 2.0)
+        self.assertEqual(post['mean_seconds'], 1.0)
+        self.assertEqual(post['max_seconds'], 1.5)
+        self.assertEqual(post['slowest'], ['c.example.com'])
+        self.assertEqual(server['count'], 1)
+
+
+    def test_span(self):
+        timings = timing.Timings()
+        with timings.span(timing.PHASE_SIGN, 'example.com'):
+            pass
+        with self.assertRaises(ValueError):
+            with timings.span(timing.PHASE_SIGN, 'example.com'):
+                raise ValueError()
+        self.assertEqual([span.ok for span in timings.spans], [True, False])
+
+
+    def test_format_table(self):
+        lines = self.timings.format_table().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('operation'))
+        self.assertTrue(lines[1].endswith('c.example.com'))
+
+
+    def test_format_prometheus(self):
+        content = self.timings.format_prometheus()
+        self.assertTrue('# TYPE certbot_django_phase_seconds summary' in content)
+        self.assertTrue('certbot_django_phase_seconds_sum{operation="perform",phase="post"} 2.0' in content)
+        self.assertTrue('certbot_django_phase_failures{operation="perform",phase="post"} 1.0' in content)
+        self.assertTrue('certbot_django_run_challenges{operation="perform"} 3.0' in content)
+        self.assertFalse('example.com' in content)
+
+
+    def test_write(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            self.timings.write(os.path.join(temp_dir, 'timings.json'))
+            self.timings.write(os.path.join(temp_dir, 'timings.prom'))
+            self.assertEqual(sorted(os.listdir(temp_dir)), ['timings.json', 'timings.prom'])
+            with open(os.path.join(temp_dir, 'timings.json'), 'r') as timings_file:
+                data = json.load(timings_file)
+            self.assertEqual(data['runs']['perform']['challenges'], 3)
+            self.assertEqual(data['spans'][0]['domains'], ['a.example.com', 'b.example.com'])
+            with open(os.path.join(temp_dir, 'timings.prom'), 'r') as timings_file:
+                self.assertTrue(timings_file.read().startswith('# HELP'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+    def test_parse_server_timing(self):
+        self.assertEqual(timing.parse_server_timing('app;dur=12.5'), 0.0125)
+        self.assertEqual(timing.parse_server_timing('db;dur=3, app;desc="Django";dur=20'), 0.02)
+        self.assertIsNone(timing.parse_server_timing('db;dur=3'))
+        self.assertIsNone(timing.parse_server_timing('app;dur=abc'))
+        self.assertIsNone(timing.parse_server_timing(None))
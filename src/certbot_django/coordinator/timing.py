@@ -0,0 +1,238 @@
+"""
+Per-phase timing for the Django authenticator.
+
+The authenticator records a span for every phase of adding and removing challenges: loading keys, signing
+``Authorization`` headers, POST and DELETE round trips, time spent inside the Django server (reported by its
+``Server-Timing`` header), waiting before retrying failed requests, and waiting for challenges to propagate. Spans are summarized in the log after
+``perform`` and ``cleanup``, and can be exported as JSON or as a Prometheus textfile with ``--timings-file``.
+"""
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+
+PHASE_KEY_LOAD = 'key_load'
+PHASE_SIGN = 'sign'
+PHASE_POST = 'post'
+PHASE_DELETE = 'delete'
+PHASE_SERVER = 'server'
+PHASE_PROPAGATION = 'propagation'
+PHASE_RETRY = 'retry'
+PHASES = (PHASE_KEY_LOAD, PHASE_SIGN, PHASE_POST, PHASE_DELETE, PHASE_SERVER, PHASE_PROPAGATION, PHASE_RETRY)
+
+FORMAT_JSON = 'json'
+FORMAT_PROMETHEUS = 'prometheus'
+FORMATS = (FORMAT_JSON, FORMAT_PROMETHEUS)
+
+#: Name of the ``Server-Timing`` metric which reports time spent handling a request in the Django server
+SERVER_TIMING_METRIC = 'app'
+
+Span = namedtuple('Span', ('operation', 'phase', 'domains', 'seconds', 'ok'))
+
+
+def parse_server_timing(value, metric=SERVER_TIMING_METRIC):
+    """
+    Return the duration, in seconds, of the given metric in a ``Server-Timing`` header, or None if it's missing.
+    """
+    for entry in (value or '').split(','):
+        params = [param.strip() for param in entry.split(';')]
+        if params[0] != metric:
+            continue
+        for param in params[1:]:
+            name, _, duration = param.partition('=')
+            if name.strip() == 'dur':
+                try:
+                    return float(duration) / 1000
+                except ValueError:
+                    return None
+    return None
+
+
+def get_format(path, fmt=None):
+    """
+    Return the export format for the given path. Files ending in ``.prom`` (as read by node exporter's
+    textfile collector) default to Prometheus, and everything else to JSON.
+    """
+    if fmt:
+        return fmt
+    return FORMAT_PROMETHEUS if path.endswith('.prom') else FORMAT_JSON
+
+
+def _format_labels(**labels):
+    return ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in sorted(labels.items()))
+
+
+class Timings(object):
+    """
+    Thread-safe collection of timing spans for one certbot run.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = []
+        self._runs = OrderedDict()
+        self.operation = None
+
+
+    @contextmanager
+    def run(self, operation, challenges):
+        """
+        Time a whole ``perform`` or ``cleanup`` call. Spans recorded meanwhile are attributed to ``operation``.
+        """
+        self.operation = operation
+        started = time.time()
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            with self._lock:
+                self._runs[operation] = {
+                    'started': started,
+                    'seconds': time.perf_counter() - start,
+                    'challenges': challenges,
+                    'ok': ok,
+                }
+
+
+    @contextmanager
+    def span(self, phase, domains):
+        """
+        Time the wrapped block as one span of ``phase`` for the given domain or list of domains. Spans which
+        raise are recorded as failed.
+        """
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(phase, domains, time.perf_counter() - start, ok)
+
+
+    def record(self, phase, domains, seconds, ok=True):
+        if isinstance(domains, str):
+            domains = [domains]
+        with self._lock:
+            self._spans.append(Span(self.operation, phase, tuple(domains), seconds, ok))
+
+
+    @property
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+
+    def summarize(self):
+        """
+        Return a list of per-operation, per-phase summaries, in the order the phases were first seen.
+        """
+        summaries = OrderedDict()
+        for span in self.spans:
+            summary = summaries.get((span.operation, span.phase))
+            if summary is None:
+                summary = summaries[(span.operation, span.phase)] = {
+                    'operation': span.operation,
+                    'phase': span.phase,
+                    'count': 0,
+                    'failures': 0,
+                    'total_seconds': 0,
+                    'max_seconds': 0,
+                    'slowest': [],
+                }
+            summary['count'] += 1
+            summary['failures'] += 0 if span.ok else 1
+            summary['total_seconds'] += span.seconds
+            if span.seconds >= summary['max_seconds']:
+                summary['max_seconds'] = span.seconds
+                summary['slowest'] = list(span.domains)
+        for summary in summaries.values():
+            summary['mean_seconds'] = summary['total_seconds'] / summary['count']
+        return list(summaries.values())
+
+
+    def format_table(self):
+        """
+        Return the summary as a plain text table.
+        """
+        rows = [('operation', 'phase', 'count', 'failed', 'total (s)', 'mean (s)', 'max (s)', 'slowest')]
+        for summary in self.summarize():
+            rows.append((
+                summary['operation'] or '-',
+                summary['phase'],
+                str(summary['count']),
+                str(summary['failures']),
+                '{:.3f}'.format(summary['total_seconds']),
+                '{:.3f}'.format(summary['mean_seconds']),
+                '{:.3f}'.format(summary['max_seconds']),
+                ', '.join(summary['slowest']),
+            ))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]) - 1)]
+        return '\n'.join(
+            '  '.join(cell.ljust(width) for cell, width in zip(row, widths)) + '  ' + row[-1]
+            for row in rows)
+
+
+    def as_dict(self):
+        with self._lock:
+            runs = OrderedDict((operation, dict(run)) for operation, run in self._runs.items())
+        return {
+            'runs': runs,
+            'phases': self.summarize(),
+            'spans': [span._asdict() for span in self.spans],
+        }
+
+
+    def format_json(self):
+        return json.dumps(self.as_dict(), indent=2)
+
+
+    def format_prometheus(self):
+        """
+        Return the summary in the Prometheus text exposition format. Metrics are labelled by operation and
+        phase, not by domain, so that the number of series doesn't grow with the number of domains.
+        """
+        summaries = self.summarize()
+        with self._lock:
+            runs = list(self._runs.items())
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for suffix, labels, value in samples:
+                lines.append('{}{}{{{}}} {}'.format(name, suffix, _format_labels(**labels), repr(float(value))))
+
+        metric('certbot_django_phase_seconds', 'summary', 'Seconds spent in each phase of the last certbot run.', [
+            (suffix, {'operation': s['operation'], 'phase': s['phase']}, s[key])
+            for s in summaries for suffix, key in (('_sum', 'total_seconds'), ('_count', 'count'))])
+        metric('certbot_django_phase_max_seconds', 'gauge', 'Slowest span of each phase in the last certbot run.', [
+            ('', {'operation': s['operation'], 'phase': s['phase']}, s['max_seconds']) for s in summaries])
+        metric('certbot_django_phase_failures', 'gauge', 'Failed spans of each phase in the last certbot run.', [
+            ('', {'operation': s['operation'], 'phase': s['phase']}, s['failures']) for s in summaries])
+        metric('certbot_django_run_seconds', 'gauge', 'Duration of the last perform and cleanup.', [
+            ('', {'operation': operation}, run['seconds']) for operation, run in runs])
+        metric('certbot_django_run_challenges', 'gauge', 'Challenges handled by the last perform and cleanup.', [
+            ('', {'operation': operation}, run['challenges']) for operation, run in runs])
+        metric('certbot_django_run_success', 'gauge', 'Whether the last perform and cleanup succeeded.', [
+            ('', {'operation': operation}, 1 if run['ok'] else 0) for operation, run in runs])
+        metric('certbot_django_run_timestamp_seconds', 'gauge', 'When the last perform and cleanup started.', [
+            ('', {'operation': operation}, run['started']) for operation, run in runs])
+        return '\n'.join(lines) + '\n'
+
+
+    def write(self, path, fmt=None):
+        """
+        Write the timings to ``path`` in the given format (see :func:`get_format`). The file is replaced
+        atomically, so collectors never read a partially written file.
+        """
+        fmt = get_format(path, fmt)
+        content = self.format_prometheus() if fmt == FORMAT_PROMETHEUS else self.format_json()
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'w') as output:
+            output.write(content)
+        os.replace(temp_path, path)
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse, NoReverseMatch
 from .models import AcmeChallenge
+from .stores import get_store
 
 
 class AcmeChallengeAdmin(admin.ModelAdmin):
@@ -18,20 +19,26 @@ class AcmeChallengeAdmin(admin.ModelAdmin):
             'fields': [
                 'challenge',
                 'response',
+                'domain',
             ],
         }),
         ('Metadata', {
             'fields': [
                 'id',
                 'format_acme_url',
+                'created',
+                'expires_at',
             ],
         }),
     ]
 
-    list_display = ['challenge', 'format_acme_url']
+    list_display = ['challenge', 'domain', 'format_acme_url', 'created', 'expires_at']
+    list_filter = ['expires_at']
     ordering = ['challenge']
-    readonly_fields = ['id', 'format_acme_url']
-    search_fields = ['challenge', 'response']
+    readonly_fields = ['id', 'format_acme_url', 'created']
+    search_fields = ['challenge', 'response', 'domain']
 
 
-admin.site.register(AcmeChallenge, AcmeChallengeAdmin)
+# Other stores don't keep challenges in the database, so there's nothing for the admin to show
+if get_store().uses_database:
+    admin.site.register(AcmeChallenge, AcmeChallengeAdmin)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CertbotConfig(AppConfig):
     name = 'certbot_django.server'
     verbose_name = "Certbot Authentication Server"
+
+    def ready(self):
+        from . import signals  # NOQA
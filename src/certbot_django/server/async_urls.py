@@ -0,0 +1,11 @@
+from django.conf.urls import url
+from . import async_views, views
+
+
+urlpatterns = [
+    url(r'^acme-challenge/(?P<acme_data>.+)$', async_views.detail, name='acmechallenge-response'),
+    url(r'^challenges-metrics/$', views.serve_metrics, name='acmechallenge-metrics'),
+    url(r'^challenges/$', async_views.challenge_list, name='acmechallenge-list'),
+    url(r'^challenges/bulk/$', async_views.challenge_bulk, name='acmechallenge-bulk'),
+    url(r'^challenges/(?P<challenge>[^/.]+)/$', async_views.challenge_detail, name='acmechallenge-detail'),
+]
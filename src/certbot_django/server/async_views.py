@@ -0,0 +1,182 @@
+"""
+Async (ASGI-native) versions of the challenge views. Requires Django 3.1 or later.
+
+Include ``certbot_django.server.async_urls`` instead of ``certbot_django.server.urls`` to use them.
+
+Like the sync API, the create / replace / delete views are exempt from ``CsrfViewMiddleware``, since the
+coordinator authenticates with an ``Authorization`` header rather than a cookie. Requests which fall back to
+the session's user are checked for a CSRF token by hand, as Django REST framework's ``SessionAuthentication``
+does.
+"""
+from asgiref.sync import sync_to_async
+from django.middleware.csrf import CsrfViewMiddleware
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse, QueryDict
+from django.urls import reverse
+from .models import AcmeChallenge, normalize_domain
+from .serializers import AcmeChallengeBulkSerializer, AcmeChallengeBulkDeleteSerializer
+from .stores import get_store, ChallengeExists
+from .views import _body_response
+from . import authentication, index, metrics
+import json
+import time
+
+
+def _passes_csrf_check(request):
+    middleware = CsrfViewMiddleware(lambda request: None)
+    middleware.process_request(request)
+    return middleware.process_view(request, None, (), {}) is None
+
+
+def _has_permission(request, action):
+    user = authentication.authenticate(request)
+    if user is None:
+        user = getattr(request, 'user', None)
+        if user and user.is_authenticated and not _passes_csrf_check(request):
+            return False
+    perm = '{}.{}_{}'.format(AcmeChallenge._meta.app_label, action, AcmeChallenge._meta.model_name)
+    return bool(user and user.is_authenticated and user.is_staff and user.has_perm(perm))
+
+
+# Permissions needed by each method of the bulk endpoint, matching AcmeChallengePermissions
+BULK_PERMISSIONS = {
+    'POST': ('add', ),
+    'PUT': ('add', 'delete'),
+    'DELETE': ('delete', ),
+}
+
+
+def _parse_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body.decode(request.encoding or 'utf-8'))
+        except ValueError:
+            return None
+    if request.method == 'POST':
+        return request.POST
+    return QueryDict(request.body, encoding=request.encoding)
+
+
+def _forbidden():
+    return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=403)
+
+
+async def detail(request, acme_data):
+    start = time.perf_counter()
+    body = await index.aget_body(acme_data, normalize_domain(request.get_host()))
+    metrics.observe_validation(metrics.SOURCE_ASYNC_VIEW, body is not None, time.perf_counter() - start)
+    if body is None:
+        raise Http404('No ACME Challenge matches the given query.')
+    return _body_response(body)
+
+
+async def challenge_list(request):
+    # require_http_methods isn't async aware until Django 5.0, so check the method by hand
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if not await sync_to_async(_has_permission)(request, 'add'):
+        return _forbidden()
+
+    serializer = AcmeChallengeBulkSerializer(data=_parse_data(request))
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    data = serializer.validated_data
+    try:
+        acme_challenge = (await sync_to_async(get_store().create)([(data['challenge'], data['response'], data['domain'])]))[0]
+    except ChallengeExists as e:
+        return JsonResponse({'challenge': [str(e)]}, status=400)
+    metrics.count_created(1)
+    return _challenge_response(request, acme_challenge, 201)
+
+
+def _serialize(request, acme_challenge):
+    return {
+        'challenge': acme_challenge.challenge,
+        'response': acme_challenge.response,
+        'domain': acme_challenge.domain,
+        'acme_url': request.build_absolute_uri(reverse('acmechallenge-response', args=(acme_challenge.challenge, ))),
+    }
+
+
+def _challenge_response(request, acme_challenge, status):
+    return JsonResponse(_serialize(request, acme_challenge), status=status)
+
+
+async def _upsert(request, challenge):
+    # Upserting creates or replaces challenges, so it needs the same permissions as AcmeChallengePermissions
+    allowed = await sync_to_async(lambda: _has_permission(request, 'add') and _has_permission(request, 'delete'))()
+    if not allowed:
+        return _forbidden()
+
+    data = _parse_data(request)
+    if isinstance(data, QueryDict):
+        data = data.dict()
+    if isinstance(data, dict):
+        data = dict(data, challenge=challenge)
+    serializer = AcmeChallengeBulkSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    data = serializer.validated_data
+    acme_challenge = (await sync_to_async(get_store().upsert)([(data['challenge'], data['response'], data['domain'])]))[0]
+    metrics.count_created(1)
+    return _challenge_response(request, acme_challenge, 200)
+
+
+async def challenge_detail(request, challenge):
+    if request.method == 'PUT':
+        return await _upsert(request, challenge)
+    if request.method != 'DELETE':
+        return HttpResponseNotAllowed(['PUT', 'DELETE'])
+    if not await sync_to_async(_has_permission)(request, 'delete'):
+        return _forbidden()
+    if not await sync_to_async(get_store().delete)([challenge]):
+        raise Http404('No ACME Challenge matches the given query.')
+    metrics.count_deleted(1)
+    return HttpResponse(status=204)
+
+
+async def challenge_bulk(request):
+    """
+    Create (POST), create or replace (PUT), or delete (DELETE) many challenges in a single request, like the
+    ``bulk`` action of the sync API.
+    """
+    actions = BULK_PERMISSIONS.get(request.method)
+    if actions is None:
+        return HttpResponseNotAllowed(['POST', 'PUT', 'DELETE'])
+    allowed = await sync_to_async(lambda: all(_has_permission(request, action) for action in actions))()
+    if not allowed:
+        return _forbidden()
+    if request.method == 'DELETE':
+        return await _bulk_destroy(request)
+
+    serializer = AcmeChallengeBulkSerializer(data=_parse_data(request), many=True)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400, safe=False)
+    tokens = [item['challenge'] for item in serializer.validated_data]
+    if len(set(tokens)) != len(tokens):
+        return JsonResponse({'challenge': ['Challenges in a bulk request must be unique.']}, status=400)
+
+    items = [(item['challenge'], item['response'], item['domain']) for item in serializer.validated_data]
+    store = get_store()
+    try:
+        challenges = await sync_to_async(store.upsert if request.method == 'PUT' else store.create)(items)
+    except ChallengeExists as e:
+        return JsonResponse({'challenge': [str(e)]}, status=400)
+    metrics.count_created(len(challenges))
+    return JsonResponse([_serialize(request, obj) for obj in challenges], status=200 if request.method == 'PUT' else 201, safe=False)
+
+
+async def _bulk_destroy(request):
+    serializer = AcmeChallengeBulkDeleteSerializer(data=_parse_data(request))
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    tokens = serializer.validated_data['challenges']
+    metrics.count_deleted(await sync_to_async(get_store().delete)(tokens))
+    return HttpResponse(status=204)
+
+
+# csrf_exempt isn't async aware until Django 5.0, so mark the views by hand
+challenge_list.csrf_exempt = True
+challenge_detail.csrf_exempt = True
+challenge_bulk.csrf_exempt = True
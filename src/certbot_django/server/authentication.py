@@ -0,0 +1,154 @@
+"""
+Cached JWT authentication for the challenge API.
+
+``asymmetric_jwt_auth``'s middleware looks up the user and their public keys, and verifies the token's RSA
+signature, on every request. The challenge API authenticates with :class:`JWTAuthentication` instead, which
+keeps each user, their parsed public keys, and their resolved permissions in memory for
+``CERTBOT_DJANGO_AUTH_CACHE_TTL`` seconds (default 60). Tokens which have been verified once are also
+remembered until they expire, so the coordinator's reused ``Authorization`` header authorizes a whole batch
+of requests for the cost of one signature check.
+
+Changes to users, their permissions, or their public keys clear the cache of the process which made them.
+Other processes pick the change up within the TTL. Set the TTL to ``0`` to disable caching.
+"""
+from asymmetric_jwt_auth import AUTH_METHOD, token
+from asymmetric_jwt_auth.middleware import JWTAuthMiddleware
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.authentication import BaseAuthentication
+import hashlib
+import jwt
+import threading
+import time
+
+
+DEFAULT_TTL = 60
+
+#: Number of cached entries above which expired entries are pruned
+MAX_ENTRIES = 1000
+
+# Value cached for usernames which don't exist
+_MISSING = object()
+
+
+def get_ttl():
+    return getattr(settings, 'CERTBOT_DJANGO_AUTH_CACHE_TTL', DEFAULT_TTL)
+
+
+class _ExpiringCache(object):
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+        if item is None or item[0] <= time.time():
+            return None
+        return item[1]
+
+
+    def set(self, key, value, expires_at):
+        now = time.time()
+        if expires_at <= now:
+            return
+        with self._lock:
+            if len(self._items) >= MAX_ENTRIES:
+                self._items = {k: item for k, item in self._items.items() if item[0] > now}
+                if len(self._items) >= MAX_ENTRIES:
+                    self._items = {}
+            self._items[key] = (expires_at, value)
+
+
+    def clear(self):
+        with self._lock:
+            self._items = {}
+
+
+
+_users = _ExpiringCache()
+_tokens = _ExpiringCache()
+_nonces = JWTAuthMiddleware()
+
+
+def clear_cache():
+    """
+    Forget every cached user, public key, permission, and verified token in this process.
+    """
+    _users.clear()
+    _tokens.clear()
+
+
+def _load_public_key(pem):
+    try:
+        return serialization.load_pem_public_key(pem.encode('utf-8'), backend=default_backend())
+    except ValueError:
+        return None
+
+
+def _get_user(username):
+    """
+    Return a ``(user, [public keys])`` tuple for the given username, or None if there's no such user.
+    """
+    ttl = get_ttl()
+    entry = _users.get(username) if ttl > 0 else None
+    if entry is None:
+        User = get_user_model()
+        try:
+            user = User.objects.get(**{User.USERNAME_FIELD: username})
+            keys = [key for key in (_load_public_key(public.key) for public in user.public_keys.all()) if key]
+            entry = (user, keys)
+        except User.DoesNotExist:
+            entry = _MISSING
+        if ttl > 0:
+            _users.set(username, entry, time.time() + ttl)
+    return None if entry is _MISSING else entry
+
+
+def authenticate(request):
+    """
+    Return the user authenticated by the request's ``Authorization: JWT ...`` header, or None. The same user
+    object is returned until the cache expires, so permissions resolved by ``has_perm`` are cached with it.
+    """
+    method, _, claim = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if method.upper() != AUTH_METHOD or not claim:
+        return None
+
+    digest = hashlib.sha256(claim.encode('utf-8')).hexdigest()
+    user = _tokens.get(digest)
+    if user is not None:
+        return user
+
+    try:
+        username = token.get_claimed_username(claim)
+    except jwt.InvalidTokenError:
+        return None
+    entry = _get_user(username) if username else None
+    if entry is None:
+        return None
+
+    user, keys = entry
+    for key in keys:
+        data = token.verify(claim, key, validate_nonce=_nonces.validate_nonce)
+        if data:
+            ttl = get_ttl()
+            if ttl > 0:
+                _tokens.set(digest, user, min(data.get('time', 0) + token.TIMESTAMP_TOLERANCE, time.time() + ttl))
+            return user
+    return None
+
+
+
+class JWTAuthentication(BaseAuthentication):
+    """
+    Django REST Framework authentication class which authenticates ``Authorization: JWT ...`` headers using
+    the cache described above. Requests without a valid header are left to the next authentication class.
+    """
+    def authenticate(self, request):
+        user = authenticate(request._request)
+        if user is None:
+            return None
+        return (user, None)
@@ -0,0 +1,159 @@
+"""
+Optional read-through cache for ACME challenge responses.
+
+Enable it by setting ``CERTBOT_DJANGO_CACHE`` to the alias of one of the caches in ``CACHES``. Responses are
+written to the cache when an :class:`AcmeChallenge <certbot_django.server.models.AcmeChallenge>` is saved and
+removed when it's deleted, so validation probes can be answered without touching the database. Responses are
+cached as the encoded bodies served to validation requests, so a cache hit is sent as is.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from .models import AcmeChallenge, domain_matches, make_body
+from . import routers
+
+
+#: Prefix for every cache key written by certbot_django. Earlier versions cached plain responses under
+#: ``certbot_django:challenge:``, so a new prefix keeps them from being read back as bodies.
+KEY_PREFIX = 'certbot_django:challenge-body:'
+
+#: Seconds to cache a challenge response
+DEFAULT_TIMEOUT = 60 * 60
+
+#: Seconds to cache the absence of a challenge, so that probes for random tokens don't all reach the database
+DEFAULT_MISS_TIMEOUT = 10
+
+# Value cached for tokens which don't exist. Challenges are cached as ``(body, domain)`` tuples, so this
+# can't be confused with a real challenge.
+_MISSING = ''
+
+
+def is_enabled():
+    return bool(getattr(settings, 'CERTBOT_DJANGO_CACHE', None))
+
+
+def get_cache():
+    return caches[settings.CERTBOT_DJANGO_CACHE]
+
+
+def get_timeout():
+    return getattr(settings, 'CERTBOT_DJANGO_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def get_miss_timeout():
+    return getattr(settings, 'CERTBOT_DJANGO_CACHE_MISS_TIMEOUT', DEFAULT_MISS_TIMEOUT)
+
+
+def get_timeout_until(expires_at):
+    """
+    Return the cache timeout for a challenge which expires at the given time, so that expired challenges
+    are never served from the cache.
+    """
+    remaining = int((expires_at - timezone.now()).total_seconds())
+    return max(0, min(get_timeout(), remaining))
+
+
+def make_key(challenge):
+    return KEY_PREFIX + challenge
+
+
+def _get_live_response(challenge):
+    queryset = routers.probe_queryset(AcmeChallenge).live().filter(challenge=challenge)
+    return queryset.values_list('response', 'domain', 'expires_at')
+
+
+def _make_value(response, domain):
+    return (make_body(response), domain)
+
+
+def _get_cached_body(value, domain):
+    if not value:
+        return None
+    body, challenge_domain = value
+    return body if domain_matches(challenge_domain, domain) else None
+
+
+def _decode_body(body):
+    return None if body is None else body.decode('utf-8')[:-1]
+
+
+def get_body(challenge, domain=None):
+    """
+    Return the encoded body served for the given challenge token (see
+    :func:`make_body <certbot_django.server.models.make_body>`), or None if it doesn't exist or isn't served
+    for the given domain. Reads from the cache first and falls back to the database, caching whatever the
+    database returns.
+    """
+    cache = get_cache()
+    key = make_key(challenge)
+    value = cache.get(key)
+    if value is not None:
+        return _get_cached_body(value, domain)
+
+    row = routers.first(_get_live_response(challenge))
+    if row is None:
+        cache.set(key, _MISSING, get_miss_timeout())
+        return None
+    response, challenge_domain, expires_at = row
+    value = _make_value(response, challenge_domain)
+    cache.set(key, value, get_timeout_until(expires_at))
+    return _get_cached_body(value, domain)
+
+
+async def aget_body(challenge, domain=None):
+    """
+    Async version of :func:`get_body`. Uses Django's async cache and ORM APIs when they're available
+    (Django 4.0 and 4.1 respectively) and runs the sync versions in a thread otherwise.
+    """
+    from asgiref.sync import sync_to_async
+    cache = get_cache()
+    key = make_key(challenge)
+    if not hasattr(cache, 'aget'):
+        return await sync_to_async(get_body)(challenge, domain)
+
+    value = await cache.aget(key)
+    if value is not None:
+        return _get_cached_body(value, domain)
+
+    row = await routers.afirst(_get_live_response(challenge))
+    if row is None:
+        await cache.aset(key, _MISSING, get_miss_timeout())
+        return None
+    response, challenge_domain, expires_at = row
+    value = _make_value(response, challenge_domain)
+    await cache.aset(key, value, get_timeout_until(expires_at))
+    return _get_cached_body(value, domain)
+
+
+def get_response(challenge, domain=None):
+    """
+    Return the response for the given challenge token, or None if it doesn't exist or isn't served for the
+    given domain. See :func:`get_body`.
+    """
+    return _decode_body(get_body(challenge, domain))
+
+
+async def aget_response(challenge, domain=None):
+    """
+    Async version of :func:`get_response`.
+    """
+    return _decode_body(await aget_body(challenge, domain))
+
+
+def set_response(acme_challenge):
+    value = _make_value(acme_challenge.response, acme_challenge.domain)
+    get_cache().set(make_key(acme_challenge.challenge), value, get_timeout_until(acme_challenge.expires_at))
+
+
+def set_responses(acme_challenges):
+    """
+    Cache the responses for many :class:`AcmeChallenge <certbot_django.server.models.AcmeChallenge>` objects at once.
+    """
+    if not acme_challenges:
+        return
+    timeout = min(get_timeout_until(acme_challenge.expires_at) for acme_challenge in acme_challenges)
+    get_cache().set_many({make_key(c.challenge): _make_value(c.response, c.domain) for c in acme_challenges}, timeout)
+
+
+def delete_response(challenge):
+    get_cache().delete(make_key(challenge))
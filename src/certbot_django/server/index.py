@@ -0,0 +1,406 @@
+"""
+Optional in-process index of live challenges, for servers with many worker processes.
+
+Enable it by setting ``CERTBOT_DJANGO_INDEX = True``. Each process then keeps every live challenge's encoded
+body in a dictionary and answers validation requests from it, without a database or cache round trip.
+Whenever a challenge is created, replaced, or deleted, the change is published to a feed, which every
+process polls at most once every ``CERTBOT_DJANGO_INDEX_MAX_STALENESS`` seconds (default 1) as
+it answers validation requests. Challenges which aren't in the index are read from the challenge store, so a
+challenge published moments ago on another server is never missed. At worst, a process serves a replaced or
+deleted challenge for up to ``CERTBOT_DJANGO_INDEX_MAX_STALENESS`` seconds after the change.
+
+.. code-block:: python
+
+    # myproject/settings.py
+    CERTBOT_DJANGO_INDEX = True
+    CERTBOT_DJANGO_INDEX_FEED = 'certbot_django.server.index.DatabaseFeed'  # The default
+    CERTBOT_DJANGO_INDEX_MAX_STALENESS = 1
+
+Challenge stores publish their own changes. :class:`DatabaseStore <certbot_django.server.stores.DatabaseStore>`
+publishes from the model's ``post_save`` and ``post_delete`` signals, so changes made outside of the API, such
+as in the Django admin or by ``purge_acme_challenges``, are published too. Updates which bypass the model,
+such as ``QuerySet.update()``, aren't. Database changes are only published once their transaction commits,
+and the changes made by one store operation, such as a bulk delete, are published together.
+
+``CERTBOT_DJANGO_INDEX_FEED`` is the dotted path to a :class:`ChangeFeed` subclass. :class:`DatabaseFeed`
+records changes as :class:`AcmeChallengeChange <certbot_django.server.models.AcmeChallengeChange>` rows,
+which processes poll using the last ID they've seen as a watermark. :class:`LocalFeed` keeps changes in the
+current process, for single-process servers and tests. To use a message broker, such as Redis pub/sub,
+subclass :class:`ChangeFeed`.
+"""
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import AcmeChallengeChange, domain_matches, make_body
+from . import stores
+import threading
+import time
+
+
+#: Default value of the ``CERTBOT_DJANGO_INDEX_FEED`` setting
+DEFAULT_FEED = 'certbot_django.server.index.DatabaseFeed'
+
+#: Default number of seconds between polls of the feed
+DEFAULT_MAX_STALENESS = 1
+
+#: Default number of seconds changes are kept in the feed. Processes which haven't polled the feed for longer
+#: than this rebuild their index from the challenge store instead.
+DEFAULT_RETENTION = 60 * 60
+
+#: Changes published to a feed. ``response``, ``domain``, and ``expires_at`` are None for deleted challenges.
+Change = namedtuple('Change', ('challenge', 'response', 'domain', 'expires_at', 'deleted'))
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+# Changes collected by batch() in the current thread
+_batches = threading.local()
+
+
+def is_enabled():
+    return bool(getattr(settings, 'CERTBOT_DJANGO_INDEX', False))
+
+
+def get_max_staleness():
+    return getattr(settings, 'CERTBOT_DJANGO_INDEX_MAX_STALENESS', DEFAULT_MAX_STALENESS)
+
+
+def get_retention():
+    return getattr(settings, 'CERTBOT_DJANGO_INDEX_RETENTION', DEFAULT_RETENTION)
+
+
+def get_index():
+    """
+    Return this process's :class:`ChallengeIndex` for the configured feed.
+    """
+    path = getattr(settings, 'CERTBOT_DJANGO_INDEX_FEED', DEFAULT_FEED)
+    index = _indexes.get(path)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(path)
+            if index is None:
+                index = _indexes[path] = ChallengeIndex(import_string(path)())
+    return index
+
+
+def saved(challenges):
+    return [Change(challenge=obj.challenge, response=obj.response, domain=obj.domain, expires_at=obj.expires_at, deleted=False)
+            for obj in challenges]
+
+
+def deleted(tokens):
+    return [Change(challenge=token, response=None, domain=None, expires_at=None, deleted=True) for token in tokens]
+
+
+def publish(changes):
+    """
+    Publish changes to the feed, and apply them to this process's index straight away. Does nothing unless
+    the index is enabled.
+    """
+    if not is_enabled() or not changes:
+        return
+    index = get_index()
+    index.feed.publish(changes)
+    index.apply(changes)
+
+
+def publish_on_commit(changes, using=None):
+    """
+    Publish changes once the current transaction on the ``using`` database commits, so that changes which
+    are rolled back are never published. Inside a :func:`batch` block, changes are collected and published
+    together when the block exits.
+    """
+    if not is_enabled() or not changes:
+        return
+    pending = getattr(_batches, 'pending', None)
+    if pending is not None:
+        pending.setdefault(using, []).extend(changes)
+        return
+    transaction.on_commit(lambda: publish(changes), using=using)
+
+
+@contextmanager
+def batch():
+    """
+    Collect the changes passed to :func:`publish_on_commit` in the block, such as those from the model signals
+    sent for each challenge in a bulk delete, and publish them in one go. If the block raises, its changes
+    are dropped, since they've been rolled back. Nested blocks join the outermost one.
+    """
+    if getattr(_batches, 'pending', None) is not None:
+        yield
+        return
+    _batches.pending = pending = OrderedDict()
+    try:
+        yield
+    finally:
+        _batches.pending = None
+    for using, changes in pending.items():
+        publish_on_commit(changes, using=using)
+
+
+def get_body(challenge, domain=None):
+    """
+    Return the encoded body to serve for the given challenge token and (normalized) domain, or None. Reads
+    from the index if it's enabled, and from the challenge store if it isn't or the challenge isn't indexed.
+    """
+    if is_enabled():
+        index = get_index()
+        if index.is_due():
+            index.sync()
+        body = index.get_body(challenge, domain)
+        if body is not None:
+            return body
+    return stores.get_store().get_body(challenge, domain)
+
+
+async def aget_body(challenge, domain=None):
+    """
+    Async version of :func:`get_body`.
+    """
+    if is_enabled():
+        index = get_index()
+        if index.is_due():
+            from asgiref.sync import sync_to_async
+            await sync_to_async(index.sync)()
+        body = index.get_body(challenge, domain)
+        if body is not None:
+            return body
+    return await stores.get_store().aget_body(challenge, domain)
+
+
+
+class ChangeFeed(object):
+    """
+    Interface for feeds which carry challenge changes from the process which made them to every other process.
+    Cursors are opaque to the index. They only have to tell a feed which changes a process has already seen.
+    """
+    def get_cursor(self):
+        """
+        Return a cursor which points after the most recent change.
+        """
+        raise NotImplementedError()
+
+
+    def publish(self, changes):
+        """
+        Publish a list of :class:`Change` tuples.
+        """
+        raise NotImplementedError()
+
+
+    def poll(self, cursor):
+        """
+        Return a tuple of the new cursor and the list of :class:`Change` tuples published after ``cursor``, in
+        the order they were published.
+        """
+        raise NotImplementedError()
+
+
+
+class DatabaseFeed(ChangeFeed):
+    """
+    Record changes as :class:`AcmeChallengeChange <certbot_django.server.models.AcmeChallengeChange>` rows,
+    and poll them by ID. Changes older than ``CERTBOT_DJANGO_INDEX_RETENTION`` seconds are deleted as new
+    ones are published.
+
+    IDs are allocated when a row is inserted, but rows become visible when their transaction commits, which
+    isn't always in ID order. So IDs below the watermark which haven't been seen yet are polled for again,
+    until they turn up or ``GAP_TIMEOUT`` seconds have passed. Cursors are ``(last_id, gaps)`` tuples, where
+    ``gaps`` holds the missing IDs along with when to stop polling for them.
+    """
+    #: Seconds to keep polling for a skipped ID. Changes which take longer than this to commit are missed.
+    GAP_TIMEOUT = 60
+
+    #: Most skipped IDs to poll for at once
+    MAX_GAPS = 1000
+
+    #: Seconds between deletions of old changes
+    PRUNE_INTERVAL = 60
+
+
+    def __init__(self):
+        self._pruned_at = None
+
+
+    def get_cursor(self):
+        last = AcmeChallengeChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        # Transactions which are still running may hold IDs below the last one. IDs below the last change
+        # made more than GAP_TIMEOUT seconds ago are too old to be worth waiting for.
+        old = timezone.now() - timedelta(seconds=self.GAP_TIMEOUT)
+        floor = AcmeChallengeChange.objects.filter(created__lt=old).order_by('-id').values_list('id', flat=True).first() or 0
+        floor = max(floor, last - self.MAX_GAPS)
+        found = set(AcmeChallengeChange.objects.filter(id__gt=floor).values_list('id', flat=True))
+        expires = time.monotonic() + self.GAP_TIMEOUT
+        return last, tuple((gap, expires) for gap in range(floor + 1, last) if gap not in found)
+
+
+    def publish(self, changes):
+        AcmeChallengeChange.objects.bulk_create([AcmeChallengeChange(
+            challenge=change.challenge,
+            response=change.response or '',
+            domain=change.domain or '',
+            expires_at=change.expires_at,
+            deleted=change.deleted) for change in changes])
+        now = time.monotonic()
+        if self._pruned_at is None or now - self._pruned_at >= self.PRUNE_INTERVAL:
+            self._pruned_at = now
+            AcmeChallengeChange.objects.filter(created__lt=timezone.now() - timedelta(seconds=get_retention())).delete()
+
+
+    def poll(self, cursor):
+        last, gaps = cursor
+        now = time.monotonic()
+        gaps = [(gap, expires) for gap, expires in gaps if expires > now]
+        query = Q(id__gt=last)
+        if gaps:
+            query |= Q(id__in=[gap for gap, expires in gaps])
+        rows = list(AcmeChallengeChange.objects.filter(query).order_by('id').values_list(
+            'id', 'challenge', 'response', 'domain', 'expires_at', 'deleted'))
+        found = set(row[0] for row in rows)
+        gaps = [(gap, expires) for gap, expires in gaps if gap not in found]
+        if rows and rows[-1][0] > last:
+            expires = now + self.GAP_TIMEOUT
+            gaps.extend((gap, expires) for gap in range(max(last, rows[-1][0] - self.MAX_GAPS) + 1, rows[-1][0]) if gap not in found)
+            last = rows[-1][0]
+        return (last, tuple(gaps[-self.MAX_GAPS:])), [Change(*row[1:]) for row in rows]
+
+
+
+class LocalFeed(ChangeFeed):
+    """
+    Keep changes in a list in the current process. Only suitable for single-process servers and for tests,
+    since other processes never see the changes.
+    """
+    #: Number of changes to keep
+    MAX_CHANGES = 10000
+
+
+    def __init__(self):
+        self._changes = []
+        self._offset = 0
+        self._lock = threading.Lock()
+
+
+    def get_cursor(self):
+        return self._offset + len(self._changes)
+
+
+    def publish(self, changes):
+        with self._lock:
+            self._changes.extend(changes)
+            dropped = max(0, len(self._changes) - self.MAX_CHANGES)
+            if dropped:
+                self._changes = self._changes[dropped:]
+                self._offset += dropped
+
+
+    def poll(self, cursor):
+        with self._lock:
+            return self._offset + len(self._changes), self._changes[max(0, cursor - self._offset):]
+
+
+
+class ChallengeIndex(object):
+    """
+    Dictionary of the live challenges in the challenge store, kept in sync by polling a :class:`ChangeFeed`.
+    """
+    def __init__(self, feed):
+        self.feed = feed
+        # Maps tokens to (body, domain, expiry timestamp) tuples
+        self._challenges = {}
+        self._cursor = None
+        self._synced_at = None
+        self._swept_at = None
+        self._lock = threading.Lock()
+
+
+    def is_due(self):
+        """
+        Return True if the index hasn't been built yet, or was last synced more than
+        ``CERTBOT_DJANGO_INDEX_MAX_STALENESS`` seconds ago.
+        """
+        return self._synced_at is None or time.monotonic() - self._synced_at >= get_max_staleness()
+
+
+    def sync(self):
+        """
+        Apply every change published since the last sync, or rebuild the index from the challenge store if it
+        hasn't been built yet or hasn't been synced for longer than the feed keeps changes. Only one thread
+        syncs at a time. Others keep serving the current index meanwhile, unless it hasn't been built yet.
+        """
+        if not self._lock.acquire(self._synced_at is None):
+            return
+        try:
+            if not self.is_due():
+                return
+            now = time.monotonic()
+            if self._synced_at is None or now - self._synced_at >= get_retention():
+                self._rebuild()
+                self._swept_at = now
+            else:
+                self._cursor, changes = self.feed.poll(self._cursor)
+                self.apply(changes)
+                if now - self._swept_at >= get_retention():
+                    self._sweep()
+                    self._swept_at = now
+            self._synced_at = now
+        finally:
+            self._lock.release()
+
+
+    def _rebuild(self):
+        # Take the cursor first, so that changes made while the store is read are applied afterwards
+        self._cursor = self.feed.get_cursor()
+        self._challenges = {challenge: self._entry(response, domain, expires_at)
+                            for challenge, response, domain, expires_at in stores.get_store().list_live()}
+
+
+    def _sweep(self):
+        # Deletes of expired challenges aren't published, so drop them here instead
+        now = time.time()
+        for challenge in [challenge for challenge, entry in list(self._challenges.items()) if entry[2] <= now]:
+            entry = self._challenges.get(challenge)
+            if entry is not None and entry[2] <= now:
+                self._challenges.pop(challenge, None)
+
+
+    def _entry(self, response, domain, expires_at):
+        return (make_body(response), domain, expires_at.timestamp())
+
+
+    def apply(self, changes):
+        """
+        Apply a list of :class:`Change` tuples to the index.
+        """
+        for change in changes:
+            if change.deleted:
+                self._challenges.pop(change.challenge, None)
+            else:
+                self._challenges[change.challenge] = self._entry(change.response, change.domain, change.expires_at)
+
+
+    def get_body(self, challenge, domain=None):
+        """
+        Return the encoded body for the given challenge token if it's indexed, hasn't expired, and is served
+        for the given (normalized) domain, otherwise None.
+        """
+        entry = self._challenges.get(challenge)
+        if entry is None or entry[2] <= time.time() or not domain_matches(entry[1], domain):
+            return None
+        return entry[0]
+
+
+    def clear(self):
+        """
+        Forget every indexed challenge. The index is rebuilt on its next use.
+        """
+        with self._lock:
+            self._challenges = {}
+            self._cursor = None
+            self._synced_at = None
+            self._swept_at = None
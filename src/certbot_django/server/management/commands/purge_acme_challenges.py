@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from ... import index
+from ...models import AcmeChallenge, normalize_domain
+import time
+
+
+class Command(BaseCommand):
+    help = 'Delete expired ACME challenges in batches, optionally only those for one domain'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of challenges to delete per query (default: 1000)')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Seconds to pause between batches, to reduce load on busy databases (default: 0)')
+        parser.add_argument('--domain',
+                            help='Only delete challenges scoped to this domain')
+        parser.add_argument('--all', action='store_true',
+                            help='Delete challenges which have not expired yet too. Requires --domain.')
+
+    def handle(self, *args, **options):
+        if options['all'] and not options['domain']:
+            raise CommandError('--all requires --domain')
+
+        batch_size = options['batch_size']
+        if options['all']:
+            queryset, description = AcmeChallenge.objects.all(), 'ACME challenges'
+        else:
+            queryset, description = AcmeChallenge.objects.expired(), 'expired ACME challenges'
+        if options['domain']:
+            domain = normalize_domain(options['domain'])
+            # Filtering on domain lets the (domain, challenge) index drive the lookup
+            queryset = queryset.filter(domain=domain)
+            description = '{} for {}'.format(description, domain)
+
+        total = 0
+        while True:
+            # Deleting by primary key keeps each DELETE small, so no single statement holds locks for long
+            pks = list(queryset.order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            with index.batch():
+                deleted, _ = AcmeChallenge.objects.filter(pk__in=pks).delete()
+            total += deleted
+            if options['verbosity'] >= 2:
+                self.stdout.write('Deleted {} {}'.format(deleted, description))
+            if len(pks) < batch_size:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write('Purged {} {}'.format(total, description))
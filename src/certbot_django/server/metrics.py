@@ -0,0 +1,225 @@
+"""
+Optional in-process metrics for challenge traffic.
+
+Enable them by setting ``CERTBOT_DJANGO_METRICS = True``. Counters and latency histograms are aggregated in
+memory by each process, so recording them never touches the database. They're served in the Prometheus
+text format by the ``acmechallenge-metrics`` view.
+
+.. code-block:: python
+
+    # myproject/settings.py
+    CERTBOT_DJANGO_METRICS = True
+    CERTBOT_DJANGO_METRICS_TOKEN = 'a-long-random-string'  # Optional. Otherwise only staff users may read them.
+
+Like any in-process metrics, each worker process keeps its own totals. Scrape each process separately, or
+sum the series across processes.
+"""
+from django.conf import settings
+import bisect
+import threading
+
+
+#: Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+#: Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SOURCE_VIEW = 'view'
+SOURCE_ASYNC_VIEW = 'async_view'
+SOURCE_RESPONDER = 'responder'
+
+
+def is_enabled():
+    return bool(getattr(settings, 'CERTBOT_DJANGO_METRICS', False))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                                    for name, value in pairs))
+
+
+def _format_value(value):
+    return repr(float(value))
+
+
+class Counter(object):
+    """
+    A monotonically increasing count, optionally split by labels.
+    """
+    type = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+    def get(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labels), 0)
+
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return ['{}{} {}'.format(self.name, _format_labels(self.labels, key), _format_value(value)) for key, value in values]
+
+
+
+class Histogram(object):
+    """
+    Counts of observations in fixed buckets, plus their sum, optionally split by labels.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, one for observations above the last bucket, and the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+
+    def get_count(self, **labels):
+        counts = self._values.get(tuple(str(labels[name]) for name in self.labels))
+        return sum(counts[:-1]) if counts else 0
+
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+
+    def collect(self):
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        lines = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'), ), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append('{}_bucket{} {}'.format(self.name, _format_labels(self.labels, key, [('le', le)]), _format_value(cumulative)))
+            lines.append('{}_sum{} {}'.format(self.name, _format_labels(self.labels, key), _format_value(counts[-1])))
+            lines.append('{}_count{} {}'.format(self.name, _format_labels(self.labels, key), _format_value(cumulative)))
+        return lines
+
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+
+    def reset(self):
+        for metric in self.metrics:
+            metric.reset()
+
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help_text))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+
+registry = Registry()
+
+validation_requests = registry.register(Counter(
+    'certbot_django_validation_requests_total',
+    'ACME validation requests answered, by where they were answered and whether the challenge was found.',
+    ('source', 'result')))
+
+validation_seconds = registry.register(Histogram(
+    'certbot_django_validation_seconds',
+    'Seconds taken to look up the response to ACME validation requests.',
+    ('source', )))
+
+api_requests = registry.register(Counter(
+    'certbot_django_api_requests_total',
+    'Challenge API requests, by action, method, and response status.',
+    ('action', 'method', 'status')))
+
+api_seconds = registry.register(Histogram(
+    'certbot_django_api_seconds',
+    'Seconds taken to handle challenge API requests, including authentication.',
+    ('action', 'method')))
+
+challenges_created = registry.register(Counter(
+    'certbot_django_challenges_created_total',
+    'Challenges created through the API.'))
+
+challenges_deleted = registry.register(Counter(
+    'certbot_django_challenges_deleted_total',
+    'Challenges deleted through the API.'))
+
+
+def observe_validation(source, found, seconds):
+    """
+    Record a validation request answered by ``source``, which took ``seconds`` to look up.
+    """
+    if not is_enabled():
+        return
+    validation_requests.inc(source=source, result='hit' if found else 'miss')
+    validation_seconds.observe(seconds, source=source)
+
+
+def observe_api(action, method, status, seconds):
+    if not is_enabled():
+        return
+    api_requests.inc(action=action, method=method, status=status)
+    api_seconds.observe(seconds, action=action, method=method)
+
+
+def count_created(count):
+    if is_enabled() and count:
+        challenges_created.inc(count)
+
+
+def count_deleted(count):
+    if is_enabled() and count:
+        challenges_deleted.inc(count)
+
+
+def render():
+    return registry.render()
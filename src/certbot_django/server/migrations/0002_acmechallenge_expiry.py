@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import certbot_django.server.models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='acmechallenge',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text='When this challenge was created'),
+        ),
+        migrations.AddField(
+            model_name='acmechallenge',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True, default=certbot_django.server.models.default_expires_at, help_text='When this challenge stops being served and may be purged'),
+        ),
+    ]
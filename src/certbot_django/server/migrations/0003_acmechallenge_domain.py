@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0002_acmechallenge_expiry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='acmechallenge',
+            name='domain',
+            field=models.CharField(blank=True, default='', help_text='The domain this challenge is served for. Leave blank to serve it for every domain.', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='acmechallenge',
+            index=models.Index(fields=['domain', 'challenge'], name='server_acmechallenge_domain'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0003_acmechallenge_domain'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AcmeChallengeChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('challenge', models.CharField(help_text='The identifier of the changed challenge', max_length=255)),
+                ('response', models.CharField(blank=True, default='', help_text='The new response, unless the challenge was deleted', max_length=255)),
+                ('domain', models.CharField(blank=True, default='', help_text='The domain the challenge is served for', max_length=255)),
+                ('expires_at', models.DateTimeField(blank=True, help_text='When the challenge stops being served', null=True)),
+                ('deleted', models.BooleanField(default=False, help_text='Whether the challenge was deleted')),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False, help_text='When the change was made')),
+            ],
+            options={
+                'verbose_name': 'ACME Challenge Change',
+                'verbose_name_plural': 'ACME Challenge Changes',
+            },
+        ),
+    ]
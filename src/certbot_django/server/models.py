@@ -1,4 +1,66 @@
+from datetime import timedelta
+from django.conf import settings
 from django.db import models
+from django.http.request import split_domain_port
+from django.utils import timezone
+
+
+#: Default number of seconds a challenge remains valid for after it's created
+DEFAULT_CHALLENGE_TTL = 60 * 60 * 24
+
+
+def default_expires_at():
+    ttl = getattr(settings, 'CERTBOT_DJANGO_CHALLENGE_TTL', DEFAULT_CHALLENGE_TTL)
+    return timezone.now() + timedelta(seconds=ttl)
+
+
+def normalize_domain(host):
+    """
+    Normalize a domain or ``Host`` header value for storing and comparing challenge domains, by removing any
+    port and trailing dot and lower-casing it.
+    """
+    if not host:
+        return ''
+    domain, port = split_domain_port(host.lower())
+    # split_domain_port returns an empty domain for hosts it considers invalid, so fall back to the raw host
+    return (domain or host.lower()).rstrip('.')
+
+
+def domain_matches(challenge_domain, domain):
+    """
+    Return True if a challenge scoped to ``challenge_domain`` may be served for requests to ``domain``.
+    Challenges without a domain are served for every host, and a ``domain`` of None matches every challenge.
+    """
+    return domain is None or not challenge_domain or challenge_domain == domain
+
+
+def make_body(response):
+    """
+    Return the body served for a validation request: the response and a trailing newline, encoded as UTF-8.
+    """
+    return '{}\n'.format(response).encode('utf-8')
+
+
+class AcmeChallengeQuerySet(models.QuerySet):
+    def live(self):
+        """
+        Filter to challenges which haven't expired yet
+        """
+        return self.filter(expires_at__gt=timezone.now())
+
+    def expired(self):
+        """
+        Filter to challenges which have expired
+        """
+        return self.filter(expires_at__lte=timezone.now())
+
+    def for_domain(self, domain):
+        """
+        Filter to challenges which may be served for requests to the given domain. See :func:`domain_matches`.
+        """
+        if domain is None:
+            return self
+        return self.filter(domain__in=('', domain))
 
 
 class AcmeChallenge(models.Model):
@@ -7,11 +69,43 @@ class AcmeChallenge(models.Model):
     """
     challenge = models.CharField(unique=True, max_length=255, help_text='The identifier for this challenge')
     response = models.CharField(max_length=255, help_text='The response expected for this challenge')
+    domain = models.CharField(max_length=255, blank=True, default='',
+                              help_text='The domain this challenge is served for. Leave blank to serve it for every domain.')
+    created = models.DateTimeField(default=timezone.now, editable=False, help_text='When this challenge was created')
+    expires_at = models.DateTimeField(default=default_expires_at, db_index=True,
+                                      help_text='When this challenge stops being served and may be purged')
+
+    objects = AcmeChallengeQuerySet.as_manager()
 
 
     class Meta:
         verbose_name = 'ACME Challenge'
         verbose_name_plural = 'ACME Challenges'
+        indexes = [
+            models.Index(fields=['domain', 'challenge'], name='server_acmechallenge_domain'),
+        ]
+
+    def __str__(self):
+        return self.challenge
+
+
+class AcmeChallengeChange(models.Model):
+    """
+    A challenge created, replaced, or deleted through the API. Read by the in-process challenge index's
+    :class:`DatabaseFeed <certbot_django.server.index.DatabaseFeed>`, which uses the ``id`` as a watermark.
+    """
+    challenge = models.CharField(max_length=255, help_text='The identifier of the changed challenge')
+    response = models.CharField(max_length=255, blank=True, default='',
+                                help_text='The new response, unless the challenge was deleted')
+    domain = models.CharField(max_length=255, blank=True, default='', help_text='The domain the challenge is served for')
+    expires_at = models.DateTimeField(null=True, blank=True, help_text='When the challenge stops being served')
+    deleted = models.BooleanField(default=False, help_text='Whether the challenge was deleted')
+    created = models.DateTimeField(default=timezone.now, db_index=True, editable=False, help_text='When the change was made')
+
+
+    class Meta:
+        verbose_name = 'ACME Challenge Change'
+        verbose_name_plural = 'ACME Challenge Changes'
 
     def __str__(self):
         return self.challenge
@@ -0,0 +1,23 @@
+from rest_framework import permissions
+from .models import AcmeChallenge
+
+
+class AcmeChallengePermissions(permissions.DjangoModelPermissions):
+    """
+    Require the Django model permissions for :class:`AcmeChallenge <certbot_django.server.models.AcmeChallenge>`
+    which match the request method. Unlike ``DjangoModelPermissions``, this doesn't need the view to have a
+    queryset, so it works whichever challenge store is configured.
+
+    PUT creates or replaces challenges, so it needs the add and delete permissions which the certbot user
+    already has, rather than the change permission.
+    """
+    perms_map = dict(permissions.DjangoModelPermissions.perms_map, PUT=[
+        '%(app_label)s.add_%(model_name)s',
+        '%(app_label)s.delete_%(model_name)s',
+    ])
+
+    def has_permission(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return False
+        perms = self.get_required_permissions(request.method, AcmeChallenge)
+        return request.user.has_perms(perms)
@@ -0,0 +1,123 @@
+"""
+WSGI and ASGI wrappers which answer ACME HTTP-01 validation requests before they reach Django.
+
+Validation requests normally run through the whole ``MIDDLEWARE`` stack, URL resolution, and template
+rendering. Wrapping your project's application with one of these classes short-circuits requests for
+``/.well-known/acme-challenge/<token>`` and answers them straight from the challenge store. Every other
+request is passed through to the wrapped application untouched.
+
+.. code-block:: python
+
+    # myproject/wsgi.py
+    from django.core.wsgi import get_wsgi_application
+    from certbot_django.server.responder import ChallengeResponderWSGI
+
+    application = ChallengeResponderWSGI(get_wsgi_application())
+"""
+from django.core.signals import request_started, request_finished
+import time
+
+
+#: Default URL path prefix for ACME HTTP-01 validation requests
+DEFAULT_PREFIX = '/.well-known/acme-challenge/'
+
+_METHODS = ('GET', 'HEAD')
+_CONTENT_TYPE = 'text/plain'
+_NOT_FOUND = b'Not Found\n'
+
+
+def lookup_response(challenge, host=None):
+    """
+    Return the response for the given challenge token, or None if it doesn't exist or isn't served for
+    the given ``Host`` header.
+    """
+    # Imported here so that this module can be imported from wsgi.py / asgi.py before Django is set up.
+    from .models import normalize_domain
+    from .stores import get_store
+    return get_store().get_response(challenge, normalize_domain(host))
+
+
+def lookup_body(challenge, host=None):
+    """
+    Return the encoded body to serve for the given challenge token, or None if it doesn't exist or isn't
+    served for the given ``Host`` header.
+    """
+    from .models import normalize_domain
+    from . import index
+    return index.get_body(challenge, normalize_domain(host))
+
+
+def render_response(challenge, sender=None, host=None):
+    """
+    Return a tuple of ``(status_code, body)`` for a validation request for the given challenge token and host.
+    """
+    # Send the same signals as Django's own request handlers, so that database connections are
+    # recycled according to CONN_MAX_AGE.
+    from . import metrics
+    request_started.send(sender=sender)
+    try:
+        start = time.perf_counter()
+        body = lookup_body(challenge, host) if challenge else None
+        metrics.observe_validation(metrics.SOURCE_RESPONDER, body is not None, time.perf_counter() - start)
+    finally:
+        request_finished.send(sender=sender)
+    if body is None:
+        return 404, _NOT_FOUND
+    return 200, body
+
+
+class ChallengeResponderWSGI(object):
+    """
+    WSGI middleware which answers ACME validation requests without invoking the wrapped application.
+    """
+    def __init__(self, application, prefix=DEFAULT_PREFIX):
+        self.application = application
+        self.prefix = prefix
+
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix) or environ.get('REQUEST_METHOD') not in _METHODS:
+            return self.application(environ, start_response)
+
+        host = environ.get('HTTP_HOST') or environ.get('SERVER_NAME')
+        status_code, body = render_response(path[len(self.prefix):], self.__class__, host)
+        status = '200 OK' if status_code == 200 else '404 Not Found'
+        start_response(status, [
+            ('Content-Type', _CONTENT_TYPE),
+            ('Content-Length', str(len(body))),
+        ])
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return [b'']
+        return [body]
+
+
+class ChallengeResponderASGI(object):
+    """
+    ASGI middleware which answers ACME validation requests without invoking the wrapped application.
+    """
+    def __init__(self, application, prefix=DEFAULT_PREFIX):
+        self.application = application
+        self.prefix = prefix
+
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get('path', '')
+        if scope['type'] != 'http' or not path.startswith(self.prefix) or scope.get('method') not in _METHODS:
+            return await self.application(scope, receive, send)
+
+        from asgiref.sync import sync_to_async
+        host = dict(scope.get('headers', [])).get(b'host', b'').decode('latin1') or (scope.get('server') or ('', ))[0]
+        status_code, body = await sync_to_async(render_response, thread_sensitive=True)(path[len(self.prefix):], self.__class__, host)
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': [
+                (b'content-type', _CONTENT_TYPE.encode('ascii')),
+                (b'content-length', str(len(body)).encode('ascii')),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'' if scope['method'] == 'HEAD' else body,
+        })
@@ -0,0 +1,78 @@
+"""
+Database router which sends the reads that answer validation requests to a read replica.
+
+Validation requests arrive in bursts, and by default every one of them queries the primary database alongside
+the rest of your application. To read them from a replica instead, add the router to ``DATABASE_ROUTERS`` and
+set ``CERTBOT_DJANGO_REPLICA_DATABASE`` to the replica's alias.
+
+.. code-block:: python
+
+    # myproject/settings.py
+    DATABASE_ROUTERS = ['certbot_django.server.routers.ReplicaRouter']
+    CERTBOT_DJANGO_REPLICA_DATABASE = 'replica'
+
+Only the lookups made by the validation view, the async validation view, the standalone responder, and the
+response cache are routed to the replica. The challenge API reads and writes the primary as before. A
+challenge which isn't found on the replica is looked up again on the primary, so challenges which the
+coordinator has only just created are served even if they haven't replicated yet.
+"""
+from django.conf import settings
+from django.db import router
+
+
+#: Hint given to routers for queries which answer validation requests
+PROBE_HINT = 'certbot_django_probe'
+
+
+def get_replica():
+    return getattr(settings, 'CERTBOT_DJANGO_REPLICA_DATABASE', None)
+
+
+def probe_queryset(model):
+    """
+    Return a queryset for ``model`` whose reads are routed as validation requests.
+    """
+    return model._default_manager.db_manager(hints={PROBE_HINT: True}).all()
+
+
+def _get_primary(queryset):
+    return router.db_for_write(queryset.model)
+
+
+def first(queryset):
+    """
+    Return the first result of ``queryset``, or None. If the query was routed to a replica and found nothing,
+    it's retried on the primary database.
+    """
+    row = queryset.first()
+    primary = _get_primary(queryset)
+    if row is None and queryset.db != primary:
+        row = queryset.using(primary).first()
+    return row
+
+
+async def afirst(queryset):
+    """
+    Async version of :func:`first`. Uses Django's async ORM API when it's available (Django 4.1) and runs the
+    sync version in a thread otherwise.
+    """
+    from asgiref.sync import sync_to_async
+    if not hasattr(queryset, 'afirst'):
+        return await sync_to_async(first)(queryset)
+    row = await queryset.afirst()
+    primary = _get_primary(queryset)
+    if row is None and queryset.db != primary:
+        row = await queryset.using(primary).afirst()
+    return row
+
+
+
+class ReplicaRouter(object):
+    """
+    Route validation request lookups to the database named by ``CERTBOT_DJANGO_REPLICA_DATABASE``. Every
+    other query is left to the next router, or to the default database.
+    """
+    def db_for_read(self, model, **hints):
+        if hints.get(PROBE_HINT):
+            return get_replica()
+        return None
@@ -1,14 +1,30 @@
 from rest_framework import serializers
 from rest_framework.reverse import reverse
-from .models import AcmeChallenge
 
 
-class AcmeChallengeSerializer(serializers.ModelSerializer):
+class AcmeChallengeSerializer(serializers.Serializer):
+    """
+    Serialize challenges returned by a :class:`ChallengeStore <certbot_django.server.stores.ChallengeStore>`.
+    """
+    challenge = serializers.CharField(max_length=255)
+    response = serializers.CharField(max_length=255)
+    domain = serializers.CharField(max_length=255, allow_blank=True, default='')
     acme_url = serializers.SerializerMethodField()
-
-    class Meta:
-        model = AcmeChallenge
-        fields = ('challenge', 'response', 'acme_url')
+    created = serializers.DateTimeField(read_only=True)
+    expires_at = serializers.DateTimeField(read_only=True)
 
     def get_acme_url(self, obj):
         return reverse(viewname='acmechallenge-response', args=(obj.challenge, ), request=self.context['request'])
+
+
+class AcmeChallengeBulkSerializer(serializers.Serializer):
+    """
+    Validate a single item of a bulk create request.
+    """
+    challenge = serializers.CharField(max_length=255)
+    response = serializers.CharField(max_length=255)
+    domain = serializers.CharField(max_length=255, allow_blank=True, default='')
+
+
+class AcmeChallengeBulkDeleteSerializer(serializers.Serializer):
+    challenges = serializers.ListField(child=serializers.CharField(max_length=255), allow_empty=False)
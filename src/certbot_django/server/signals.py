@@ -0,0 +1,45 @@
+from asymmetric_jwt_auth.models import PublicKey
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import AcmeChallenge
+from . import authentication, cache, index
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=AcmeChallenge)
+def cache_challenge(sender, instance, **kwargs):
+    if cache.is_enabled():
+        cache.set_response(instance)
+
+
+@receiver(post_delete, sender=AcmeChallenge)
+def uncache_challenge(sender, instance, **kwargs):
+    if cache.is_enabled():
+        cache.delete_response(instance.challenge)
+
+
+@receiver(post_save, sender=AcmeChallenge)
+def publish_challenge(sender, instance, using, **kwargs):
+    index.publish_on_commit(index.saved([instance]), using=using)
+
+
+@receiver(post_delete, sender=AcmeChallenge)
+def unpublish_challenge(sender, instance, using, **kwargs):
+    # Expired challenges are never served from the index, so purging them needn't flood the feed
+    if instance.expires_at > timezone.now():
+        index.publish_on_commit(index.deleted([instance.challenge]), using=using)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=PublicKey)
+@receiver(post_delete, sender=PublicKey)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def clear_authentication_cache(sender, **kwargs):
+    authentication.clear_cache()
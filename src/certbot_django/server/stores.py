@@ -0,0 +1,480 @@
+"""
+Pluggable storage for ACME challenges.
+
+Select a backend with the ``CERTBOT_DJANGO_STORE`` setting, which should be the dotted path to a
+:class:`ChallengeStore` subclass. Defaults to :class:`DatabaseStore`.
+
+.. code-block:: python
+
+    # myproject/settings.py
+    CERTBOT_DJANGO_STORE = 'certbot_django.server.stores.CacheStore'
+    CERTBOT_DJANGO_STORE_CACHE = 'default'
+"""
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, connection, router, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import AcmeChallenge, default_expires_at, domain_matches, make_body, normalize_domain
+from . import cache, index, routers
+import threading
+
+
+#: Default value of the ``CERTBOT_DJANGO_STORE`` setting
+DEFAULT_STORE = 'certbot_django.server.stores.DatabaseStore'
+
+#: Content type of the bodies returned by :meth:`ChallengeStore.get_body`
+CONTENT_TYPE = 'text/plain'
+
+#: Challenge data returned by stores which don't keep challenges in the database
+Challenge = namedtuple('Challenge', ('challenge', 'response', 'created', 'expires_at', 'domain'))
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class ChallengeExists(Exception):
+    """
+    Raised when creating challenges which already exist
+    """
+    def __init__(self, challenges):
+        self.challenges = challenges
+        super(ChallengeExists, self).__init__('ACME Challenge with this challenge already exists: {}'.format(', '.join(challenges)))
+
+
+def get_store():
+    """
+    Return the configured :class:`ChallengeStore`. Stores are created once per process.
+    """
+    path = getattr(settings, 'CERTBOT_DJANGO_STORE', DEFAULT_STORE)
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = _stores[path] = import_string(path)()
+    return store
+
+
+def _new_challenge(challenge, response, domain=''):
+    return Challenge(challenge=challenge, response=response, created=timezone.now(), expires_at=default_expires_at(),
+                     domain=normalize_domain(domain))
+
+
+def _new_challenges(items):
+    # Later items replace earlier ones with the same token, as if they'd been upserted one at a time
+    return list(OrderedDict((obj.challenge, obj) for obj in (_new_challenge(*item) for item in items)).values())
+
+
+def _is_live(obj, domain):
+    return obj is not None and obj.expires_at > timezone.now() and domain_matches(obj.domain, domain)
+
+
+class ChallengeStore(object):
+    """
+    Interface for challenge storage backends. Challenges are returned as objects with ``challenge``,
+    ``response``, ``domain``, ``created``, and ``expires_at`` attributes.
+
+    A challenge with a ``domain`` is only served for validation requests to that host. Challenges with a
+    blank ``domain`` are served for every host.
+
+    Stores which change challenges should publish the changes to the in-process challenge index, using
+    :func:`index.publish <certbot_django.server.index.publish>`, or
+    :func:`index.publish_on_commit <certbot_django.server.index.publish_on_commit>` for changes made in a
+    database transaction.
+    """
+    #: True if challenges are stored as :class:`AcmeChallenge <certbot_django.server.models.AcmeChallenge>` rows
+    uses_database = False
+
+
+    def get_response(self, challenge, domain=None):
+        """
+        Return the response for the given challenge token if it exists, hasn't expired, and is served for
+        the given (normalized) domain, otherwise None. A ``domain`` of None skips the domain check. This is
+        the hot path used to answer validation requests.
+        """
+        obj = self.get(challenge)
+        return obj.response if _is_live(obj, domain) else None
+
+
+    async def aget_response(self, challenge, domain=None):
+        """
+        Async version of :meth:`get_response`.
+        """
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(self.get_response)(challenge, domain)
+
+
+    def get_body(self, challenge, domain=None):
+        """
+        Like :meth:`get_response`, but return the encoded body to serve (see
+        :func:`make_body <certbot_django.server.models.make_body>`), so that validation views and the responder
+        can send it without any further work. Stores which can keep the encoded body alongside each challenge
+        should override this.
+        """
+        response = self.get_response(challenge, domain)
+        return None if response is None else make_body(response)
+
+
+    async def aget_body(self, challenge, domain=None):
+        """
+        Async version of :meth:`get_body`.
+        """
+        response = await self.aget_response(challenge, domain)
+        return None if response is None else make_body(response)
+
+
+    def get(self, challenge):
+        """
+        Return the given challenge, whether or not it has expired, or None if it doesn't exist.
+        """
+        raise NotImplementedError()
+
+
+    def list(self, domain=None):
+        """
+        Return a list of every stored challenge, or only those scoped to ``domain`` if it's given.
+        """
+        raise NotImplementedError()
+
+
+    def list_live(self):
+        """
+        Return an iterable of ``(challenge, response, domain, expires_at)`` tuples for every challenge which
+        hasn't expired. The in-process challenge index is built from it, so stores should override it with
+        something cheaper than :meth:`list` where they can.
+        """
+        now = timezone.now()
+        return [(obj.challenge, obj.response, obj.domain, obj.expires_at) for obj in self.list() if obj.expires_at > now]
+
+
+    def create(self, items):
+        """
+        Create challenges from a list of ``(challenge, response)`` or ``(challenge, response, domain)``
+        tuples and return them. Raises :class:`ChallengeExists` without creating anything if any of the
+        challenges already exist.
+        """
+        raise NotImplementedError()
+
+
+    def update(self, challenge, response):
+        """
+        Change the response for an existing challenge. Returns the updated challenge, or None if it
+        doesn't exist.
+        """
+        raise NotImplementedError()
+
+
+    def upsert(self, items):
+        """
+        Create or replace challenges from a list of ``(challenge, response)`` or ``(challenge, response, domain)``
+        tuples and return them. Replaced challenges get a new response, domain, and expiry time. Unlike
+        :meth:`create`, this never fails because a challenge already exists, so it's safe to retry, and
+        concurrent upserts of the same token both succeed.
+        """
+        raise NotImplementedError()
+
+
+    def delete(self, challenges):
+        """
+        Delete the given challenge tokens and return how many were deleted.
+        """
+        raise NotImplementedError()
+
+
+
+class DatabaseStore(ChallengeStore):
+    """
+    Store challenges as :class:`AcmeChallenge <certbot_django.server.models.AcmeChallenge>` rows. If
+    ``CERTBOT_DJANGO_CACHE`` is set, responses are read through the cache.
+    """
+    uses_database = True
+
+
+    def _get_response_queryset(self, challenge, domain):
+        queryset = routers.probe_queryset(AcmeChallenge).live().for_domain(domain)
+        return queryset.filter(challenge=challenge).values_list('response', flat=True)
+
+
+    def get_response(self, challenge, domain=None):
+        if cache.is_enabled():
+            return cache.get_response(challenge, domain)
+        return routers.first(self._get_response_queryset(challenge, domain))
+
+
+    async def aget_response(self, challenge, domain=None):
+        if cache.is_enabled():
+            return await cache.aget_response(challenge, domain)
+        return await routers.afirst(self._get_response_queryset(challenge, domain))
+
+
+    def get_body(self, challenge, domain=None):
+        if cache.is_enabled():
+            return cache.get_body(challenge, domain)
+        return super(DatabaseStore, self).get_body(challenge, domain)
+
+
+    async def aget_body(self, challenge, domain=None):
+        if cache.is_enabled():
+            return await cache.aget_body(challenge, domain)
+        return await super(DatabaseStore, self).aget_body(challenge, domain)
+
+
+    def get(self, challenge):
+        return AcmeChallenge.objects.filter(challenge=challenge).first()
+
+
+    def list(self, domain=None):
+        queryset = AcmeChallenge.objects.all()
+        if domain is not None:
+            queryset = queryset.filter(domain=normalize_domain(domain))
+        return list(queryset.order_by('challenge'))
+
+
+    def list_live(self):
+        # Reads the primary, like the rest of the API, since a lagging replica could miss recent challenges
+        return AcmeChallenge.objects.live().values_list('challenge', 'response', 'domain', 'expires_at').iterator()
+
+
+    def create(self, items):
+        challenges = [AcmeChallenge(challenge=obj.challenge, response=obj.response, domain=obj.domain)
+                      for obj in (_new_challenge(*item) for item in items)]
+        tokens = [c.challenge for c in challenges]
+        try:
+            with index.batch(), transaction.atomic():
+                existing = list(AcmeChallenge.objects.filter(challenge__in=tokens).values_list('challenge', flat=True))
+                if existing:
+                    raise ChallengeExists(existing)
+                if len(challenges) == 1:
+                    challenges[0].save()
+                else:
+                    AcmeChallenge.objects.bulk_create(challenges)
+        except IntegrityError:
+            # Another request created one of the challenges between our check and insert
+            raise ChallengeExists(tokens)
+        # bulk_create doesn't send post_save, so populate the cache and index here instead
+        if len(challenges) > 1:
+            if cache.is_enabled():
+                cache.set_responses(challenges)
+            index.publish_on_commit(index.saved(challenges), using=router.db_for_write(AcmeChallenge))
+        return challenges
+
+
+    def update(self, challenge, response):
+        obj = self.get(challenge)
+        if obj is None:
+            return None
+        obj.response = response
+        obj.save()
+        return obj
+
+
+    def upsert(self, items):
+        challenges = [AcmeChallenge(challenge=obj.challenge, response=obj.response, domain=obj.domain, expires_at=obj.expires_at)
+                      for obj in _new_challenges(items)]
+        update_fields = ['response', 'domain', 'expires_at']
+        features = connection.features
+        if getattr(features, 'supports_update_conflicts', False):
+            # Django 4.1+ can do this as a single INSERT ... ON CONFLICT DO UPDATE
+            kwargs = {'update_conflicts': True, 'update_fields': update_fields}
+            if getattr(features, 'supports_update_conflicts_with_target', False):
+                kwargs['unique_fields'] = ['challenge']
+            AcmeChallenge.objects.bulk_create(challenges, **kwargs)
+            # bulk_create doesn't send post_save, so populate the cache and index here instead
+            if cache.is_enabled():
+                cache.set_responses(challenges)
+            index.publish_on_commit(index.saved(challenges), using=router.db_for_write(AcmeChallenge))
+            return challenges
+
+        # update_or_create locks existing rows and retries the lookup if a concurrent insert wins the race
+        with index.batch(), transaction.atomic():
+            return [AcmeChallenge.objects.update_or_create(
+                challenge=obj.challenge, defaults={name: getattr(obj, name) for name in update_fields})[0]
+                for obj in challenges]
+
+
+    def delete(self, challenges):
+        with index.batch():
+            deleted, _ = AcmeChallenge.objects.filter(challenge__in=challenges).delete()
+        return deleted
+
+
+
+class CacheStore(ChallengeStore):
+    """
+    Store challenges only in Django's cache framework, using the cache named by ``CERTBOT_DJANGO_STORE_CACHE``
+    (default ``'default'``). Use a shared cache, such as Memcached or Redis, when running more than one
+    process. Challenges are evicted from the cache when they expire.
+
+    Caches can't enumerate their keys, so :meth:`list` relies on a best-effort index of tokens.
+    """
+    KEY_PREFIX = 'certbot_django:store:'
+    INDEX_KEY = 'certbot_django:store-index'
+
+
+    def _get_cache(self):
+        return caches[getattr(settings, 'CERTBOT_DJANGO_STORE_CACHE', 'default')]
+
+
+    def _timeout(self, obj):
+        return max(1, int((obj.expires_at - timezone.now()).total_seconds()))
+
+
+    def get(self, challenge):
+        value = self._get_cache().get(self.KEY_PREFIX + challenge)
+        return Challenge(*value) if value else None
+
+
+    def list(self, domain=None):
+        cache = self._get_cache()
+        tokens = cache.get(self.INDEX_KEY) or []
+        values = cache.get_many([self.KEY_PREFIX + token for token in tokens])
+        challenges = [Challenge(*value) for value in values.values()]
+        if domain is not None:
+            domain = normalize_domain(domain)
+            challenges = [obj for obj in challenges if obj.domain == domain]
+        return sorted(challenges, key=lambda obj: obj.challenge)
+
+
+    def _update_index(self, add=(), remove=()):
+        cache = self._get_cache()
+        tokens = set(cache.get(self.INDEX_KEY) or [])
+        tokens.update(add)
+        tokens.difference_update(remove)
+        # Drop tokens whose challenges have already expired out of the cache
+        live = cache.get_many([self.KEY_PREFIX + token for token in tokens])
+        cache.set(self.INDEX_KEY, [token for token in tokens if self.KEY_PREFIX + token in live], None)
+
+
+    def create(self, items):
+        cache = self._get_cache()
+        challenges = [_new_challenge(*item) for item in items]
+        added = []
+        for obj in challenges:
+            # cache.add is atomic, so concurrent creates of the same token can't both succeed
+            if not cache.add(self.KEY_PREFIX + obj.challenge, tuple(obj), self._timeout(obj)):
+                cache.delete_many([self.KEY_PREFIX + token for token in added])
+                raise ChallengeExists([obj.challenge])
+            added.append(obj.challenge)
+        self._update_index(add=added)
+        index.publish(index.saved(challenges))
+        return challenges
+
+
+    def update(self, challenge, response):
+        obj = self.get(challenge)
+        if obj is None:
+            return None
+        obj = obj._replace(response=response)
+        self._get_cache().set(self.KEY_PREFIX + challenge, tuple(obj), self._timeout(obj))
+        index.publish(index.saved([obj]))
+        return obj
+
+
+    def upsert(self, items):
+        cache = self._get_cache()
+        challenges = _new_challenges(items)
+        for obj in challenges:
+            cache.set(self.KEY_PREFIX + obj.challenge, tuple(obj), self._timeout(obj))
+        self._update_index(add=[obj.challenge for obj in challenges])
+        index.publish(index.saved(challenges))
+        return challenges
+
+
+    def delete(self, challenges):
+        cache = self._get_cache()
+        keys = [self.KEY_PREFIX + challenge for challenge in challenges]
+        existing = cache.get_many(keys)
+        cache.delete_many(keys)
+        self._update_index(remove=challenges)
+        index.publish(index.deleted(challenges))
+        return len(existing)
+
+
+
+class MemoryStore(ChallengeStore):
+    """
+    Store challenges in a dictionary in the current process. Only suitable for single-process servers and
+    for tests, since challenges aren't shared between processes and are lost on restart.
+
+    Each challenge is kept along with its encoded body, so validation requests are answered with a single
+    dictionary lookup.
+    """
+    def __init__(self):
+        # Maps tokens to (challenge, body) tuples
+        self._challenges = {}
+        self._lock = threading.Lock()
+
+
+    def _set(self, obj):
+        self._challenges[obj.challenge] = (obj, make_body(obj.response))
+
+
+    def get_response(self, challenge, domain=None):
+        obj, body = self._challenges.get(challenge, (None, None))
+        return obj.response if _is_live(obj, domain) else None
+
+
+    def get_body(self, challenge, domain=None):
+        obj, body = self._challenges.get(challenge, (None, None))
+        return body if _is_live(obj, domain) else None
+
+
+    async def aget_body(self, challenge, domain=None):
+        return self.get_body(challenge, domain)
+
+
+    def get(self, challenge):
+        return self._challenges.get(challenge, (None, None))[0]
+
+
+    def list(self, domain=None):
+        now = timezone.now()
+        with self._lock:
+            for token in [token for token, (obj, body) in self._challenges.items() if obj.expires_at <= now]:
+                del self._challenges[token]
+            challenges = [obj for obj, body in self._challenges.values()]
+        if domain is not None:
+            domain = normalize_domain(domain)
+            challenges = [obj for obj in challenges if obj.domain == domain]
+        return sorted(challenges, key=lambda obj: obj.challenge)
+
+
+    def create(self, items):
+        challenges = [_new_challenge(*item) for item in items]
+        with self._lock:
+            existing = [obj.challenge for obj in challenges if obj.challenge in self._challenges]
+            if existing:
+                raise ChallengeExists(existing)
+            for obj in challenges:
+                self._set(obj)
+        index.publish(index.saved(challenges))
+        return challenges
+
+
+    def update(self, challenge, response):
+        with self._lock:
+            obj = self.get(challenge)
+            if obj is None:
+                return None
+            obj = obj._replace(response=response)
+            self._set(obj)
+        index.publish(index.saved([obj]))
+        return obj
+
+
+    def upsert(self, items):
+        challenges = _new_challenges(items)
+        with self._lock:
+            for obj in challenges:
+                self._set(obj)
+        index.publish(index.saved(challenges))
+        return challenges
+
+
+    def delete(self, challenges):
+        with self._lock:
+            deleted = len([self._challenges.pop(challenge) for challenge in challenges if challenge in self._challenges])
+        index.publish(index.deleted(challenges))
+        return deleted
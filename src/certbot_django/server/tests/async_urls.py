@@ -0,0 +1,7 @@
+from django.conf.urls import include, url
+import certbot_django.server.async_urls
+
+
+urlpatterns = [
+    url(r'^\.well-known/', include(certbot_django.server.async_urls))
+]
@@ -0,0 +1,41 @@
+"""
+The challenge API as it was before challenges could be upserted or sent in bulk, for testing that the
+coordinator still works with servers which haven't been upgraded.
+"""
+from django.conf.urls import include, url
+from rest_framework import permissions, serializers, viewsets
+from rest_framework.reverse import reverse
+from rest_framework.routers import SimpleRouter
+from ..authentication import JWTAuthentication
+from ..models import AcmeChallenge
+from .. import views
+
+
+class LegacyAcmeChallengeSerializer(serializers.ModelSerializer):
+    acme_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AcmeChallenge
+        fields = ('challenge', 'response', 'acme_url')
+
+    def get_acme_url(self, obj):
+        return reverse(viewname='acmechallenge-response', args=(obj.challenge, ), request=self.context['request'])
+
+
+
+class LegacyAcmeChallengeViewSet(viewsets.ModelViewSet):
+    queryset = AcmeChallenge.objects.all()
+    serializer_class = LegacyAcmeChallengeSerializer
+    lookup_field = 'challenge'
+    authentication_classes = (JWTAuthentication, )
+    permission_classes = (permissions.IsAdminUser, permissions.DjangoModelPermissions)
+
+
+router = SimpleRouter()
+router.register(r'challenges', LegacyAcmeChallengeViewSet, 'acmechallenge')
+
+
+urlpatterns = [
+    url(r'^\.well-known/acme-challenge/(?P<acme_data>.+)$', views.detail, name='acmechallenge-response'),
+    url(r'^\.well-known/', include(router.urls)),
+]
@@ -0,0 +1,212 @@
+from asymmetric_jwt_auth.models import PublicKey
+from asymmetric_jwt_auth import generate_key_pair, create_auth_header
+from django.contrib.auth.models import User, Permission
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from rest_framework import status
+from urllib.parse import urlsplit
+from ..models import AcmeChallenge
+from .test_views import CoordinatorTestCase
+import django
+import json
+import re
+import requests_mock
+import unittest
+
+try:
+    from asgiref.sync import sync_to_async
+    from django.test import AsyncClient
+except ImportError:
+    sync_to_async = AsyncClient = None
+
+
+@unittest.skipIf(django.VERSION < (3, 1), 'Async views require Django 3.1 or later')
+@override_settings(ROOT_URLCONF='certbot_django.server.tests.async_urls')
+class TestAsyncAcmeChallengeViews(TestCase):
+    def setUp(self):
+        AcmeChallenge.objects.create(challenge='foo', response='bar')
+
+
+    async def test_detail(self):
+        url = reverse('acmechallenge-response', args=('foo', ))
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'bar\n')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+
+
+    async def test_detail_404(self):
+        url = reverse('acmechallenge-response', args=('fake', ))
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        CERTBOT_DJANGO_CACHE='default')
+    async def test_detail_cached(self):
+        url = reverse('acmechallenge-response', args=('foo', ))
+        response = await self.async_client.get(url)
+        self.assertEqual(response.content, b'bar\n')
+        response = await self.async_client.get(reverse('acmechallenge-response', args=('fake', )))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+
+@unittest.skipIf(django.VERSION < (3, 1), 'Async views require Django 3.1 or later')
+@override_settings(ROOT_URLCONF='certbot_django.server.tests.async_urls')
+class TestAsyncAcmeChallengeAPI(TestCase):
+    def setUp(self):
+        self.user_joe = User.objects.create_user(username='joe')
+
+        self.user_certbot = User.objects.create_user(username='certbot')
+        self.user_certbot.is_staff = True
+        self.user_certbot.save()
+        self.user_certbot.user_permissions.add(Permission.objects.get(codename='add_acmechallenge'))
+        self.user_certbot.user_permissions.add(Permission.objects.get(codename='delete_acmechallenge'))
+
+        _priv, _pub = generate_key_pair()
+        self.priv_key_joe = _priv
+        PublicKey.objects.create(key=_pub, comment='Test Key', user=self.user_joe)
+
+        _priv, _pub = generate_key_pair()
+        self.priv_key_certbot = _priv
+        PublicKey.objects.create(key=_pub, comment='Test Key', user=self.user_certbot)
+
+        AcmeChallenge.objects.create(challenge='existing', response='bar')
+
+
+    def _headers(self, username, private_key):
+        if not username:
+            return {}
+        return {'authorization': create_auth_header(username=username, key=private_key)}
+
+
+    async def test_add_challenge(self):
+        matrix = (
+            ('', '', status.HTTP_403_FORBIDDEN),
+            ('joe', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_certbot, status.HTTP_201_CREATED),
+            ('certbot', self.priv_key_certbot, status.HTTP_400_BAD_REQUEST),
+        )
+        url = reverse('acmechallenge-list')
+        data = json.dumps({'challenge': 'foo', 'response': 'bar'})
+        for username, private_key, expected_status in matrix:
+            response = await self.async_client.post(url, data=data, content_type='application/json',
+                                                    **self._headers(username, private_key))
+            self.assertEqual(response.status_code, expected_status)
+            if expected_status == status.HTTP_201_CREATED:
+                self.assertEqual(json.loads(response.content.decode())['response'], 'bar')
+
+
+    async def test_upsert_challenge(self):
+        matrix = (
+            ('', '', status.HTTP_403_FORBIDDEN),
+            ('joe', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_certbot, status.HTTP_200_OK),
+            ('certbot', self.priv_key_certbot, status.HTTP_200_OK),
+        )
+        url = reverse('acmechallenge-detail', args=('existing', ))
+        data = json.dumps({'response': 'new'})
+        for username, private_key, expected_status in matrix:
+            response = await self.async_client.put(url, data=data, content_type='application/json',
+                                                   **self._headers(username, private_key))
+            self.assertEqual(response.status_code, expected_status)
+            if expected_status == status.HTTP_200_OK:
+                self.assertEqual(json.loads(response.content.decode())['response'], 'new')
+
+        response = await self.async_client.put(reverse('acmechallenge-detail', args=('foo', )), data='response=bar',
+                                               content_type='application/x-www-form-urlencoded',
+                                               **self._headers('certbot', self.priv_key_certbot))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content.decode())['challenge'], 'foo')
+
+
+    async def test_method_not_allowed(self):
+        headers = self._headers('certbot', self.priv_key_certbot)
+        response = await self.async_client.get(reverse('acmechallenge-list'), **headers)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        response = await self.async_client.get(reverse('acmechallenge-detail', args=('existing', )), **headers)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+    async def test_remove_challenge(self):
+        matrix = (
+            ('', '', status.HTTP_403_FORBIDDEN),
+            ('joe', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_certbot, status.HTTP_204_NO_CONTENT),
+            ('certbot', self.priv_key_certbot, status.HTTP_404_NOT_FOUND),
+        )
+        url = reverse('acmechallenge-detail', args=('existing', ))
+        for username, private_key, expected_status in matrix:
+            response = await self.async_client.delete(url, **self._headers(username, private_key))
+            self.assertEqual(response.status_code, expected_status)
+
+
+    async def test_bulk(self):
+        url = reverse('acmechallenge-bulk')
+        data = json.dumps([{'challenge': 'foo', 'response': 'bar'}, {'challenge': 'existing', 'response': 'new'}])
+        response = await self.async_client.put(url, data=data, content_type='application/json',
+                                               **self._headers('joe', self.priv_key_joe))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        headers = self._headers('certbot', self.priv_key_certbot)
+        response = await self.async_client.post(url, data=data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await self.async_client.put(url, data=data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['response'] for item in json.loads(response.content.decode())], ['bar', 'new'])
+
+        response = await self.async_client.delete(url, data=json.dumps({'challenges': ['foo', 'existing']}),
+                                                  content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = await self.async_client.get(url, **headers)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+    @override_settings(MIDDLEWARE=[
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+    ])
+    async def test_csrf(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        headers = self._headers('certbot', self.priv_key_certbot)
+        data = json.dumps({'challenge': 'foo', 'response': 'bar'})
+        response = await client.post(reverse('acmechallenge-list'), data=data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = await client.put(reverse('acmechallenge-bulk'), data='[{}]'.format(data), content_type='application/json',
+                                    **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await client.delete(reverse('acmechallenge-detail', args=('foo', )), **headers)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        # Session authenticated requests still need a CSRF token
+        await sync_to_async(client.force_login)(self.user_certbot)
+        response = await client.put(reverse('acmechallenge-detail', args=('foo', )), data=data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+
+@unittest.skipIf(django.VERSION < (3, 1), 'Async views require Django 3.1 or later')
+@override_settings(ROOT_URLCONF='certbot_django.server.tests.async_urls')
+class TestCoordinatorWithAsyncViews(CoordinatorTestCase):
+    def test_bulk(self):
+        from certbot_django.coordinator.tests.test_authenticator import _make_achall
+        domains = ['shop.example.com', 'www.shop.example.com']
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+        with requests_mock.mock() as m:
+            m.register_uri(requests_mock.ANY, re.compile(r'^http://shop\.example\.com/'), content=self._forward)
+            self.auth.perform(achalls)
+            self.assertEqual([(r.method, urlsplit(r.url).path) for r in m.request_history], [
+                ('PUT', '/.well-known/challenges/bulk/'),
+            ])
+            self.assertEqual(sorted(AcmeChallenge.objects.values_list('domain', flat=True)), domains)
+
+            self.auth.cleanup(achalls)
+            self.assertEqual(m.call_count, 2)
+            self.assertEqual(m.request_history[1].method, 'DELETE')
+            self.assertFalse(AcmeChallenge.objects.exists())
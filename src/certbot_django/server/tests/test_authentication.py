@@ -0,0 +1,83 @@
+from asymmetric_jwt_auth.models import PublicKey
+from asymmetric_jwt_auth import generate_key_pair, create_auth_header
+from django.conf import settings
+from django.contrib.auth.models import User, Permission
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from .. import authentication
+import mock
+
+
+class TestJWTAuthentication(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='certbot')
+        self.user.is_staff = True
+        self.user.save()
+        self.user.user_permissions.add(Permission.objects.get(codename='add_acmechallenge'))
+        self.user.user_permissions.add(Permission.objects.get(codename='delete_acmechallenge'))
+
+        self.private_key, public_key = generate_key_pair()
+        self.public_key = PublicKey.objects.create(key=public_key, comment='Test Key', user=self.user)
+        authentication.clear_cache()
+
+
+    def _request(self, header):
+        return RequestFactory().get('/', HTTP_AUTHORIZATION=header)
+
+
+    def test_authenticate(self):
+        header = create_auth_header(username='certbot', key=self.private_key)
+        user = authentication.authenticate(self._request(header))
+        self.assertEqual(user, self.user)
+        self.assertTrue(user.has_perms(['server.add_acmechallenge', 'server.delete_acmechallenge']))
+
+        # The verified token, the user, and their permissions are all cached
+        with self.assertNumQueries(0), mock.patch.object(authentication.token, 'verify') as verify:
+            cached = authentication.authenticate(self._request(header))
+            self.assertTrue(cached.has_perms(['server.add_acmechallenge', 'server.delete_acmechallenge']))
+        self.assertIs(cached, user)
+        self.assertEqual(verify.call_count, 0)
+
+        # New tokens are verified against the cached public keys
+        with self.assertNumQueries(0):
+            self.assertIs(authentication.authenticate(self._request(create_auth_header(username='certbot', key=self.private_key))), user)
+
+
+    def test_invalid_headers(self):
+        other_key, _ = generate_key_pair()
+        for header in ('', 'Bearer foo', 'JWT', 'JWT not-a-token',
+                       create_auth_header(username='certbot', key=other_key),
+                       create_auth_header(username='missing', key=self.private_key)):
+            self.assertIsNone(authentication.authenticate(self._request(header)))
+
+
+    def test_public_key_deleted(self):
+        self.assertEqual(authentication.authenticate(self._request(create_auth_header(username='certbot', key=self.private_key))), self.user)
+        self.public_key.delete()
+        self.assertIsNone(authentication.authenticate(self._request(create_auth_header(username='certbot', key=self.private_key))))
+
+
+    @override_settings(CERTBOT_DJANGO_AUTH_CACHE_TTL=0)
+    def test_cache_disabled(self):
+        header = create_auth_header(username='certbot', key=self.private_key)
+        with mock.patch.object(authentication.token, 'verify', wraps=authentication.token.verify) as verify:
+            self.assertEqual(authentication.authenticate(self._request(header)), self.user)
+            self.assertEqual(authentication.authenticate(self._request(header)), self.user)
+        self.assertEqual(verify.call_count, 2)
+
+
+    @override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if m != 'asymmetric_jwt_auth.middleware.JWTAuthMiddleware'])
+    def test_api_without_middleware(self):
+        headers = {'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.private_key)}
+        data = [{'challenge': 'foo1', 'response': 'bar1'}, {'challenge': 'foo2', 'response': 'bar2'}]
+        response = self.client.post(reverse('acmechallenge-bulk'), data=data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # The same header authorizes the rest of the batch
+        response = self.client.delete(reverse('acmechallenge-bulk'), data={'challenges': ['foo1', 'foo2']},
+                                      content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.post(reverse('acmechallenge-bulk'), data=data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
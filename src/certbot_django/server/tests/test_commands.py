@@ -0,0 +1,60 @@
+from datetime import timedelta
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from ..models import AcmeChallenge
+import io
+
+
+class TestPurgeAcmeChallenges(TestCase):
+    def test_purge(self):
+        """
+        Make sure only expired challenges are deleted, across several batches
+        """
+        expired = timezone.now() - timedelta(seconds=1)
+        AcmeChallenge.objects.bulk_create([
+            AcmeChallenge(challenge='expired-{}'.format(i), response='response', expires_at=expired) for i in range(7)
+        ])
+        AcmeChallenge.objects.create(challenge='live', response='response')
+
+        stdout = io.StringIO()
+        with self.assertNumQueries(9):
+            call_command('purge_acme_challenges', batch_size=3, verbosity=2, stdout=stdout)
+        self.assertEqual(list(AcmeChallenge.objects.values_list('challenge', flat=True)), ['live'])
+        self.assertTrue('Purged 7 expired ACME challenges' in stdout.getvalue())
+
+
+    def test_purge_nothing(self):
+        AcmeChallenge.objects.create(challenge='live', response='response')
+        stdout = io.StringIO()
+        call_command('purge_acme_challenges', stdout=stdout)
+        self.assertEqual(AcmeChallenge.objects.count(), 1)
+        self.assertTrue('Purged 0 expired ACME challenges' in stdout.getvalue())
+
+
+    def test_purge_domain(self):
+        """
+        Make sure --domain only deletes challenges for that domain, and --all includes live challenges
+        """
+        expired = timezone.now() - timedelta(seconds=1)
+        AcmeChallenge.objects.create(challenge='expired-com', response='response', domain='www.example.com', expires_at=expired)
+        AcmeChallenge.objects.create(challenge='expired-org', response='response', domain='www.example.org', expires_at=expired)
+        AcmeChallenge.objects.create(challenge='live-com', response='response', domain='www.example.com')
+        AcmeChallenge.objects.create(challenge='live-org', response='response', domain='www.example.org')
+
+        stdout = io.StringIO()
+        call_command('purge_acme_challenges', domain='WWW.EXAMPLE.COM', stdout=stdout)
+        self.assertTrue('Purged 1 expired ACME challenges for www.example.com' in stdout.getvalue())
+        self.assertEqual(list(AcmeChallenge.objects.order_by('challenge').values_list('challenge', flat=True)),
+                         ['expired-org', 'live-com', 'live-org'])
+
+        stdout = io.StringIO()
+        call_command('purge_acme_challenges', '--all', domain='www.example.org', stdout=stdout)
+        self.assertTrue('Purged 2 ACME challenges for www.example.org' in stdout.getvalue())
+        self.assertEqual(list(AcmeChallenge.objects.values_list('challenge', flat=True)), ['live-com'])
+
+
+    def test_purge_all_requires_domain(self):
+        with self.assertRaises(CommandError):
+            call_command('purge_acme_challenges', '--all')
@@ -0,0 +1,287 @@
+from asymmetric_jwt_auth.models import PublicKey
+from asymmetric_jwt_auth import generate_key_pair, create_auth_header
+from datetime import timedelta
+from django.contrib.auth.models import User, Permission
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from ..models import AcmeChallenge, AcmeChallengeChange
+from ..stores import get_store
+from .. import index
+import django
+import mock
+import time
+import unittest
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    sync_to_async = None
+
+
+@override_settings(CERTBOT_DJANGO_INDEX=True, CERTBOT_DJANGO_INDEX_MAX_STALENESS=60)
+class TestChallengeIndex(TransactionTestCase):
+    """
+    Changes are published once their transaction commits, so the tests' writes have to be committed.
+    """
+    def setUp(self):
+        index._indexes.clear()
+        self.user_certbot = User.objects.create_user(username='certbot')
+        self.user_certbot.is_staff = True
+        self.user_certbot.save()
+        self.user_certbot.user_permissions.add(Permission.objects.get(codename='add_acmechallenge'))
+        self.user_certbot.user_permissions.add(Permission.objects.get(codename='delete_acmechallenge'))
+        self.priv_key_certbot, _pub = generate_key_pair()
+        PublicKey.objects.create(key=_pub, comment='Test Key', user=self.user_certbot)
+
+        # Stands in for a worker process other than the one handling API requests
+        self.other = index.ChallengeIndex(index.DatabaseFeed())
+
+
+    def _headers(self):
+        return {'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot)}
+
+
+    def _probe(self, challenge):
+        return self.client.get(reverse('acmechallenge-response', args=(challenge, )))
+
+
+    def test_serve_from_index(self):
+        AcmeChallenge.objects.create(challenge='existing', response='bar')
+        # The first probe builds the index
+        self.assertEqual(self._probe('existing').content, b'bar\n')
+        response = self.client.post(reverse('acmechallenge-list'), data={'challenge': 'foo', 'response': 'bar'}, **self._headers())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._probe('existing').content, b'bar\n')
+            response = self._probe('foo')
+        self.assertEqual(response.content, b'bar\n')
+        self.assertEqual(response['Content-Length'], '4')
+
+
+    def test_fallback_on_miss(self):
+        self.assertEqual(self._probe('missing').status_code, status.HTTP_404_NOT_FOUND)
+        # Challenges which aren't in the index yet are read from the store
+        with self.assertNumQueries(1):
+            self.assertEqual(self._probe('missing').status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_model_changes_are_published(self):
+        # Changes made outside the API, such as in the Django admin, are published by the model's signals
+        self.assertEqual(self._probe('missing').status_code, status.HTTP_404_NOT_FOUND)
+        self.other.sync()
+        obj = AcmeChallenge.objects.create(challenge='admin', response='bar')
+        with self.assertNumQueries(0):
+            self.assertEqual(self._probe('admin').content, b'bar\n')
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.other.sync()
+        self.assertEqual(self.other.get_body('admin'), b'bar\n')
+
+        obj.response = 'baz'
+        obj.save()
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 122):
+            self.other.sync()
+        self.assertEqual(self.other.get_body('admin'), b'baz\n')
+
+        obj.delete()
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 183):
+            self.other.sync()
+        self.assertIsNone(self.other.get_body('admin'))
+
+
+    def test_rolled_back_changes(self):
+        self.assertEqual(self._probe('missing').status_code, status.HTTP_404_NOT_FOUND)
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                AcmeChallenge.objects.create(challenge='rolled_back', response='bar')
+                get_store().upsert([('rolled_back_too', 'bar')])
+                raise ValueError()
+        self.assertIsNone(index.get_index().get_body('rolled_back'))
+        self.assertIsNone(index.get_index().get_body('rolled_back_too'))
+        self.assertFalse(AcmeChallengeChange.objects.exists())
+
+
+    def test_batched(self):
+        store = get_store()
+        with mock.patch('certbot_django.server.index.publish') as publish:
+            store.upsert([('foo', 'bar'), ('baz', 'qux')])
+            store.delete(['foo', 'baz'])
+        # One publish per store operation, rather than one per challenge
+        self.assertEqual([sorted((c.challenge, c.deleted) for c in call[0][0]) for call in publish.call_args_list], [
+            [('baz', False), ('foo', False)],
+            [('baz', True), ('foo', True)],
+        ])
+
+
+    def test_late_commit(self):
+        self.other.sync()
+        expires_at = timezone.now() + timedelta(hours=1)
+        late = AcmeChallengeChange.objects.create(challenge='late', response='bar', expires_at=expires_at)
+        AcmeChallengeChange.objects.create(challenge='early', response='baz', expires_at=expires_at)
+        # The first change's transaction hasn't committed yet when the second one is polled
+        late.delete()
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.other.sync()
+        self.assertEqual(self.other.get_body('early'), b'baz\n')
+        self.assertIsNone(self.other.get_body('late'))
+
+        late.save()
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 122):
+            self.other.sync()
+        self.assertEqual(self.other.get_body('late'), b'bar\n')
+
+
+    def test_gap_timeout(self):
+        feed = index.DatabaseFeed()
+        cursor = feed.get_cursor()
+        expires_at = timezone.now() + timedelta(hours=1)
+        rolled_back = AcmeChallengeChange.objects.create(challenge='rolled_back', expires_at=expires_at)
+        AcmeChallengeChange.objects.create(challenge='foo', expires_at=expires_at)
+        gap = rolled_back.pk
+        rolled_back.delete()
+        cursor, changes = feed.poll(cursor)
+        self.assertEqual([c.challenge for c in changes], ['foo'])
+        self.assertIn(gap, [pk for pk, expires in cursor[1]])
+        # A process which starts while the transaction is running waits for it too
+        last, gaps = feed.get_cursor()
+        self.assertEqual(last, cursor[0])
+        self.assertIn(gap, [pk for pk, expires in gaps])
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(feed.poll(cursor), ((cursor[0], ()), []))
+
+
+    def test_changes_reach_other_processes(self):
+        self.other.sync()
+        response = self.client.put(reverse('acmechallenge-detail', args=('foo', )), data={'response': 'bar', 'domain': 'www.example.com'},
+                                   content_type='application/json', **self._headers())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(self.other.get_body('foo'))
+        self.assertFalse(self.other.is_due())
+
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.assertTrue(self.other.is_due())
+            self.other.sync()
+        self.assertEqual(self.other.get_body('foo', 'www.example.com'), b'bar\n')
+        self.assertIsNone(self.other.get_body('foo', 'www.example.org'))
+
+        self.client.delete(reverse('acmechallenge-detail', args=('foo', )), **self._headers())
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 122):
+            self.other.sync()
+        self.assertIsNone(self.other.get_body('foo', 'www.example.com'))
+
+
+    def test_bulk_changes(self):
+        data = [{'challenge': 'foo', 'response': 'bar'}, {'challenge': 'baz', 'response': 'qux'}]
+        cursor = index.DatabaseFeed().get_cursor()
+        self.client.post(reverse('acmechallenge-bulk'), data=data, content_type='application/json', **self._headers())
+        self.other.sync()
+        self.assertEqual(self.other.get_body('baz'), b'qux\n')
+        self.client.delete(reverse('acmechallenge-bulk'), data={'challenges': ['foo', 'baz']}, content_type='application/json',
+                           **self._headers())
+        self.assertEqual(self._probe('baz').status_code, status.HTTP_404_NOT_FOUND)
+        cursor, changes = index.DatabaseFeed().poll(cursor)
+        self.assertEqual([(c.challenge, c.deleted) for c in changes[:2]], [('foo', False), ('baz', False)])
+        self.assertEqual(sorted((c.challenge, c.deleted) for c in changes[2:]), [('baz', True), ('foo', True)])
+
+
+    @override_settings(CERTBOT_DJANGO_INDEX_RETENTION=30)
+    def test_rebuild_after_retention(self):
+        self.other.sync()
+        # bulk_create doesn't send post_save, so this challenge is only seen by rebuilding
+        AcmeChallenge.objects.bulk_create([AcmeChallenge(challenge='unpublished', response='bar')])
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.other.sync()
+        self.assertEqual(self.other.get_body('unpublished'), b'bar\n')
+
+        # Old changes are deleted as new ones are published
+        AcmeChallengeChange.objects.create(challenge='old', created=timezone.now() - timedelta(seconds=31))
+        index.publish(index.deleted(['new']))
+        self.assertEqual(list(AcmeChallengeChange.objects.values_list('challenge', flat=True)), ['new'])
+        # But at most once a minute
+        AcmeChallengeChange.objects.filter(challenge='new').update(created=timezone.now() - timedelta(seconds=31))
+        index.publish(index.deleted(['newer']))
+        self.assertEqual(AcmeChallengeChange.objects.count(), 2)
+
+
+    def test_expired(self):
+        AcmeChallenge.objects.create(challenge='expiring', response='bar', expires_at=timezone.now() + timedelta(seconds=60))
+        self.other.sync()
+        self.assertEqual(self.other.get_body('expiring'), b'bar\n')
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(self.other.get_body('expiring'))
+
+
+    def test_purge_all(self):
+        AcmeChallenge.objects.create(challenge='foo', response='bar', domain='www.example.com')
+        self.other.sync()
+        call_command('purge_acme_challenges', '--all', domain='www.example.com', stdout=mock.Mock())
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.other.sync()
+        self.assertIsNone(self.other.get_body('foo'))
+
+
+    def test_purge_expired(self):
+        AcmeChallenge.objects.create(challenge='foo', response='bar', expires_at=timezone.now() - timedelta(seconds=1))
+        count = AcmeChallengeChange.objects.count()
+        call_command('purge_acme_challenges', stdout=mock.Mock())
+        # Deleting expired challenges isn't published
+        self.assertEqual(AcmeChallengeChange.objects.count(), count)
+
+
+    @override_settings(CERTBOT_DJANGO_INDEX_RETENTION=120)
+    def test_sweep_expired(self):
+        AcmeChallenge.objects.create(challenge='expiring', response='bar', expires_at=timezone.now() + timedelta(seconds=60))
+        self.other.sync()
+        # Expired challenges are dropped from the index once per retention period
+        with mock.patch('time.time', return_value=time.time() + 61):
+            with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+                self.other.sync()
+            self.assertIn('expiring', self.other._challenges)
+            with mock.patch('time.monotonic', return_value=time.monotonic() + 122):
+                self.other.sync()
+            self.assertNotIn('expiring', self.other._challenges)
+
+
+    @unittest.skipIf(django.VERSION < (3, 1), 'Async views require Django 3.1 or later')
+    @override_settings(ROOT_URLCONF='certbot_django.server.tests.async_urls')
+    async def test_async(self):
+        await sync_to_async(AcmeChallenge.objects.create)(challenge='foo', response='bar')
+        response = await self.async_client.get(reverse('acmechallenge-response', args=('foo', )))
+        self.assertEqual(response.content, b'bar\n')
+        self.assertEqual(index.get_index().get_body('foo'), b'bar\n')
+
+
+
+class TestLocalFeed(TestCase):
+    def test_poll(self):
+        feed = index.LocalFeed()
+        cursor = feed.get_cursor()
+        feed.publish(index.deleted(['foo', 'bar']))
+        cursor, changes = feed.poll(cursor)
+        self.assertEqual([c.challenge for c in changes], ['foo', 'bar'])
+        self.assertEqual(feed.poll(cursor), (cursor, []))
+
+
+    def test_max_changes(self):
+        feed = index.LocalFeed()
+        feed.MAX_CHANGES = 2
+        feed.publish(index.deleted(['foo', 'bar', 'baz']))
+        cursor, changes = feed.poll(0)
+        self.assertEqual(cursor, 3)
+        self.assertEqual([c.challenge for c in changes], ['bar', 'baz'])
+
+
+    @override_settings(CERTBOT_DJANGO_INDEX=True, CERTBOT_DJANGO_INDEX_FEED='certbot_django.server.index.LocalFeed',
+                       CERTBOT_DJANGO_STORE='certbot_django.server.stores.MemoryStore')
+    def test_memory_store(self):
+        index._indexes.clear()
+        store = get_store()
+        store.delete([c.challenge for c in store.list()])
+        self.assertIsNone(index.get_body('foo'))
+        store.create([('foo', 'bar')])
+        with self.assertNumQueries(0):
+            self.assertEqual(index.get_index().get_body('foo'), b'bar\n')
+            self.assertEqual(index.get_body('foo'), b'bar\n')
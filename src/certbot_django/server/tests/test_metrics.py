@@ -0,0 +1,110 @@
+from asymmetric_jwt_auth.models import PublicKey
+from asymmetric_jwt_auth import generate_key_pair, create_auth_header
+from django.contrib.auth.models import User, Permission
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from ..models import AcmeChallenge
+from ..responder import render_response
+from .. import metrics
+
+
+class TestMetricTypes(TestCase):
+    def test_counter(self):
+        counter = metrics.Counter('test_total', 'Test counter', ('result', ))
+        counter.inc(result='hit')
+        counter.inc(2, result='hit')
+        counter.inc(result='miss')
+        self.assertEqual(counter.get(result='hit'), 3)
+        self.assertEqual(counter.collect(), ['test_total{result="hit"} 3.0', 'test_total{result="miss"} 1.0'])
+
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('test_seconds', 'Test histogram', buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+        self.assertEqual(histogram.get_count(), 4)
+        self.assertEqual(histogram.collect(), [
+            'test_seconds_bucket{le="0.1"} 2.0',
+            'test_seconds_bucket{le="1.0"} 3.0',
+            'test_seconds_bucket{le="+Inf"} 4.0',
+            'test_seconds_sum 2.65',
+            'test_seconds_count 4.0',
+        ])
+
+
+
+@override_settings(CERTBOT_DJANGO_METRICS=True)
+class TestMetrics(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        AcmeChallenge.objects.create(challenge='foo', response='bar')
+
+        self.user_certbot = User.objects.create_user(username='certbot', is_staff=True)
+        self.user_certbot.user_permissions.add(Permission.objects.get(codename='add_acmechallenge'))
+        self.user_certbot.user_permissions.add(Permission.objects.get(codename='delete_acmechallenge'))
+        self.priv_key_certbot, _pub = generate_key_pair()
+        PublicKey.objects.create(key=_pub, comment='Test Key', user=self.user_certbot)
+
+
+    def _auth(self):
+        return {'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot)}
+
+
+    def test_validation_requests(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('acmechallenge-response', args=('foo', )))
+        self.client.get(reverse('acmechallenge-response', args=('missing', )))
+        render_response('foo')
+        self.assertEqual(metrics.validation_requests.get(source='view', result='hit'), 1)
+        self.assertEqual(metrics.validation_requests.get(source='view', result='miss'), 1)
+        self.assertEqual(metrics.validation_requests.get(source='responder', result='hit'), 1)
+        self.assertEqual(metrics.validation_seconds.get_count(source='view'), 2)
+
+
+    def test_api_requests(self):
+        url = reverse('acmechallenge-bulk')
+        data = [{'challenge': 'foo1', 'response': 'bar1'}, {'challenge': 'foo2', 'response': 'bar2'}]
+        response = self.client.post(url, data=data, content_type='application/json', **self._auth())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.delete(url, data={'challenges': ['foo1', 'foo2', 'missing']}, content_type='application/json', **self._auth())
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.delete(reverse('acmechallenge-detail', args=('foo', )), **self._auth())
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.client.delete(reverse('acmechallenge-detail', args=('foo', )))
+
+        self.assertEqual(metrics.challenges_created.get(), 2)
+        self.assertEqual(metrics.challenges_deleted.get(), 3)
+        self.assertEqual(metrics.api_requests.get(action='bulk', method='POST', status=201), 1)
+        self.assertEqual(metrics.api_requests.get(action='destroy', method='DELETE', status=204), 1)
+        self.assertEqual(metrics.api_requests.get(action='destroy', method='DELETE', status=403), 1)
+        self.assertEqual(metrics.api_seconds.get_count(action='bulk', method='DELETE'), 1)
+
+
+    def test_serve_metrics(self):
+        self.client.get(reverse('acmechallenge-response', args=('foo', )))
+        url = reverse('acmechallenge-metrics')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_login(self.user_certbot)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        content = response.content.decode('utf-8')
+        self.assertTrue('# TYPE certbot_django_validation_seconds histogram' in content)
+        self.assertTrue('certbot_django_validation_requests_total{source="view",result="hit"} 1.0' in content)
+
+
+    @override_settings(CERTBOT_DJANGO_METRICS_TOKEN='secret')
+    def test_serve_metrics_token(self):
+        url = reverse('acmechallenge-metrics')
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code, status.HTTP_200_OK)
+
+
+    @override_settings(CERTBOT_DJANGO_METRICS=False)
+    def test_disabled(self):
+        self.client.get(reverse('acmechallenge-response', args=('foo', )))
+        self.assertEqual(metrics.validation_requests.get(source='view', result='hit'), 0)
+        self.client.force_login(self.user_certbot)
+        self.assertEqual(self.client.get(reverse('acmechallenge-metrics')).status_code, status.HTTP_404_NOT_FOUND)
@@ -1,5 +1,7 @@
-from django.test import TestCase
-from ..models import AcmeChallenge
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from ..models import AcmeChallenge, normalize_domain
 
 
 class TestAcmeChallenge(TestCase):
@@ -31,3 +33,41 @@ class TestAcmeChallenge(TestCase):
         response = 'challenge.response'
         acme_object = AcmeChallenge(challenge=challenge, response=response)
         self.assertEqual(str(acme_object), challenge)
+
+
+    @override_settings(CERTBOT_DJANGO_CHALLENGE_TTL=60)
+    def test_expires_at(self):
+        """
+        Test that expires_at defaults to CERTBOT_DJANGO_CHALLENGE_TTL seconds from now
+        """
+        acme_object = AcmeChallenge.objects.create(challenge='challenge', response='challenge.response')
+        self.assertAlmostEqual((acme_object.expires_at - timezone.now()).total_seconds(), 60, delta=5)
+
+
+    def test_live_and_expired(self):
+        """
+        Test filtering challenges by whether they have expired
+        """
+        AcmeChallenge.objects.create(challenge='live', response='live.response')
+        AcmeChallenge.objects.create(challenge='expired', response='expired.response', expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(list(AcmeChallenge.objects.live().values_list('challenge', flat=True)), ['live'])
+        self.assertEqual(list(AcmeChallenge.objects.expired().values_list('challenge', flat=True)), ['expired'])
+
+
+    def test_for_domain(self):
+        """
+        Test filtering challenges to those which may be served for a domain
+        """
+        AcmeChallenge.objects.create(challenge='any', response='any.response')
+        AcmeChallenge.objects.create(challenge='scoped', response='scoped.response', domain='www.example.com')
+        AcmeChallenge.objects.create(challenge='other', response='other.response', domain='www.example.org')
+        qs = AcmeChallenge.objects.for_domain('www.example.com').order_by('challenge')
+        self.assertEqual(list(qs.values_list('challenge', flat=True)), ['any', 'scoped'])
+        self.assertEqual(AcmeChallenge.objects.for_domain(None).count(), 3)
+
+
+    def test_normalize_domain(self):
+        self.assertEqual(normalize_domain('WWW.Example.com:8000'), 'www.example.com')
+        self.assertEqual(normalize_domain('www.example.com.'), 'www.example.com')
+        self.assertEqual(normalize_domain('[::1]:80'), '[::1]')
+        self.assertEqual(normalize_domain(None), '')
@@ -0,0 +1,132 @@
+from django.test import TestCase
+from ..models import AcmeChallenge
+from ..responder import ChallengeResponderWSGI, ChallengeResponderASGI
+import unittest
+
+try:
+    from asgiref.sync import async_to_sync
+except ImportError:
+    async_to_sync = None
+
+
+class TestChallengeResponderWSGI(TestCase):
+    def setUp(self):
+        AcmeChallenge.objects.create(challenge='foo', response='bar')
+        self.app_calls = []
+        self.responder = ChallengeResponderWSGI(self.app)
+
+
+    def app(self, environ, start_response):
+        self.app_calls.append(environ['PATH_INFO'])
+        start_response('200 OK', [('Content-Type', 'text/html')])
+        return [b'django']
+
+
+    def call(self, path, method='GET', host='testserver'):
+        result = {}
+
+        def start_response(status, headers):
+            result['status'] = status
+            result['headers'] = dict(headers)
+
+        body = b''.join(self.responder({'PATH_INFO': path, 'REQUEST_METHOD': method, 'HTTP_HOST': host}, start_response))
+        return result['status'], result['headers'], body
+
+
+    def test_detail(self):
+        with self.assertNumQueries(1):
+            status, headers, body = self.call('/.well-known/acme-challenge/foo')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Type'], 'text/plain')
+        self.assertEqual(headers['Content-Length'], '4')
+        self.assertEqual(body, b'bar\n')
+        self.assertEqual(self.app_calls, [])
+
+
+    def test_detail_domain(self):
+        AcmeChallenge.objects.create(challenge='scoped', response='baz', domain='www.example.com')
+        status, headers, body = self.call('/.well-known/acme-challenge/scoped', host='www.example.com:80')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(body, b'baz\n')
+        status, headers, body = self.call('/.well-known/acme-challenge/scoped', host='www.example.org')
+        self.assertEqual(status, '404 Not Found')
+
+
+    def test_head(self):
+        status, headers, body = self.call('/.well-known/acme-challenge/foo', method='HEAD')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Length'], '4')
+        self.assertEqual(body, b'')
+
+
+    def test_detail_404(self):
+        for path in ('/.well-known/acme-challenge/fake', '/.well-known/acme-challenge/'):
+            status, headers, body = self.call(path)
+            self.assertEqual(status, '404 Not Found')
+        self.assertEqual(self.app_calls, [])
+
+
+    def test_pass_through(self):
+        self.assertEqual(self.call('/admin/')[2], b'django')
+        self.assertEqual(self.call('/.well-known/acme-challenge/foo', method='POST')[2], b'django')
+        self.assertEqual(self.app_calls, ['/admin/', '/.well-known/acme-challenge/foo'])
+
+
+
+@unittest.skipIf(async_to_sync is None, 'asgiref is not installed')
+class TestChallengeResponderASGI(TestCase):
+    def setUp(self):
+        AcmeChallenge.objects.create(challenge='foo', response='bar')
+        self.app_calls = []
+        self.responder = ChallengeResponderASGI(self.app)
+
+
+    async def app(self, scope, receive, send):
+        self.app_calls.append(scope['path'])
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'django'})
+
+
+    def call(self, path, method='GET', headers=()):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        # async_to_sync runs thread sensitive code back on this thread, so it shares the test's DB connection
+        scope = {'type': 'http', 'path': path, 'method': method, 'headers': list(headers), 'server': ('testserver', 80)}
+        async_to_sync(self.responder)(scope, receive, send)
+        return messages[0]['status'], dict(messages[0]['headers']), messages[1]['body']
+
+
+    def test_detail(self):
+        status, headers, body = self.call('/.well-known/acme-challenge/foo')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'text/plain')
+        self.assertEqual(headers[b'content-length'], b'4')
+        self.assertEqual(body, b'bar\n')
+        self.assertEqual(self.app_calls, [])
+
+
+    def test_detail_domain(self):
+        AcmeChallenge.objects.create(challenge='scoped', response='baz', domain='www.example.com')
+        status, headers, body = self.call('/.well-known/acme-challenge/scoped', headers=[(b'host', b'www.example.com')])
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'baz\n')
+        status, headers, body = self.call('/.well-known/acme-challenge/scoped')
+        self.assertEqual(status, 404)
+
+
+    def test_detail_404(self):
+        status, headers, body = self.call('/.well-known/acme-challenge/fake')
+        self.assertEqual(status, 404)
+        self.assertEqual(self.app_calls, [])
+
+
+    def test_pass_through(self):
+        status, headers, body = self.call('/admin/')
+        self.assertEqual(body, b'django')
+        self.assertEqual(self.app_calls, ['/admin/'])
@@ -0,0 +1,81 @@
+from asymmetric_jwt_auth.models import PublicKey
+from asymmetric_jwt_auth import generate_key_pair, create_auth_header
+from django.contrib.auth.models import User, Permission
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from ..models import AcmeChallenge
+from ..responder import render_response
+from ..stores import DatabaseStore
+import django
+import unittest
+
+
+@override_settings(
+    DATABASE_ROUTERS=['certbot_django.server.routers.ReplicaRouter'],
+    CERTBOT_DJANGO_REPLICA_DATABASE='replica')
+class TestReplicaRouter(TestCase):
+    multi_db = True
+    databases = {'default', 'replica'}
+
+
+    def setUp(self):
+        # The test databases aren't really replicated, so challenges are created on each one by hand
+        AcmeChallenge.objects.using('replica').create(challenge='replicated', response='from_replica')
+        AcmeChallenge.objects.create(challenge='replicated', response='from_primary')
+        self.store = DatabaseStore()
+
+
+    def test_detail(self):
+        response = self.client.get(reverse('acmechallenge-response', args=('replicated', )))
+        self.assertEqual(response.content, b'from_replica\n')
+        self.assertEqual(render_response('replicated'), (200, b'from_replica\n'))
+
+
+    def test_fallback_to_primary(self):
+        # A challenge the coordinator just created, which hasn't replicated yet
+        AcmeChallenge.objects.create(challenge='lagging', response='bar')
+        with self.assertNumQueries(1, using='replica'), self.assertNumQueries(1, using='default'):
+            self.assertEqual(self.store.get_body('lagging'), b'bar\n')
+        self.assertEqual(self.client.get(reverse('acmechallenge-response', args=('missing', ))).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        CERTBOT_DJANGO_CACHE='default')
+    def test_cache_read_through(self):
+        caches['default'].clear()
+        AcmeChallenge.objects.create(challenge='lagging', response='bar')
+        self.assertEqual(self.store.get_body('replicated'), b'from_replica\n')
+        # Missing from the replica isn't cached as a miss while the primary has the challenge
+        self.assertEqual(self.store.get_body('lagging'), b'bar\n')
+
+
+    @unittest.skipIf(django.VERSION < (3, 1), 'Async views require Django 3.1 or later')
+    async def test_async_fallback_to_primary(self):
+        self.assertEqual(await self.store.aget_body('replicated'), b'from_replica\n')
+        self.assertIsNone(await self.store.aget_body('missing'))
+
+
+    def test_api_uses_primary(self):
+        user = User.objects.create_user(username='certbot', is_staff=True)
+        user.user_permissions.add(Permission.objects.get(codename='add_acmechallenge'))
+        user.user_permissions.add(Permission.objects.get(codename='delete_acmechallenge'))
+        private_key, public_key = generate_key_pair()
+        PublicKey.objects.create(key=public_key, comment='Test Key', user=user)
+
+        headers = {'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=private_key)}
+        response = self.client.get(reverse('acmechallenge-detail', args=('replicated', )), **headers)
+        self.assertEqual(response.data['response'], 'from_primary')
+
+        response = self.client.post(reverse('acmechallenge-list'), data={'challenge': 'new', 'response': 'bar'}, **headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(AcmeChallenge.objects.using('default').filter(challenge='new').exists())
+        self.assertFalse(AcmeChallenge.objects.using('replica').filter(challenge='new').exists())
+
+
+    @override_settings(CERTBOT_DJANGO_REPLICA_DATABASE=None)
+    def test_no_replica(self):
+        self.assertEqual(self.store.get_body('replicated'), b'from_primary\n')
@@ -0,0 +1,218 @@
+from asymmetric_jwt_auth.models import PublicKey
+from asymmetric_jwt_auth import generate_key_pair, create_auth_header
+from datetime import timedelta
+from django.contrib.auth.models import User, Permission
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from ..models import AcmeChallenge
+from ..stores import DatabaseStore, CacheStore, MemoryStore, ChallengeExists, get_store
+import mock
+import time
+
+
+class StoreTestMixin(object):
+    def test_create_and_get(self):
+        created = self.store.create([('foo', 'bar'), ('baz', 'qux')])
+        self.assertEqual([(c.challenge, c.response) for c in created], [('foo', 'bar'), ('baz', 'qux')])
+        self.assertEqual(self.store.get('foo').response, 'bar')
+        self.assertEqual(self.store.get_response('foo'), 'bar')
+        self.assertEqual(self.store.get_response('baz'), 'qux')
+        self.assertIsNone(self.store.get('missing'))
+        self.assertIsNone(self.store.get_response('missing'))
+
+
+    def test_get_body(self):
+        self.store.create([('foo', 'bar', 'www.example.com'), ('baz', 'caf\xe9')])
+        self.assertEqual(self.store.get_body('foo', 'www.example.com'), b'bar\n')
+        self.assertEqual(self.store.get_body('baz'), b'caf\xc3\xa9\n')
+        self.assertIsNone(self.store.get_body('foo', 'www.example.org'))
+        self.assertIsNone(self.store.get_body('missing'))
+        self.store.update('foo', 'new')
+        self.assertEqual(self.store.get_body('foo'), b'new\n')
+
+
+    def test_create_existing(self):
+        self.store.create([('foo', 'bar')])
+        with self.assertRaises(ChallengeExists) as cm:
+            self.store.create([('new', 'bar'), ('foo', 'bar')])
+        self.assertEqual(cm.exception.challenges, ['foo'])
+        self.assertIsNone(self.store.get('new'))
+
+
+    def test_list(self):
+        self.store.create([('foo', 'bar'), ('baz', 'qux')])
+        self.assertEqual([c.challenge for c in self.store.list()], ['baz', 'foo'])
+
+
+    @override_settings(CERTBOT_DJANGO_CHALLENGE_TTL=60)
+    def test_list_live(self):
+        self.store.create([('foo', 'bar', 'www.example.com'), ('baz', 'qux')])
+        self.assertEqual(sorted(item[:3] for item in self.store.list_live()), [
+            ('baz', 'qux', ''),
+            ('foo', 'bar', 'www.example.com'),
+        ])
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=61)):
+            self.assertEqual(list(self.store.list_live()), [])
+
+
+    def test_update(self):
+        self.store.create([('foo', 'bar')])
+        self.assertEqual(self.store.update('foo', 'new').response, 'new')
+        self.assertEqual(self.store.get_response('foo'), 'new')
+        self.assertIsNone(self.store.update('missing', 'new'))
+
+
+    def test_upsert(self):
+        self.store.create([('foo', 'bar')])
+        upserted = self.store.upsert([('foo', 'new', 'example.com'), ('baz', 'qux'), ('baz', 'last')])
+        self.assertEqual(sorted((c.challenge, c.response) for c in upserted), [('baz', 'last'), ('foo', 'new')])
+        self.assertEqual(self.store.get_response('foo', 'example.com'), 'new')
+        self.assertEqual(self.store.get('foo').domain, 'example.com')
+        self.assertEqual(self.store.get_response('baz'), 'last')
+        self.assertEqual([c.challenge for c in self.store.list()], ['baz', 'foo'])
+        # Retrying the same upsert is harmless
+        self.store.upsert([('foo', 'new', 'example.com')])
+        self.assertEqual(self.store.get_response('foo'), 'new')
+
+
+    def test_delete(self):
+        self.store.create([('foo', 'bar'), ('baz', 'qux')])
+        self.assertEqual(self.store.delete(['foo', 'missing']), 1)
+        self.assertIsNone(self.store.get_response('foo'))
+        self.assertEqual([c.challenge for c in self.store.list()], ['baz'])
+
+
+    def test_domain(self):
+        self.store.create([('foo', 'bar', 'WWW.Example.com'), ('baz', 'qux')])
+        self.assertEqual(self.store.get('foo').domain, 'www.example.com')
+        self.assertEqual(self.store.get_response('foo', 'www.example.com'), 'bar')
+        self.assertEqual(self.store.get_response('foo'), 'bar')
+        self.assertIsNone(self.store.get_response('foo', 'www.example.org'))
+        # Challenges without a domain are served for every host
+        self.assertEqual(self.store.get_response('baz', 'www.example.org'), 'qux')
+        self.assertEqual([c.challenge for c in self.store.list(domain='www.example.com')], ['foo'])
+        self.assertEqual([c.challenge for c in self.store.list(domain='')], ['baz'])
+
+
+    @override_settings(CERTBOT_DJANGO_CHALLENGE_TTL=60)
+    def test_expired(self):
+        self.store.create([('foo', 'bar')])
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=61)):
+            self.assertIsNone(self.store.get_response('foo'))
+
+
+
+class TestDatabaseStore(StoreTestMixin, TestCase):
+    def setUp(self):
+        self.store = DatabaseStore()
+
+
+    def test_get_body_query(self):
+        self.store.create([('foo', 'bar')])
+        # Only the response column is fetched, so no model instance is built
+        with self.assertNumQueries(1) as ctx:
+            self.assertEqual(self.store.get_body('foo'), b'bar\n')
+        self.assertIn('"response"', ctx.captured_queries[0]['sql'])
+        self.assertNotIn('"created"', ctx.captured_queries[0]['sql'])
+
+
+    def test_list_live_query(self):
+        self.store.create([('foo', 'bar'), ('baz', 'qux')])
+        AcmeChallenge.objects.filter(challenge='baz').update(expires_at=timezone.now())
+        with self.assertNumQueries(1) as ctx:
+            self.assertEqual([item[0] for item in self.store.list_live()], ['foo'])
+        self.assertNotIn('"created"', ctx.captured_queries[0]['sql'])
+
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CERTBOT_DJANGO_CACHE='default')
+class TestCachedDatabaseStore(StoreTestMixin, TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.store = DatabaseStore()
+
+
+    @override_settings(CERTBOT_DJANGO_CHALLENGE_TTL=60)
+    def test_expired(self):
+        # Cached responses expire with the cache entry, which follows time.time rather than timezone.now
+        self.store.create([('foo', 'bar')])
+        now = time.time()
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=61)), \
+                mock.patch('time.time', return_value=now + 61):
+            self.assertIsNone(self.store.get_response('foo'))
+
+
+    def test_cached_body(self):
+        self.store.create([('foo', 'bar')])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.store.get_body('foo'), b'bar\n')
+            self.assertEqual(self.store.get_response('foo'), 'bar')
+
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CERTBOT_DJANGO_STORE_CACHE='default')
+class TestCacheStore(StoreTestMixin, TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.store = CacheStore()
+
+
+    def test_no_database_queries(self):
+        with self.assertNumQueries(0):
+            self.test_create_and_get()
+            self.assertEqual(len(self.store.list()), 2)
+            self.store.update('foo', 'new')
+            self.store.delete(['foo', 'baz'])
+        self.assertEqual(AcmeChallenge.objects.count(), 0)
+
+
+
+class TestMemoryStore(StoreTestMixin, TestCase):
+    def setUp(self):
+        self.store = MemoryStore()
+
+
+
+@override_settings(CERTBOT_DJANGO_STORE='certbot_django.server.stores.MemoryStore')
+class TestStoreViews(TestCase):
+    def setUp(self):
+        self.store = get_store()
+        self.store.delete([c.challenge for c in self.store.list()])
+
+        self.user_certbot = User.objects.create_user(username='certbot')
+        self.user_certbot.is_staff = True
+        self.user_certbot.save()
+        self.user_certbot.user_permissions.add(Permission.objects.get(codename='add_acmechallenge'))
+        self.user_certbot.user_permissions.add(Permission.objects.get(codename='delete_acmechallenge'))
+
+        self.priv_key_certbot, _pub = generate_key_pair()
+        PublicKey.objects.create(key=_pub, comment='Test Key', user=self.user_certbot)
+
+
+    def test_create_serve_and_delete(self):
+        self.assertTrue(isinstance(self.store, MemoryStore))
+        headers = {
+            'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot),
+        }
+        response = self.client.post(reverse('acmechallenge-list'), data={'challenge': 'foo', 'response': 'bar'}, **headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['challenge'], 'foo')
+        self.assertEqual(AcmeChallenge.objects.count(), 0)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('acmechallenge-response', args=('foo', )))
+        self.assertEqual(response.content, b'bar\n')
+
+        headers = {
+            'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot),
+        }
+        response = self.client.delete(reverse('acmechallenge-detail', args=('foo', )), **headers)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertIsNone(self.store.get('foo'))
@@ -1,10 +1,19 @@
 from asymmetric_jwt_auth.models import PublicKey
 from asymmetric_jwt_auth import generate_key_pair, create_auth_header
 from django.contrib.auth.models import User, Permission
+from datetime import timedelta
+from django.core.cache import caches
+from django.utils import timezone
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from rest_framework import status
+from urllib.parse import urlsplit
 from ..models import AcmeChallenge
+import os.path
+import re
+import requests_mock
+import shutil
+import tempfile
 
 
 class TestAcmeChallengeViews(TestCase):
@@ -25,6 +34,8 @@ class TestAcmeChallengeViews(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.content, self.expected_response_bytes)
         self.assertEqual(response.content.decode(response.charset), self.expected_response_decode)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Content-Length'], str(len(self.expected_response_bytes)))
 
 
     def test_detail_404(self):
@@ -36,6 +47,95 @@ class TestAcmeChallengeViews(TestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+    def test_detail_expired(self):
+        """
+        Make sure expired challenges aren't served
+        """
+        self.test_challenge.expires_at = timezone.now() - timedelta(seconds=1)
+        self.test_challenge.save()
+        url = reverse('acmechallenge-response', args=(self.expected_challenge, ))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+
+    @override_settings(ALLOWED_HOSTS=['www.example.com', 'www.example.org'])
+    def test_detail_domain(self):
+        """
+        Make sure challenges scoped to a domain are only served for requests to that host
+        """
+        AcmeChallenge.objects.create(challenge='scoped', response='scoped_response', domain='www.example.com')
+        url = reverse('acmechallenge-response', args=('scoped', ))
+        response = self.client.get(url, HTTP_HOST='WWW.EXAMPLE.COM')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'scoped_response\n')
+        response = self.client.get(url, HTTP_HOST='www.example.org')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('acmechallenge-response', args=(self.expected_challenge, )), HTTP_HOST='www.example.org')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CERTBOT_DJANGO_CACHE='default')
+class TestCachedAcmeChallengeViews(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        AcmeChallenge.objects.create(challenge='foo', response='bar')
+
+
+    def test_detail(self):
+        url = reverse('acmechallenge-response', args=('foo', ))
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'bar\n')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+
+
+    def test_detail_read_through(self):
+        caches['default'].clear()
+        url = reverse('acmechallenge-response', args=('foo', ))
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.content, b'bar\n')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.content, b'bar\n')
+
+
+    def test_detail_404(self):
+        url = reverse('acmechallenge-response', args=('fake', ))
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Creating the challenge replaces the cached miss
+        AcmeChallenge.objects.create(challenge='fake', response='real')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.content, b'real\n')
+
+
+    def test_detail_expired(self):
+        AcmeChallenge.objects.create(challenge='expired', response='bar', expires_at=timezone.now() - timedelta(seconds=1))
+        url = reverse('acmechallenge-response', args=('expired', ))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        caches['default'].clear()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_detail_deleted(self):
+        url = reverse('acmechallenge-response', args=('foo', ))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        AcmeChallenge.objects.filter(challenge='foo').delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
 
 class TestAcmeChallengeAPI(TestCase):
     def setUp(self):
@@ -123,3 +223,255 @@ class TestAcmeChallengeAPI(TestCase):
             if expected_status == status.HTTP_200_OK:
                 self.assertEquals(response.data['challenge'], 'foo')
                 self.assertEquals(response.data['response'], 'bar')
+
+
+    def test_bulk_add_challenges(self):
+        matrix = (
+            ('', '', status.HTTP_403_FORBIDDEN),
+            ('joe', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_certbot, status.HTTP_201_CREATED),
+        )
+
+        url = reverse('acmechallenge-bulk')
+
+        data = [
+            {'challenge': 'foo1', 'response': 'bar1'},
+            {'challenge': 'foo2', 'response': 'bar2'},
+            {'challenge': 'foo3', 'response': 'bar3'},
+        ]
+
+        for username, private_key, expected_status in matrix:
+            headers = {}
+            if username:
+                headers['HTTP_AUTHORIZATION'] = create_auth_header(username=username, key=private_key)
+            response = self.client.post(url, data=data, content_type='application/json', **headers)
+            self.assertEquals(response.status_code, expected_status)
+
+        self.assertEquals(list(AcmeChallenge.objects.order_by('challenge').values_list('challenge', 'response')), [
+            ('foo1', 'bar1'),
+            ('foo2', 'bar2'),
+            ('foo3', 'bar3'),
+        ])
+
+
+    def test_upsert_challenge(self):
+        matrix = (
+            ('', '', status.HTTP_403_FORBIDDEN),
+            ('joe', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_certbot, status.HTTP_200_OK),
+            ('certbot', self.priv_key_certbot, status.HTTP_200_OK),
+        )
+
+        url = reverse('acmechallenge-detail', args=('foo', ))
+        for username, private_key, expected_status in matrix:
+            headers = {}
+            if username:
+                headers['HTTP_AUTHORIZATION'] = create_auth_header(username=username, key=private_key)
+            response = self.client.put(url, data={'response': 'bar', 'domain': 'example.com'},
+                                       content_type='application/json', **headers)
+            self.assertEquals(response.status_code, expected_status)
+
+        self.assertEquals(list(AcmeChallenge.objects.values_list('challenge', 'response', 'domain')), [
+            ('foo', 'bar', 'example.com'),
+        ])
+
+        # PUT replaces an existing challenge, and the token in the URL wins over one in the body
+        headers = {'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot)}
+        response = self.client.put(url, data={'challenge': 'other', 'response': 'new'}, content_type='application/json', **headers)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.data['challenge'], 'foo')
+        self.assertEquals(list(AcmeChallenge.objects.values_list('challenge', 'response', 'domain')), [
+            ('foo', 'new', ''),
+        ])
+
+        # Bodies which aren't objects are rejected
+        for data in ('["new"]', '"new"'):
+            response = self.client.put(url, data=data, content_type='application/json', **headers)
+            self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_upsert_requires_add_and_delete(self):
+        self.user_certbot.user_permissions.remove(self.perm_delete)
+        url = reverse('acmechallenge-detail', args=('foo', ))
+        headers = {'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot)}
+        response = self.client.put(url, data={'response': 'bar'}, content_type='application/json', **headers)
+        self.assertEquals(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(AcmeChallenge.objects.exists())
+
+
+    def test_bulk_upsert_challenges(self):
+        AcmeChallenge.objects.create(challenge='foo2', response='old')
+        url = reverse('acmechallenge-bulk')
+        data = [
+            {'challenge': 'foo1', 'response': 'bar1'},
+            {'challenge': 'foo2', 'response': 'bar2'},
+        ]
+        headers = {
+            'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot),
+        }
+        for i in range(2):
+            response = self.client.put(url, data=data, content_type='application/json', **headers)
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+            self.assertEquals([item['challenge'] for item in response.data], ['foo1', 'foo2'])
+
+        self.assertEquals(list(AcmeChallenge.objects.order_by('challenge').values_list('challenge', 'response')), [
+            ('foo1', 'bar1'),
+            ('foo2', 'bar2'),
+        ])
+
+
+    def test_bulk_add_existing_challenge(self):
+        AcmeChallenge.objects.create(challenge='foo2', response='bar2')
+        url = reverse('acmechallenge-bulk')
+        data = [
+            {'challenge': 'foo1', 'response': 'bar1'},
+            {'challenge': 'foo2', 'response': 'bar2'},
+        ]
+        headers = {
+            'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot),
+        }
+        response = self.client.post(url, data=data, content_type='application/json', **headers)
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(AcmeChallenge.objects.count(), 1)
+
+        data = [
+            {'challenge': 'foo1', 'response': 'bar1'},
+            {'challenge': 'foo1', 'response': 'bar1'},
+        ]
+        response = self.client.post(url, data=data, content_type='application/json', **headers)
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(AcmeChallenge.objects.count(), 1)
+
+
+    def test_server_timing(self):
+        headers = {
+            'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot),
+        }
+        response = self.client.post(reverse('acmechallenge-list'), data={'challenge': 'foo', 'response': 'bar'}, **headers)
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response['Server-Timing'].startswith('app;dur='))
+
+
+    def test_list_challenges_by_domain(self):
+        headers = {
+            'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot),
+        }
+        data = [
+            {'challenge': 'foo1', 'response': 'bar1', 'domain': 'www.example.com'},
+            {'challenge': 'foo2', 'response': 'bar2', 'domain': 'www.example.org'},
+            {'challenge': 'foo3', 'response': 'bar3'},
+        ]
+        response = self.client.post(reverse('acmechallenge-bulk'), data=data, content_type='application/json', **headers)
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals([item['domain'] for item in response.data], ['www.example.com', 'www.example.org', ''])
+
+        headers['HTTP_AUTHORIZATION'] = create_auth_header(username='certbot', key=self.priv_key_certbot)
+        response = self.client.get(reverse('acmechallenge-list'), data={'domain': 'www.example.com'}, **headers)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals([item['challenge'] for item in response.data], ['foo1'])
+
+
+    def test_bulk_remove_challenges(self):
+        matrix = (
+            ('', '', status.HTTP_403_FORBIDDEN),
+            ('joe', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_joe, status.HTTP_403_FORBIDDEN),
+            ('certbot', self.priv_key_certbot, status.HTTP_204_NO_CONTENT),
+        )
+
+        url = reverse('acmechallenge-bulk')
+        AcmeChallenge.objects.create(challenge='keep', response='bar')
+
+        for username, private_key, expected_status in matrix:
+            AcmeChallenge.objects.get_or_create(challenge='foo1', response='bar1')
+            AcmeChallenge.objects.get_or_create(challenge='foo2', response='bar2')
+            headers = {}
+            if username:
+                headers['HTTP_AUTHORIZATION'] = create_auth_header(username=username, key=private_key)
+            data = {'challenges': ['foo1', 'foo2']}
+            response = self.client.delete(url, data=data, content_type='application/json', **headers)
+            self.assertEquals(response.status_code, expected_status)
+
+        self.assertEquals(list(AcmeChallenge.objects.values_list('challenge', flat=True)), ['keep'])
+
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        CERTBOT_DJANGO_CACHE='default')
+    def test_bulk_add_challenges_cached(self):
+        url = reverse('acmechallenge-bulk')
+        data = [
+            {'challenge': 'foo1', 'response': 'bar1'},
+            {'challenge': 'foo2', 'response': 'bar2'},
+        ]
+        headers = {
+            'HTTP_AUTHORIZATION': create_auth_header(username='certbot', key=self.priv_key_certbot),
+        }
+        response = self.client.post(url, data=data, content_type='application/json', **headers)
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+
+        for challenge, expected in (('foo1', b'bar1\n'), ('foo2', b'bar2\n')):
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse('acmechallenge-response', args=(challenge, )))
+            self.assertEquals(response.content, expected)
+
+
+
+class CoordinatorTestCase(TransactionTestCase):
+    """
+    Run the coordinator against the server, forwarding its requests to the test client. Its requests are sent
+    from worker threads, so the test data has to be committed. The certbot user only has the permissions which
+    ``certbot_django_generate_keys`` tells people to grant.
+    """
+    def setUp(self):
+        user = User.objects.create_user(username='certbot', is_staff=True)
+        user.user_permissions.add(Permission.objects.get(codename='add_acmechallenge'))
+        user.user_permissions.add(Permission.objects.get(codename='delete_acmechallenge'))
+        private_key, public_key = generate_key_pair()
+        PublicKey.objects.create(key=public_key, comment='Test Key', user=user)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        with open(os.path.join(self.temp_dir, 'certbot_django_id_rsa_group_shop'), 'w') as keyfile:
+            keyfile.write(private_key)
+
+        from certbot_django.coordinator.authenticator import Authenticator
+        from certbot_django.coordinator.tests.test_authenticator import _make_config
+        config = _make_config(
+            django_username='certbot', django_key_directory=self.temp_dir, django_public_ip_logging_ok=True,
+            django_key_group=['shop=*.example.com'],
+            django_api_url=['*.example.com=http://shop.example.com/.well-known/challenges/'])
+        self.auth = Authenticator(config, name='django')
+
+
+    def _forward(self, request, context):
+        response = self.client.generic(
+            request.method, urlsplit(request.url).path, data=request.body or b'',
+            content_type=request.headers.get('Content-Type', ''), HTTP_AUTHORIZATION=request.headers['Authorization'])
+        context.status_code = response.status_code
+        return response.content
+
+
+
+@override_settings(ROOT_URLCONF='certbot_django.server.tests.legacy_urls')
+class TestCoordinatorWithLegacyServer(CoordinatorTestCase):
+    def test_fall_back_to_post(self):
+        from certbot_django.coordinator.tests.test_authenticator import _make_achall
+        domains = ['shop.example.com', 'www.shop.example.com']
+        achalls = [_make_achall(domain, (domain * 4).encode()[:32]) for domain in domains]
+        with requests_mock.mock() as m:
+            m.register_uri(requests_mock.ANY, re.compile(r'^http://shop\.example\.com/'), content=self._forward)
+            self.auth.perform(achalls)
+            # Upserting needs the change permission, and the bulk endpoint doesn't exist
+            self.assertEqual([(r.method, urlsplit(r.url).path) for r in m.request_history], [
+                ('PUT', '/.well-known/challenges/bulk/'),
+                ('POST', '/.well-known/challenges/bulk/'),
+                ('POST', '/.well-known/challenges/'),
+                ('POST', '/.well-known/challenges/'),
+            ])
+            self.assertEqual(AcmeChallenge.objects.count(), 2)
+
+            self.auth.cleanup(achalls)
+            self.assertFalse(AcmeChallenge.objects.exists())
@@ -4,10 +4,11 @@ from . import views
 
 
 router = DefaultRouter()
-router.register(r'challenges', views.AcmeChallengeViewSet)
+router.register(r'challenges', views.AcmeChallengeViewSet, 'acmechallenge')
 
 
 urlpatterns = [
     url(r'^acme-challenge/(?P<acme_data>.+)$', views.detail, name='acmechallenge-response'),
+    url(r'^challenges-metrics/$', views.serve_metrics, name='acmechallenge-metrics'),
     url(r'^', include(router.urls)),
 ]
@@ -1,19 +1,191 @@
-from django.shortcuts import get_object_or_404, render
-from rest_framework import viewsets, permissions
-from .models import AcmeChallenge
-from .serializers import AcmeChallengeSerializer
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .authentication import JWTAuthentication
+from .models import normalize_domain
+from .permissions import AcmeChallengePermissions
+from .serializers import AcmeChallengeSerializer, AcmeChallengeBulkSerializer, AcmeChallengeBulkDeleteSerializer
+from .stores import get_store, ChallengeExists, CONTENT_TYPE
+from . import index, metrics
+import time
 
 
-class AcmeChallengeViewSet(viewsets.ModelViewSet):
-    queryset = AcmeChallenge.objects.all()
-    serializer_class = AcmeChallengeSerializer
+class AcmeChallengeViewSet(viewsets.ViewSet):
+    """
+    Create, view, and delete challenges in the configured :class:`ChallengeStore <certbot_django.server.stores.ChallengeStore>`.
+    """
     lookup_field = 'challenge'
-    permission_classes = (permissions.IsAdminUser, permissions.DjangoModelPermissions)
+    authentication_classes = (JWTAuthentication, ) + tuple(api_settings.DEFAULT_AUTHENTICATION_CLASSES)
+    permission_classes = (permissions.IsAdminUser, AcmeChallengePermissions)
+
+
+    def initial(self, request, *args, **kwargs):
+        self._started = time.perf_counter()
+        super(AcmeChallengeViewSet, self).initial(request, *args, **kwargs)
+
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """
+        Report how long the server spent handling the request, including authentication and permission checks,
+        in a ``Server-Timing`` header. The coordinator uses it to tell server time apart from network time.
+        """
+        response = super(AcmeChallengeViewSet, self).finalize_response(request, response, *args, **kwargs)
+        started = getattr(self, '_started', None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            response['Server-Timing'] = 'app;dur={:.3f}'.format(elapsed * 1000)
+            metrics.observe_api(self.action or 'unknown', request.method, response.status_code, elapsed)
+        return response
+
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs['context'] = {'request': self.request}
+        return AcmeChallengeSerializer(*args, **kwargs)
+
+
+    def get_object(self, challenge):
+        obj = get_store().get(challenge)
+        if obj is None:
+            raise Http404('No ACME Challenge matches the given query.')
+        return obj
+
+
+    def list(self, request):
+        """
+        List challenges. Pass ``?domain=example.com`` to list only the challenges scoped to one domain.
+        """
+        domain = request.query_params.get('domain')
+        return Response(self.get_serializer(get_store().list(domain=domain), many=True).data)
+
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        challenges = self._create([serializer.validated_data])
+        return Response(self.get_serializer(challenges[0]).data, status=status.HTTP_201_CREATED)
+
+
+    def retrieve(self, request, challenge=None):
+        return Response(self.get_serializer(self.get_object(challenge)).data)
+
+
+    def update(self, request, challenge=None):
+        """
+        Create the challenge, or replace it if it already exists. Unlike POST, retrying a PUT is always safe.
+        """
+        data = request.data
+        if isinstance(data, dict):
+            data = data.copy()
+            data['challenge'] = challenge
+        # Anything else is rejected by the serializer
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        challenges = self._upsert([serializer.validated_data])
+        return Response(self.get_serializer(challenges[0]).data)
+
+
+    def partial_update(self, request, challenge=None):
+        instance = self.get_object(challenge)
+        serializer = self.get_serializer(instance, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        response = serializer.validated_data.get('response', instance.response)
+        obj = get_store().update(challenge, response)
+        return Response(self.get_serializer(obj).data)
+
+
+    def destroy(self, request, challenge=None):
+        if not get_store().delete([challenge]):
+            raise Http404('No ACME Challenge matches the given query.')
+        metrics.count_deleted(1)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+    @action(detail=False, methods=['post', 'put', 'delete'])
+    def bulk(self, request):
+        """
+        Create (POST a list of challenge / response objects), create or replace (PUT a list of challenge /
+        response objects), or delete (DELETE a list of challenge tokens) many challenges in a single request.
+        """
+        if request.method == 'DELETE':
+            return self._bulk_destroy(request)
+        return self._bulk_create(request, upsert=request.method == 'PUT')
+
+
+    def _create(self, items):
+        try:
+            challenges = get_store().create([(item['challenge'], item['response'], item['domain']) for item in items])
+        except ChallengeExists as e:
+            raise ValidationError({'challenge': [str(e)]})
+        metrics.count_created(len(challenges))
+        return challenges
+
+
+    def _upsert(self, items):
+        challenges = get_store().upsert([(item['challenge'], item['response'], item['domain']) for item in items])
+        metrics.count_created(len(challenges))
+        return challenges
+
+
+    def _bulk_create(self, request, upsert=False):
+        serializer = AcmeChallengeBulkSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        tokens = [item['challenge'] for item in serializer.validated_data]
+        if len(set(tokens)) != len(tokens):
+            raise ValidationError({'challenge': ['Challenges in a bulk request must be unique.']})
+
+        if upsert:
+            challenges = self._upsert(serializer.validated_data)
+            return Response(self.get_serializer(challenges, many=True).data)
+        challenges = self._create(serializer.validated_data)
+        return Response(self.get_serializer(challenges, many=True).data, status=status.HTTP_201_CREATED)
+
+
+    def _bulk_destroy(self, request):
+        serializer = AcmeChallengeBulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tokens = serializer.validated_data['challenges']
+        metrics.count_deleted(get_store().delete(tokens))
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 def detail(request, acme_data):
-    acme_challenge = get_object_or_404(AcmeChallenge, challenge=acme_data)
-    context = {
-        'response': acme_challenge.response
-    }
-    return render(request, 'certbot_django/detail.html', context)
+    """
+    Serve a challenge response as plain text. Challenges scoped to a domain are only served for requests to that host.
+    """
+    start = time.perf_counter()
+    body = index.get_body(acme_data, normalize_domain(request.get_host()))
+    metrics.observe_validation(metrics.SOURCE_VIEW, body is not None, time.perf_counter() - start)
+    if body is None:
+        raise Http404('No ACME Challenge matches the given query.')
+    return _body_response(body)
+
+
+def _body_response(body):
+    response = HttpResponse(body, content_type=CONTENT_TYPE)
+    response['Content-Length'] = str(len(body))
+    return response
+
+
+def serve_metrics(request):
+    """
+    Serve challenge metrics in the Prometheus text format, if ``CERTBOT_DJANGO_METRICS`` is enabled. Requests
+    must either send ``Authorization: Bearer <CERTBOT_DJANGO_METRICS_TOKEN>``, or, if no token is configured,
+    come from a staff user.
+    """
+    if not metrics.is_enabled():
+        raise Http404('Metrics are disabled.')
+    token = getattr(settings, 'CERTBOT_DJANGO_METRICS_TOKEN', None)
+    if token:
+        allowed = constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer {}'.format(token))
+    else:
+        user = getattr(request, 'user', None)
+        allowed = bool(user and user.is_authenticated and user.is_staff)
+    if not allowed:
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)